@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Admission Control for AgroBot
+-----------------------------
+Decides, before any work is done, whether an /api/* request is served:
+
+- per-client rate limits: every client (IP address) gets one token bucket per
+  endpoint class, refilled at ADMISSION_RATE tokens per second up to
+  ADMISSION_BURST. A request costs its class weight, so a client can make ten
+  weather lookups for every photo analysis. Over the limit -> 429.
+- a global concurrency limit: at most ADMISSION_MAX_CONCURRENT admitted
+  requests run at once. While an upstream's recent latency is above
+  ADMISSION_SLOW_FRACTION of its deadline, requests that need it are only
+  admitted while fewer than ADMISSION_SLOW_CONCURRENT requests are running,
+  so they are turned away with 503 early instead of queueing behind a slow
+  provider. Requests that do not need it are not affected.
+
+Both servers call admission.admit() before routing the request to its handler
+and admission.release() when the response is finished.
+"""
+
+import math
+import os
+import threading
+
+from cache_utils import LRUCache
+from metrics import Counter, metrics_registry
+from rate_limit import TokenBucket
+from resilience import upstream
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1") != "0"
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", 10))              # tokens per second per client and class
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", 30))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 64))
+ADMISSION_SLOW_CONCURRENT = int(os.getenv("ADMISSION_SLOW_CONCURRENT", 16))
+# An upstream is slow once its recent latency is above this share of its deadline
+ADMISSION_SLOW_FRACTION = float(os.getenv("ADMISSION_SLOW_FRACTION", 0.5))
+ADMISSION_SHED_RETRY_AFTER = int(os.getenv("ADMISSION_SHED_RETRY_AFTER", 5))  # seconds
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", 100000))
+# Use the first X-Forwarded-For address as the client (only behind a proxy that sets it)
+ADMISSION_TRUST_PROXY = os.getenv("ADMISSION_TRUST_PROXY", "0") != "0"
+
+# Endpoint class -> (tokens per request, upstreams its requests wait on)
+ENDPOINT_CLASSES = {
+    "vision": (10, ("gemini",)),
+    "voice": (10, ("groq", "gemini", "translate", "gtts")),
+    "stt": (5, ("groq",)),
+    "chat": (4, ("gemini",)),
+    "tts": (2, ("translate", "gtts")),
+    "weather": (1, ("openweather",)),
+    "weather_bulk": (10, ()),                # up to WEATHER_BULK_MAX farms from the prefetched store
+    "light": (0.5, ()),
+}
+# Path -> endpoint class, first match wins; a path matches itself and everything below it,
+# a path ending in "/" only what is below it. /api/metrics is not listed and never limited.
+_ROUTES = (
+    ("/api/analyze-image/jobs/", "light"),  # polling a job
+    ("/api/analyze-image", "vision"),
+    ("/api/voice", "voice"),
+    ("/api/transcribe", "stt"),
+    ("/api/chat", "chat"),
+    ("/api/tts", "tts"),
+    ("/api/weather/bulk", "weather_bulk"),
+    ("/api/weather", "weather"),
+    ("/api/farms", "weather"),
+    ("/api/audio", "light"),
+    ("/api/health", "light"),
+)
+
+ADMISSION_REJECTED = Counter("agrobot_admission_rejected_total",
+                             "Requests turned away before any work: rate_limited (429) or shed (503).",
+                             ("endpoint_class", "reason"))
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; status is 429 (client over its rate) or 503 (load shed)."""
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def endpoint_class(path: str) -> str | None:
+    for prefix, name in _ROUTES:
+        if path.startswith(prefix) if prefix.endswith("/") else (path == prefix or path.startswith(prefix + "/")):
+            return name
+    return None
+
+
+def client_id(remote_addr: str | None, forwarded_for: str | None = None) -> str:
+    if ADMISSION_TRUST_PROXY and forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+class AdmissionController:
+    """Per-client token buckets plus a global in-flight limit that tightens while upstreams are slow."""
+
+    def __init__(self, rate: float = ADMISSION_RATE, burst: float = ADMISSION_BURST,
+                 max_concurrent: int = ADMISSION_MAX_CONCURRENT, slow_concurrent: int = ADMISSION_SLOW_CONCURRENT,
+                 max_clients: int = ADMISSION_MAX_CLIENTS):
+        if rate <= 0 or burst <= 0:
+            # A bucket that never refills has no finite Retry-After; use ADMISSION_CONTROL=0 instead
+            raise ValueError("ADMISSION_RATE and ADMISSION_BURST must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.slow_concurrent = slow_concurrent
+        # (client, endpoint class) -> TokenBucket; an idle bucket refills completely, so it can be dropped
+        self._buckets = LRUCache(max_items=max_clients, ttl=burst / rate)
+        self._buckets_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def _bucket(self, key) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+            # Re-setting refreshes the TTL, which counts from the last request
+            self._buckets.set(key, bucket)
+            return bucket
+
+    def slow_upstreams(self, names) -> list:
+        return [name for name in names
+                if upstream(name).recent_latency() > ADMISSION_SLOW_FRACTION * upstream(name).timeout]
+
+    def admit(self, client: str, path: str) -> bool:
+        """
+        Admit a request or raise AdmissionRejected. Returns True when the request
+        was counted as in flight and admission.release() must be called for it.
+        """
+        name = endpoint_class(path)
+        if not ADMISSION_ENABLED or name is None:
+            return False
+        weight, upstreams = ENDPOINT_CLASSES[name]
+
+        bucket = self._bucket((client, name))
+        cost = min(weight, self.burst)
+        if not bucket.try_acquire(cost):
+            ADMISSION_REJECTED.inc(endpoint_class=name, reason="rate_limited")
+            raise AdmissionRejected("Too many requests, please slow down", 429, bucket.wait_time(cost))
+
+        limit = self.slow_concurrent if self.slow_upstreams(upstreams) else self.max_concurrent
+        with self._lock:
+            if self.in_flight < limit:
+                self.in_flight += 1
+                return True
+        ADMISSION_REJECTED.inc(endpoint_class=name, reason="shed")
+        raise AdmissionRejected("Server is busy, please retry shortly", 503, ADMISSION_SHED_RETRY_AFTER)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "tracked_buckets": len(self._buckets)}
+
+
+admission = AdmissionController()
+
+
+def _collect_admission():
+    stats = admission.stats()
+    return [
+        ("agrobot_admission_in_flight", "gauge", "Admitted requests currently being served.",
+         [({}, stats["in_flight"])]),
+        ("agrobot_admission_buckets", "gauge", "Per-client rate-limit buckets being tracked.",
+         [({}, stats["tracked_buckets"])]),
+    ]
+
+
+metrics_registry.register_collector(_collect_admission)
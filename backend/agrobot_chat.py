@@ -1,16 +1,21 @@
 # agrobot_chat.py
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+import time
 
-load_dotenv()
+from faq_cache import faq_cache
+from knowledge_base import knowledge_base
+from metrics import Counter, Histogram, observe_stage, stage_timer, timed
+from providers import GEMINI_MODEL, get_gemini, registry
+from resilience import UPSTREAM_TIMEOUTS, UpstreamUnavailable, note_degraded, upstream
+from session_store import history_chars, record_prompt_tokens, sessions
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# The Gemini model is created on first use; each request gets a chat seeded
+# from its own session history (recent turns plus a rolling summary, see session_store)
 
-# Create chat model
-model = genai.GenerativeModel("gemini-2.5-flash")
-chat = model.start_chat(history=[])
+gemini = upstream("gemini")
+_REQUEST_OPTIONS = {"timeout": UPSTREAM_TIMEOUTS["gemini"]}
+
+BUSY_REPLY = ("I cannot reach the farming assistant right now. Please try again in a minute, "
+              "or ask about a specific crop and pest so I can share a quick tip.")
 
 system_prompt = """
 You are a friendly AI farming assistant who talks with farmers in a simple and natural way.
@@ -27,28 +32,215 @@ or related topics. If the question is not about farming, politely say that you o
 Remember: Your response must be in ENGLISH. The translation to other languages will happen separately.
 """
 
+CHAT_TOKENS = Counter("agrobot_chat_tokens_total",
+                      "Gemini tokens used by chat calls, by kind (prompt or output).", ("kind",))
+CHAT_PROMPT_TOKENS = Histogram("agrobot_chat_prompt_tokens",
+                               "Prompt tokens per chat call (system instruction, summary, history and question).",
+                               buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000))
 
 
+def _chat_model():
+    # The system prompt travels once per request as the system instruction,
+    # instead of being repeated inside every user turn of the history
+    return get_gemini().GenerativeModel(GEMINI_MODEL, system_instruction=system_prompt)
 
 
-def get_agro_response(user_input: str, weather_context: str | None = None) -> str:
-    """
-    Takes user query as input, returns agriculture advice text.
-    """
-    enriched_prompt = system_prompt
+registry.register("gemini_model", _chat_model)
+
+
+def get_gemini_model():
+    """Shared GenerativeModel used for chat."""
+    return registry.get("gemini_model")
+
+
+def _build_prompt(user_input: str, weather_context: str | None = None, kb_notes: str | None = None) -> str:
+    """This turn's message: reference notes and field context for this question only, then the question."""
+    enriched_prompt = ""
+
+    if kb_notes:
+        enriched_prompt += (
+            "Reference notes from the AgroBot crop guide. Base your answer on them when they fit "
+            "the question and ignore them when they do not:\n"
+            f"{kb_notes}\n\n"
+        )
 
     if weather_context:
         enriched_prompt += (
-            "\nYou also have the latest field context below. Use it to tailor your response:\n"
+            "Latest field context. Use it to tailor your response:\n"
             f"{weather_context}\n"
-            "Mention any actionable steps that match these conditions."
+            "Mention any actionable steps that match these conditions.\n\n"
         )
 
-    prompt = f"{enriched_prompt}\n\nUser question: {user_input}"
+    if not enriched_prompt:
+        return user_input
+    return f"{enriched_prompt}User question: {user_input}"
+
+
+def _record_usage(response, history: list, prompt: str):
+    """Count the tokens Gemini reports for one chat call and recalibrate the session token estimate."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0)
+    if not prompt_tokens:
+        return
+    CHAT_TOKENS.inc(prompt_tokens, kind="prompt")
+    CHAT_TOKENS.inc(getattr(usage, "candidates_token_count", 0), kind="output")
+    CHAT_PROMPT_TOKENS.observe(prompt_tokens)
+    record_prompt_tokens(len(system_prompt) + history_chars(history) + len(prompt), prompt_tokens)
+
+
+def _instant_answer(user_input: str, weather_context: str | None, session_id: str | None, history: list):
+    """
+    Answer from the crop knowledge base or the FAQ cache without calling Gemini.
+    Returns (answer, knowledge base notes for the prompt); the turn is still
+    recorded in the session when answered here.
+    """
+    answer, kb_notes = knowledge_base.lookup(user_input, has_history=bool(history))
+    if answer is not None:
+        print(f"[CHAT] Knowledge base answer: {user_input[:50]}")
+    else:
+        answer = faq_cache.lookup(user_input, weather_context, has_history=bool(history))
+        if answer is not None:
+            print(f"[CHAT] FAQ cache hit: {user_input[:50]}")
+    if answer is not None:
+        sessions.append_turn(session_id, user_input, answer)
+    return answer, kb_notes
+
+
+def _degraded_answer(user_input: str, exc: Exception) -> str:
+    """Best crop-guide note for the question (or a short busy message) while Gemini is unavailable."""
+    print(f"[CHAT] Gemini unavailable ({exc}), answering from the crop guide")
+    note_degraded("chat")
+    return knowledge_base.best_answer(user_input) or BUSY_REPLY
+
+
+@timed("get_agro_response")
+def get_agro_response(user_input: str, weather_context: str | None = None, session_id: str | None = None) -> str:
+    """
+    Takes user query as input, returns agriculture advice text.
+    Conversation history is kept per session_id; without one the request is stateless.
+    """
+    if not user_input.strip():
+        return "Please enter a valid question."
+
+    history = sessions.get_history(session_id)
+    answer, kb_notes = _instant_answer(user_input, weather_context, session_id, history)
+    if answer is not None:
+        return answer
+
+    prompt = _build_prompt(user_input, weather_context, kb_notes)
+    chat = get_gemini_model().start_chat(history=history)
+    try:
+        with stage_timer("chat_model"):
+            response = gemini.call(chat.send_message, prompt, request_options=_REQUEST_OPTIONS)
+    except UpstreamUnavailable as exc:
+        return _degraded_answer(user_input, exc)
+    _record_usage(response, history, prompt)
+    text = response.text.strip()
+    sessions.append_turn(session_id, user_input, text)
+    faq_cache.store(user_input, weather_context, text, has_history=bool(history))
+    return text
+
 
+def stream_agro_response(user_input: str, weather_context: str | None = None, session_id: str | None = None):
+    """
+    Same as get_agro_response, but yields text chunks as Gemini produces them.
+    """
+    if not user_input.strip():
+        yield "Please enter a valid question."
+        return
+
+    history = sessions.get_history(session_id)
+    answer, kb_notes = _instant_answer(user_input, weather_context, session_id, history)
+    if answer is not None:
+        yield answer
+        return
+
+    prompt = _build_prompt(user_input, weather_context, kb_notes)
+    chat = get_gemini_model().start_chat(history=history)
+    start = time.perf_counter()
+    chunks = []
+    try:
+        with stage_timer("chat_model"), gemini.guard():
+            response = chat.send_message(prompt, stream=True, request_options=_REQUEST_OPTIONS)
+            for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    if not chunks:
+                        observe_stage("chat_first_chunk", time.perf_counter() - start)
+                    chunks.append(text)
+                    yield text
+    except UpstreamUnavailable as exc:
+        # Only raised before the first chunk (circuit open), so nothing has been sent yet
+        yield _degraded_answer(user_input, exc)
+        return
+    _record_usage(response, history, prompt)
+    text = "".join(chunks).strip()
+    sessions.append_turn(session_id, user_input, text)
+    faq_cache.store(user_input, weather_context, text, has_history=bool(history))
+
+
+@timed("get_agro_response")
+async def get_agro_response_async(user_input: str, weather_context: str | None = None,
+                                  session_id: str | None = None) -> str:
+    """
+    Async variant of get_agro_response for the ASGI server.
+    """
     if not user_input.strip():
         return "Please enter a valid question."
 
-    
-    response = chat.send_message(prompt)
-    return response.text.strip()
+    history = sessions.get_history(session_id)
+    answer, kb_notes = _instant_answer(user_input, weather_context, session_id, history)
+    if answer is not None:
+        return answer
+
+    prompt = _build_prompt(user_input, weather_context, kb_notes)
+    chat = get_gemini_model().start_chat(history=history)
+    try:
+        with stage_timer("chat_model"):
+            response = await gemini.call_async(chat.send_message_async, prompt,
+                                               request_options=_REQUEST_OPTIONS)
+    except UpstreamUnavailable as exc:
+        return _degraded_answer(user_input, exc)
+    _record_usage(response, history, prompt)
+    text = response.text.strip()
+    sessions.append_turn(session_id, user_input, text)
+    faq_cache.store(user_input, weather_context, text, has_history=bool(history))
+    return text
+
+
+async def stream_agro_response_async(user_input: str, weather_context: str | None = None,
+                                     session_id: str | None = None):
+    """
+    Async variant of stream_agro_response for the ASGI server.
+    """
+    if not user_input.strip():
+        yield "Please enter a valid question."
+        return
+
+    history = sessions.get_history(session_id)
+    answer, kb_notes = _instant_answer(user_input, weather_context, session_id, history)
+    if answer is not None:
+        yield answer
+        return
+
+    prompt = _build_prompt(user_input, weather_context, kb_notes)
+    chat = get_gemini_model().start_chat(history=history)
+    start = time.perf_counter()
+    chunks = []
+    try:
+        with stage_timer("chat_model"), gemini.guard():
+            response = await chat.send_message_async(prompt, stream=True, request_options=_REQUEST_OPTIONS)
+            async for chunk in response:
+                text = getattr(chunk, "text", "")
+                if text:
+                    if not chunks:
+                        observe_stage("chat_first_chunk", time.perf_counter() - start)
+                    chunks.append(text)
+                    yield text
+    except UpstreamUnavailable as exc:
+        yield _degraded_answer(user_input, exc)
+        return
+    _record_usage(response, history, prompt)
+    text = "".join(chunks).strip()
+    sessions.append_turn(session_id, user_input, text)
+    faq_cache.store(user_input, weather_context, text, has_history=bool(history))
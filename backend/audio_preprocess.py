@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Audio Preprocessing for AgroBot STT
+-----------------------------------
+Shrinks browser recordings before they are uploaded to Groq Whisper:
+decode in memory, downmix to mono, resample to 16 kHz, trim leading and
+trailing silence with a vectorized energy VAD, and re-encode compactly
+(16 kHz mono Opus, or FLAC where no Opus encoder is available).
+Long recordings are split at pauses into overlapping chunks that can be
+transcribed in parallel.
+
+PyAV and NumPy are optional; without them recordings are uploaded unchanged.
+"""
+
+from io import BytesIO
+import os
+
+# Imported on first use (see _load_codecs) to keep server startup fast
+av = None
+np = None
+
+TARGET_RATE = 16000                     # what Whisper resamples to anyway
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DB = float(os.getenv("STT_VAD_THRESHOLD_DB", 40))  # below peak
+VAD_FLOOR_DB = -55.0                    # never treat quieter frames as speech
+VAD_PADDING_MS = 250                    # keep a little air around the speech
+AUDIO_PREPROCESS_ENABLED = os.getenv("STT_PREPROCESS", "1") != "0"
+STT_UPLOAD_CODEC = os.getenv("STT_UPLOAD_CODEC", "opus")             # "opus" or "flac"
+STT_OPUS_BITRATE = int(os.getenv("STT_OPUS_BITRATE", 24000))        # plenty for speech
+# Long recordings are split at pauses into chunks of at most this length
+STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS", 30))
+STT_CHUNK_OVERLAP_SECONDS = float(os.getenv("STT_CHUNK_OVERLAP_SECONDS", 1.0))
+
+
+class AudioPreprocessError(Exception):
+    """Raised when a recording cannot be decoded."""
+
+
+def _load_codecs() -> bool:
+    """Import PyAV and NumPy on first use; False if either is not installed."""
+    global av, np
+    if av is None:
+        try:
+            import av as _av
+            import numpy as _np
+        except ImportError:
+            return False
+        np, av = _np, _av
+    return True
+
+
+def decode_audio(audio_bytes: bytes):
+    """Decode any container/codec PyAV understands into 16 kHz mono float32 samples."""
+    try:
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=TARGET_RATE)
+        chunks = []
+        with av.open(BytesIO(audio_bytes)) as container:
+            for frame in container.decode(audio=0):
+                for out in resampler.resample(frame):
+                    chunks.append(out.to_ndarray().reshape(-1))
+            for out in resampler.resample(None):
+                chunks.append(out.to_ndarray().reshape(-1))
+    except (av.FFmpegError, ValueError, IndexError) as exc:
+        raise AudioPreprocessError(f"Could not decode audio: {exc}") from exc
+
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+def frame_levels_db(samples, rate: int = TARGET_RATE):
+    """RMS level of each VAD frame in dBFS (one vectorized pass)."""
+    frame_len = rate * VAD_FRAME_MS // 1000
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len
+    frames = samples[: n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(rms + 1e-10), frame_len
+
+
+def voiced_mask(levels_db):
+    """Frames loud enough (relative to the loudest frame) to contain speech."""
+    if len(levels_db) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = max(float(levels_db.max()) - VAD_THRESHOLD_DB, VAD_FLOOR_DB)
+    return levels_db > threshold
+
+
+def trim_silence(samples, rate: int = TARGET_RATE):
+    """Cut leading/trailing silence; returns an empty array if nothing is voiced."""
+    levels, frame_len = frame_levels_db(samples, rate)
+    voiced = np.flatnonzero(voiced_mask(levels))
+    if len(voiced) == 0:
+        return samples[:0]
+
+    pad = rate * VAD_PADDING_MS // 1000
+    start = max(voiced[0] * frame_len - pad, 0)
+    end = min((voiced[-1] + 1) * frame_len + pad, len(samples))
+    return samples[start:end]
+
+
+def split_at_silence(samples, rate: int = TARGET_RATE,
+                     max_seconds: float = STT_CHUNK_SECONDS,
+                     overlap_seconds: float = STT_CHUNK_OVERLAP_SECONDS):
+    """
+    Plan chunk boundaries for a long recording.
+    Each cut is placed at the quietest frame in the last 40% of the allowed
+    chunk length, and every chunk after the first starts `overlap_seconds`
+    before its cut so a word clipped at the boundary is heard in full once.
+    Returns a list of (start, end) sample indices.
+    """
+    max_len = int(max_seconds * rate)
+    if len(samples) <= max_len:
+        return [(0, len(samples))]
+
+    levels, frame_len = frame_levels_db(samples, rate)
+    overlap = int(overlap_seconds * rate)
+    ranges = []
+    cursor = 0
+    while len(samples) - cursor > max_len:
+        window_start = (cursor + int(max_len * 0.6)) // frame_len
+        window_end = (cursor + max_len) // frame_len
+        quietest = window_start + int(np.argmin(levels[window_start:window_end]))
+        cut = quietest * frame_len + frame_len // 2
+        ranges.append((max(cursor - overlap, 0) if ranges else cursor, cut))
+        cursor = cut
+    ranges.append((max(cursor - overlap, 0), len(samples)))
+    return ranges
+
+
+def _encode(samples, container_format: str, codec: str, rate: int, bit_rate: int | None = None) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).reshape(1, -1)
+    buffer = BytesIO()
+    with av.open(buffer, mode="w", format=container_format) as container:
+        stream = container.add_stream(codec, rate=rate)
+        stream.layout = "mono"
+        if bit_rate:
+            stream.bit_rate = bit_rate
+        frame = av.AudioFrame.from_ndarray(pcm, format="s16", layout="mono")
+        frame.sample_rate = rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def encode_flac(samples, rate: int = TARGET_RATE) -> bytes:
+    """Losslessly encode mono float32 samples as 16-bit FLAC."""
+    return _encode(samples, "flac", "flac", rate)
+
+
+def encode_compact(samples, rate: int = TARGET_RATE):
+    """
+    Encode for upload; returns (bytes, filename).
+    Opus at speech bitrates is several times smaller than FLAC and Whisper
+    handles it without accuracy loss; FLAC is the fallback.
+    """
+    if STT_UPLOAD_CODEC == "opus":
+        try:
+            return _encode(samples, "ogg", "libopus", rate, STT_OPUS_BITRATE), "audio.ogg"
+        except (av.FFmpegError, ValueError) as exc:
+            print(f"[STT] Opus encoder unavailable ({exc}), using FLAC")
+    return encode_flac(samples, rate), "audio.flac"
+
+
+def preprocess_audio(audio_bytes: bytes, filename: str = "audio.wav"):
+    """
+    Prepare a recording for Whisper.
+    Returns (uploads, info) where uploads is a list of (filename, bytes) in
+    playback order: one entry for short recordings, several overlapping
+    chunks for long ones, and none when the recording is pure silence.
+    Falls back to the original bytes whenever preprocessing is unavailable or fails.
+    """
+    info = {"input_bytes": len(audio_bytes), "preprocessed": False, "chunks": 1}
+    original = [(filename, audio_bytes)]
+    if not (AUDIO_PREPROCESS_ENABLED and _load_codecs()):
+        return original, info
+
+    try:
+        samples = decode_audio(audio_bytes)
+        trimmed = trim_silence(samples)
+        info.update({
+            "input_seconds": round(len(samples) / TARGET_RATE, 2),
+            "speech_seconds": round(len(trimmed) / TARGET_RATE, 2),
+        })
+        if len(trimmed) == 0:
+            info["chunks"] = 0
+            return [], info
+
+        uploads = []
+        for start, end in split_at_silence(trimmed):
+            encoded, encoded_name = encode_compact(trimmed[start:end])
+            uploads.append((encoded_name, encoded))
+    except Exception as exc:
+        print(f"[STT] Preprocessing skipped: {exc}")
+        return original, info
+
+    output_bytes = sum(len(data) for _, data in uploads)
+    if len(uploads) == 1 and output_bytes >= len(audio_bytes):
+        # Already compact and mostly speech; re-encoding would not help
+        return original, info
+
+    info.update({"preprocessed": True, "output_bytes": output_bytes, "chunks": len(uploads)})
+    return uploads, info
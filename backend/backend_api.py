@@ -3,49 +3,91 @@
 AgroBot Flask Backend API
 --------------------------
 RESTful API for React frontend integration
-Endpoints: /chat, /transcribe, /analyze-image, /tts
+Endpoints: /chat, /transcribe, /analyze-image, /tts, /audio, /voice, /weather, /farms, /weather/bulk
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
-from agrobot_chat import get_agro_response
-from tts_engine import text_to_speech
+from agrobot_chat import get_agro_response, stream_agro_response
+from tts_engine import audio_clip, clip_key, text_to_speech, translate_text, stream_speech
+from tts_cache import key_from_path
 from universal_stt import transcribe_audio_groq
-from weather_service import fetch_weather_summary, WeatherServiceError
-import google.generativeai as genai
-from PIL import Image
-import tempfile
+from voice_pipeline import run_voice_pipeline, VoicePipelineError
+from weather_service import (fetch_weather_summary, WeatherServiceError, bulk_weather_summaries,
+                             register_farms, unregister_farm, WEATHER_CACHE_TTL)
+from http_cache import AUDIO_CACHE_CONTROL, audio_url, body_etag, is_audio_key, weather_headers
+from admission import AdmissionRejected, admission, client_id
+from image_jobs import IMAGE_POLL_INTERVAL, QueueFullError, image_jobs
+from log_utils import safe_print
+from metrics import CONTENT_TYPE, IN_FLIGHT, observe_request, render_metrics
+from providers import registry, warm_up_if_configured
+from resilience import UpstreamUnavailable, upstream, upstream_status
+import math
 import os
-from dotenv import load_dotenv
+import time
 import base64
-from io import BytesIO
+import json
+from urllib.parse import quote
 
-# Load environment variables
-load_dotenv()
+app = Flask(__name__)
+CORS(app, expose_headers=["X-Translated-Text", "X-Language", "X-Audio-Url", "Retry-After"])  # Enable CORS for React frontend
+
+# Upstream SDKs load on first use (see providers.py); AGROBOT_WARMUP=1 preloads them
+warm_up_if_configured()
+
+
+# -------------------------------------------------------
+# 📊 REQUEST METRICS
+# -------------------------------------------------------
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+@app.after_request
+def _record_request(response):
+    # Streaming responses are timed until their headers are ready; stages cover the body
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(endpoint, request.method, response.status_code, time.perf_counter() - g.request_started)
+    return response
 
-# Helper function for safe printing on Windows console
-def safe_print(message):
-    """Print message safely, handling Unicode encoding errors on Windows"""
+
+@app.teardown_request
+def _end_request(exc):
+    if g.get("admitted"):
+        admission.release()
+    if "request_started" in g:
+        IN_FLIGHT.dec()
+
+
+# -------------------------------------------------------
+# 🚦 ADMISSION CONTROL
+# -------------------------------------------------------
+@app.before_request
+def _admit_request():
+    """Per-client rate limits and load shedding (see admission.py), before any work is done."""
+    if request.method == 'OPTIONS':
+        return None
     try:
-        print(message)
-    except UnicodeEncodeError:
-        # Fallback: print ASCII-safe version
-        safe_message = message.encode('ascii', errors='ignore').decode('ascii')
-        if safe_message.strip():
-            print(safe_message)
-        else:
-            print("[Output contains non-ASCII characters]")
+        g.admitted = admission.admit(client_id(request.remote_addr, request.headers.get('X-Forwarded-For')),
+                                     request.path)
+    except AdmissionRejected as exc:
+        response = jsonify({"error": str(exc), "retry_after": exc.retry_after})
+        response.status_code = exc.status
+        response.headers['Retry-After'] = str(exc.retry_after)
+        return response
+    return None
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
 
-# Configure Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+def _unavailable(exc: UpstreamUnavailable, **extra):
+    """503 for a request whose upstream timed out or has its circuit open."""
+    response = jsonify({"error": str(exc), "degraded": True, **extra})
+    response.status_code = 503
+    if exc.retry_after:
+        response.headers['Retry-After'] = str(math.ceil(exc.retry_after))
+    return response
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
 
 # -------------------------------------------------------
 # 💬 CHAT ENDPOINT
@@ -54,7 +96,7 @@ if GOOGLE_API_KEY:
 def chat():
     """
     Text-based farming query endpoint
-    Body: {"message": "farming question"}
+    Body: {"message": "farming question", "sessionId": "optional client session id"}
     Returns: {"response": "AI response"}
     """
     try:
@@ -65,7 +107,8 @@ def chat():
             return jsonify({"error": "Message is required"}), 400
         
         weather_context = data.get('weatherContext')
-        response = get_agro_response(user_message, weather_context=weather_context)
+        session_id = data.get('sessionId')
+        response = get_agro_response(user_message, weather_context=weather_context, session_id=session_id)
         
         # Debug: Check what language the AI is responding in
         safe_print(f"[CHAT] User message: {user_message[:50]}...")
@@ -76,6 +119,47 @@ def chat():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat using Server-Sent Events
+    Body: same as /api/chat
+    Emits: "delta" events {"text": "next chunk"} while Gemini writes,
+           then one "done" event {"response": "full text"} (or "error" {"error": "..."})
+    """
+    data = request.get_json(silent=True) or {}
+    user_message = (data.get('message') or '').strip()
+
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+
+    weather_context = data.get('weatherContext')
+    session_id = data.get('sessionId')
+
+    def generate():
+        chunks = []
+        try:
+            for chunk in stream_agro_response(user_message, weather_context=weather_context, session_id=session_id):
+                chunks.append(chunk)
+                yield _sse("delta", {"text": chunk})
+            response = "".join(chunks).strip()
+            safe_print(f"[CHAT] Streamed response (first 100 chars): {response[:100]}...")
+            yield _sse("done", {"response": response})
+        except Exception as exc:
+            safe_print(f"[CHAT ERROR] Streaming failed: {str(exc)}")
+            yield _sse("error", {"error": str(exc)})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # keep reverse proxies from buffering events
+    return response
+
+
 # -------------------------------------------------------
 # 🌦 WEATHER SNAPSHOT ENDPOINT
 # -------------------------------------------------------
@@ -86,6 +170,8 @@ def weather():
     Query params:
       - lat & lon (preferred)
       - or city (fallback)
+    Carries ETag / Last-Modified and a max-age of what is left of the server cache TTL,
+    so a repeat fetch with If-None-Match is answered 304.
     """
     try:
         lat = request.args.get('lat')
@@ -97,16 +183,65 @@ def weather():
 
         summary = fetch_weather_summary(lat=lat, lon=lon, city=city)
         safe_print(f"[WEATHER] Context ready for {summary['details']['location']}")
-        return jsonify(summary)
+        response = jsonify(summary)
+        response.headers.update(weather_headers(summary, WEATHER_CACHE_TTL, body_etag(response.get_data())))
+        return response.make_conditional(request)
 
     except WeatherServiceError as exc:
         safe_print(f"[WEATHER ERROR] {str(exc)}")
         return jsonify({"error": str(exc)}), 400
+    except UpstreamUnavailable as exc:
+        safe_print(f"[WEATHER ERROR] {str(exc)}")
+        return _unavailable(exc)
     except Exception as exc:
         safe_print(f"[WEATHER ERROR] Unexpected failure: {str(exc)}")
         return jsonify({"error": "Failed to fetch weather data"}), 500
 
 
+# -------------------------------------------------------
+# 🚜 FARM REGISTRY & BULK WEATHER
+# -------------------------------------------------------
+@app.route('/api/farms', methods=['POST'])
+def farms_register():
+    """
+    Register farms whose weather is refreshed in the background.
+    Body: {"farms": [{"id": "farm-1", "lat": 17.4, "lon": 78.5}, {"id": "farm-2", "city": "Guntur"}]}
+    """
+    data = request.get_json(silent=True) or {}
+    farms = data.get('farms')
+    if not isinstance(farms, list) or not farms:
+        return jsonify({"error": "Provide a non-empty 'farms' list"}), 400
+
+    result = register_farms(farms)
+    safe_print(f"[FARMS] Registered {result['registered']} farm(s), {len(result['errors'])} rejected")
+    return jsonify(result), 200 if result['registered'] else 400
+
+
+@app.route('/api/farms/<farm_id>', methods=['DELETE'])
+def farms_unregister(farm_id):
+    if not unregister_farm(farm_id):
+        return jsonify({"error": "Unknown farm"}), 404
+    return jsonify({"removed": farm_id})
+
+
+@app.route('/api/weather/bulk', methods=['POST'])
+def weather_bulk():
+    """
+    Weather summaries for many registered farms in one call, from the prefetched store.
+    Body: {"farms": ["farm-1", "farm-2", ...]}
+    Farms not fetched yet come back as {"status": "pending"}; poll again shortly.
+    """
+    data = request.get_json(silent=True) or {}
+    farm_ids = data.get('farms')
+    if not isinstance(farm_ids, list) or not farm_ids:
+        return jsonify({"error": "Provide a non-empty 'farms' list of farm ids"}), 400
+
+    try:
+        return jsonify(bulk_weather_summaries(farm_ids))
+    except WeatherServiceError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+
 # -------------------------------------------------------
 # SPEECH-TO-TEXT ENDPOINT
 # -------------------------------------------------------
@@ -163,34 +298,38 @@ def transcribe():
 def tts():
     """
     Convert text to speech and return both audio and translated text
-    Body: {"text": "text to speak", "language": "en"}
-    Returns: {"audio": "base64", "translated_text": "text in target language"}
+    Body: {"text": "text to speak", "language": "en", "inline": true}
+    Returns: {"audio": "base64", "audio_url": "/api/audio/<hash>.mp3", "translated_text": "text in target language"}
+    With "inline": false the base64 audio is left out; fetch audio_url instead (cacheable, seekable).
     """
     try:
         data = request.json
         text = data.get('text', '').strip()
         language = data.get('language', 'en')
+        inline = data.get('inline', True) is not False
         
         if not text:
             return jsonify({"error": "Text is required"}), 400
         
-        # Generate unique filename
-        filename = f"speech_{os.urandom(4).hex()}.mp3"
-        
-        # Get translated text from TTS function
-        result = text_to_speech(text, lang_code=language, filename=filename)
+        # Get translated text from TTS function (audio is cached by content hash)
+        result = text_to_speech(text, lang_code=language)
         
-        if result and len(result) == 3:  # Returns (filename, audio_bytes, translated_text)
-            _, audio_bytes, translated_text = result
+        if result and len(result) == 3:  # Returns (cache_path, audio_bytes, translated_text)
+            path, audio_bytes, translated_text = result
             
             if audio_bytes:
-                # Return audio as base64 and translated text
-                audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+                # Return audio as base64 (unless the client fetches the URL) and translated text
+                audio_base64 = base64.b64encode(audio_bytes).decode('utf-8') if inline else None
                 return jsonify({
                     "audio": audio_base64,
+                    "audio_url": audio_url(key_from_path(path)),
                     "translated_text": translated_text,
                     "format": "mp3"
                 })
+
+            if translated_text:
+                # gTTS is unavailable: text only, the frontend speaks it with the browser voice
+                return jsonify({"audio": None, "translated_text": translated_text, "format": None, "degraded": True})
         
         return jsonify({"error": "Failed to generate audio"}), 500
     
@@ -198,54 +337,191 @@ def tts():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/tts/stream', methods=['GET', 'POST'])
+def tts_stream():
+    """
+    Stream speech as binary MP3 (chunked) instead of base64-in-JSON
+    Body: {"text": "text to speak", "language": "en"} (or the same as query params for GET,
+          so the URL can be used directly as an <audio> src)
+    Returns: audio/mpeg body; translated text in the URL-encoded X-Translated-Text header,
+             and in X-Audio-Url the cacheable URL the finished clip can be replayed from
+    """
+    try:
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        text = (data.get('text') or '').strip()
+        language = data.get('language', 'en')
+
+        if not text:
+            return jsonify({"error": "Text is required"}), 400
+
+        translated_text, lang_used = translate_text(text, language)
+        gtts_upstream = upstream("gtts")
+        if gtts_upstream.breaker.is_open():
+            return _unavailable(UpstreamUnavailable("Speech synthesis is temporarily unavailable",
+                                                    retry_after=gtts_upstream.breaker.retry_after()),
+                                translated_text=translated_text)
+
+        def generate():
+            try:
+                yield from stream_speech(translated_text, lang_used)
+            except Exception as exc:
+                # Headers are already sent, so the client just sees a short clip
+                safe_print(f"[TTS ERROR] Streaming synthesis failed: {str(exc)}")
+
+        response = Response(stream_with_context(generate()), mimetype='audio/mpeg')
+        response.headers['X-Translated-Text'] = quote(translated_text)
+        response.headers['X-Language'] = lang_used
+        response.headers['X-Audio-Url'] = audio_url(clip_key(translated_text, lang_used))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/audio/<key>.mp3', methods=['GET'])
+def audio(key):
+    """
+    A synthesized clip by content hash (the audio_url from /api/tts).
+    Immutable, so browsers and CDNs may keep it; supports Range requests for seeking.
+    Evicted clips are synthesized again; 404 only for keys this server never issued
+    (or has forgotten since a restart).
+    """
+    try:
+        clip = audio_clip(key) if is_audio_key(key) else None
+    except UpstreamUnavailable as exc:
+        return _unavailable(exc)
+    if clip is None:
+        return jsonify({"error": "Unknown or expired audio clip"}), 404
+
+    response = Response(clip, mimetype='audio/mpeg')
+    response.set_etag(key)
+    response.headers['Cache-Control'] = AUDIO_CACHE_CONTROL
+    # Answers 304 / 206 / 416 as the request's conditional and Range headers call for
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(clip))
+
+
+# -------------------------------------------------------
+# 🎙 VOICE TURN ENDPOINT (STT -> CHAT -> TTS in one round trip)
+# -------------------------------------------------------
+@app.route('/api/voice', methods=['POST'])
+def voice():
+    """
+    Run a full voice turn server-side
+    Body: FormData with 'audio' file, 'language' field, optional 'weatherContext' and 'sessionId'
+    Returns: {"text": "transcript", "response": "English answer",
+              "translated_text": "answer in target language", "audio": "base64",
+              "format": "mp3", "timings": {...}}
+    """
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "Audio file is required"}), 400
+
+        audio_bytes = request.files['audio'].read()
+        language = request.form.get('language', 'en')
+        weather_context = request.form.get('weatherContext') or None
+        session_id = request.form.get('sessionId') or None
+
+        if len(audio_bytes) == 0:
+            return jsonify({"error": "Audio file is empty"}), 400
+
+        result = run_voice_pipeline(audio_bytes, language=language, weather_context=weather_context,
+                                    session_id=session_id)
+        safe_print(f"[VOICE] Timings: {result['timings']}")
+
+        audio_bytes = result["audio"]
+        return jsonify({
+            "text": result["transcript"],
+            "language": result["language"],
+            "response": result["response"],
+            "translated_text": result["translated_text"] or result["response"],
+            "audio": base64.b64encode(audio_bytes).decode('utf-8') if audio_bytes else None,
+            "format": "mp3",
+            "timings": result["timings"]
+        })
+
+    except VoicePipelineError as exc:
+        return jsonify({"error": str(exc)}), 422
+    except Exception as e:
+        safe_print(f"[API ERROR] Voice turn failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 # -------------------------------------------------------
 # 🖼 IMAGE ANALYSIS ENDPOINT
 # -------------------------------------------------------
+def _queue_full(exc: QueueFullError):
+    """429 while the image analysis queue is full."""
+    retry_after = math.ceil(exc.retry_after)
+    return jsonify({"error": str(exc), "retry_after": retry_after}), 429, {'Retry-After': str(retry_after)}
+
+
+def _job_accepted(job):
+    poll_url = f"/api/analyze-image/jobs/{job.id}"
+    return jsonify({**job.to_dict(), "poll_url": poll_url}), 202, {'Location': poll_url}
+
+
 @app.route('/api/analyze-image', methods=['POST'])
 def analyze_image():
     """
     Analyze plant disease from uploaded image
     Body: FormData with 'image' file
-    Returns: {"analysis": "AI analysis text"}
+    Returns: {"analysis": "AI analysis text", "cached": true if a near-duplicate was reused}
+    The work runs on the image worker pool and this request waits for it; 429
+    when its queue is full. New clients should use /api/analyze-image/jobs.
     """
     try:
         if 'image' not in request.files:
             return jsonify({"error": "Image file is required"}), 400
-        
-        image_file = request.files['image']
-        
-        # Save temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            image_file.save(tmp.name)
-            tmp_path = tmp.name
-        
-        # Open image
-        image = Image.open(tmp_path)
-        
-        # Analyze with Gemini
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        
-        prompt = """
-        Analyze the uploaded plant image.
-        Identify the plant name, disease name, and the level of infection (mild, medium, or severe).
-        Give a short, simple, and friendly reply using plain everyday words that sound natural when spoken aloud.
-        Explain the problem in one short line and give an organic solution only — no chemical fertilizers unless the user asks for chemical treatment.
-        Keep the answer short, crisp, and clear so a farmer can understand it easily.
-        Write the response with no symbols or markdown. Keep it plain text.
-        """
-        
-        response = model.generate_content([prompt, image])
-        analysis = getattr(response, "text", str(response))
-        
-        # Clean up
-        os.unlink(tmp_path)
-        
-        return jsonify({"analysis": analysis})
-    
+
+        job = image_jobs.submit(request.files['image'].read())
+        job.wait()
+
+        result = job.to_dict()
+        if job.status == "done":
+            return jsonify({"analysis": result["analysis"], "cached": result["cached"]})
+        if job.degraded:
+            return _unavailable(UpstreamUnavailable(job.error, retry_after=job.retry_after))
+        return jsonify({"error": job.error}), 500
+
+    except QueueFullError as exc:
+        return _queue_full(exc)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/analyze-image/jobs', methods=['POST'])
+def analyze_image_submit():
+    """
+    Queue a plant photo for analysis and return at once.
+    Body: FormData with 'image' file
+    Returns: 202 {"job_id", "status": "queued", "poll_url"}, or 429 with Retry-After when busy
+    """
+    if 'image' not in request.files:
+        return jsonify({"error": "Image file is required"}), 400
+    try:
+        job = image_jobs.submit(request.files['image'].read())
+    except QueueFullError as exc:
+        return _queue_full(exc)
+    return _job_accepted(job)
+
+
+@app.route('/api/analyze-image/jobs/<job_id>', methods=['GET'])
+def analyze_image_job(job_id):
+    """
+    Status of an image job: queued, running, done (with analysis) or failed (with error).
+    Answers at once: a long-poll here would hold a request thread for the whole analysis
+    as a cheap request, so ?wait=N is ignored and unfinished jobs carry a Retry-After
+    telling the client when to poll again. The ASGI server does long-poll.
+    """
+    job = image_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 200, {'Retry-After': str(IMAGE_POLL_INTERVAL)}
+    return jsonify(job.to_dict())
+
+
 # -------------------------------------------------------
 # 🏥 HEALTH CHECK
 # -------------------------------------------------------
@@ -255,10 +531,21 @@ def health():
     return jsonify({
         "status": "healthy",
         "service": "AgroBot API",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "providers": registry.status(),
+        "upstreams": upstream_status()
     })
 
 
+# -------------------------------------------------------
+# 📊 METRICS
+# -------------------------------------------------------
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: request/stage latency histograms, upstream calls, cache stats"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
 # -------------------------------------------------------
 # RUN SERVER
 # -------------------------------------------------------
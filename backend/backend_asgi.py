@@ -0,0 +1,560 @@
+# -*- coding: utf-8 -*-
+"""
+AgroBot ASGI Backend API
+------------------------
+Async serving mode exposing the same /api/* contract as backend_api.py.
+Gemini chat, Groq and OpenWeather are called through their async clients, so an
+in-flight upstream call costs a coroutine instead of a worker thread. Image
+analysis runs on the bounded image worker pool (see image_jobs.py).
+gTTS and Deep Translator have no async client and run on a bounded thread pool.
+
+Run with:  uvicorn backend_asgi:app --host 0.0.0.0 --port 5000
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+import asyncio
+import base64
+import json
+import math
+import os
+import time
+
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+from admission import AdmissionRejected, admission, client_id
+from agrobot_chat import get_agro_response_async, stream_agro_response_async
+from http_cache import (AUDIO_CACHE_CONTROL, audio_url, body_etag, byte_range, conditional_status,
+                        is_audio_key, weather_headers)
+from image_jobs import IMAGE_MAX_WAIT, QueueFullError, image_jobs
+from log_utils import safe_print
+from metrics import CONTENT_TYPE, IN_FLIGHT, observe_request, render_metrics
+from providers import registry, warm_up_if_configured
+from resilience import UpstreamUnavailable, upstream, upstream_status
+from tts_cache import key_from_path
+from tts_engine import audio_clip, clip_key, text_to_speech, translate_text, stream_speech
+from universal_stt import transcribe_audio_groq_async
+from voice_pipeline import run_voice_pipeline_async, VoicePipelineError
+from weather_service import (fetch_weather_summary_async, WeatherServiceError, bulk_weather_summaries,
+                             register_farms, unregister_farm, WEATHER_CACHE_TTL)
+
+# Threads for the blocking gTTS / translation work (the async clients need none)
+ASGI_BLOCKING_WORKERS = int(os.getenv("ASGI_BLOCKING_WORKERS", 64))
+
+
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _unavailable(exc: UpstreamUnavailable, **extra) -> JSONResponse:
+    """503 for a request whose upstream timed out or has its circuit open."""
+    headers = {'Retry-After': str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse({"error": str(exc), "degraded": True, **extra}, status_code=503, headers=headers)
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+
+# -------------------------------------------------------
+# 💬 CHAT ENDPOINTS
+# -------------------------------------------------------
+async def chat(request: Request):
+    """Body: {"message": "farming question", "sessionId": "..."} -> {"response": "AI response"}"""
+    try:
+        data = await _json_body(request)
+        user_message = (data.get('message') or '').strip()
+
+        if not user_message:
+            return JSONResponse({"error": "Message is required"}, status_code=400)
+
+        response = await get_agro_response_async(
+            user_message,
+            weather_context=data.get('weatherContext'),
+            session_id=data.get('sessionId'),
+        )
+        safe_print(f"[CHAT] User message: {user_message[:50]}...")
+        return JSONResponse({"response": response})
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def chat_stream(request: Request):
+    """Server-Sent Events variant of /api/chat ("delta" events, then "done")."""
+    data = await _json_body(request)
+    user_message = (data.get('message') or '').strip()
+
+    if not user_message:
+        return JSONResponse({"error": "Message is required"}, status_code=400)
+
+    async def generate():
+        chunks = []
+        try:
+            async for chunk in stream_agro_response_async(
+                user_message,
+                weather_context=data.get('weatherContext'),
+                session_id=data.get('sessionId'),
+            ):
+                chunks.append(chunk)
+                yield _sse("delta", {"text": chunk})
+            yield _sse("done", {"response": "".join(chunks).strip()})
+        except Exception as exc:
+            safe_print(f"[CHAT ERROR] Streaming failed: {str(exc)}")
+            yield _sse("error", {"error": str(exc)})
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# -------------------------------------------------------
+# 🌦 WEATHER SNAPSHOT ENDPOINT
+# -------------------------------------------------------
+async def weather(request: Request):
+    """Query params: lat & lon (preferred) or city. Conditional (ETag / Last-Modified), see http_cache.py."""
+    try:
+        lat = request.query_params.get('lat')
+        lon = request.query_params.get('lon')
+        city = request.query_params.get('city')
+
+        if not (lat and lon) and not city:
+            return JSONResponse({"error": "Provide latitude/longitude or a city name"}, status_code=400)
+
+        summary = await fetch_weather_summary_async(lat=lat, lon=lon, city=city)
+        response = JSONResponse(summary)
+        etag = body_etag(response.body)
+        headers = weather_headers(summary, WEATHER_CACHE_TTL, etag)
+        if conditional_status(request.headers, etag, summary.get("fetched_at")) == 304:
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return response
+
+    except WeatherServiceError as exc:
+        safe_print(f"[WEATHER ERROR] {str(exc)}")
+        return JSONResponse({"error": str(exc)}, status_code=400)
+    except UpstreamUnavailable as exc:
+        safe_print(f"[WEATHER ERROR] {str(exc)}")
+        return _unavailable(exc)
+    except Exception as exc:
+        safe_print(f"[WEATHER ERROR] Unexpected failure: {str(exc)}")
+        return JSONResponse({"error": "Failed to fetch weather data"}, status_code=500)
+
+
+# -------------------------------------------------------
+# 🚜 FARM REGISTRY & BULK WEATHER
+# -------------------------------------------------------
+async def farms_register(request: Request):
+    """{"farms": [{"id", "lat", "lon"} or {"id", "city"}]} -> farms refreshed in the background."""
+    data = await _json_body(request)
+    farms = data.get('farms')
+    if not isinstance(farms, list) or not farms:
+        return JSONResponse({"error": "Provide a non-empty 'farms' list"}, status_code=400)
+
+    result = register_farms(farms)
+    safe_print(f"[FARMS] Registered {result['registered']} farm(s), {len(result['errors'])} rejected")
+    return JSONResponse(result, status_code=200 if result['registered'] else 400)
+
+
+async def farms_unregister(request: Request):
+    farm_id = request.path_params['farm_id']
+    if not unregister_farm(farm_id):
+        return JSONResponse({"error": "Unknown farm"}, status_code=404)
+    return JSONResponse({"removed": farm_id})
+
+
+async def weather_bulk(request: Request):
+    """{"farms": [farm ids]} -> prefetched summaries; farms not fetched yet are "pending"."""
+    data = await _json_body(request)
+    farm_ids = data.get('farms')
+    if not isinstance(farm_ids, list) or not farm_ids:
+        return JSONResponse({"error": "Provide a non-empty 'farms' list of farm ids"}, status_code=400)
+
+    try:
+        # In-memory reads only, cheap enough to run on the event loop
+        return JSONResponse(bulk_weather_summaries(farm_ids))
+    except WeatherServiceError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+
+
+# -------------------------------------------------------
+# SPEECH-TO-TEXT ENDPOINT
+# -------------------------------------------------------
+async def transcribe(request: Request):
+    """FormData with 'audio' file and 'language' -> {"text": "...", "language": "..."}"""
+    try:
+        form = await request.form()
+        audio_file = form.get('audio')
+        if audio_file is None or isinstance(audio_file, str):
+            return JSONResponse({"error": "Audio file is required"}, status_code=400)
+
+        audio_bytes = await audio_file.read()
+        language = form.get('language', 'en')
+        if len(audio_bytes) == 0:
+            return JSONResponse({"error": "Audio file is empty"}, status_code=400)
+
+        result = await transcribe_audio_groq_async(audio_bytes, lang=language)
+        if not result or not result.get("original_text"):
+            return JSONResponse({"error": "Transcription returned empty result"}, status_code=500)
+
+        return JSONResponse({"text": result["original_text"], "language": result["language_used"]})
+
+    except Exception as e:
+        safe_print(f"[API ERROR] Transcription failed: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# -------------------------------------------------------
+# 🔊 TEXT-TO-SPEECH ENDPOINTS
+# -------------------------------------------------------
+async def tts(request: Request):
+    """
+    Body: {"text": "...", "language": "en", "inline": true}
+    -> {"audio": "base64", "audio_url": "/api/audio/<hash>.mp3", "translated_text": "...", "format": "mp3"};
+    "inline": false leaves out the base64 audio.
+    """
+    try:
+        data = await _json_body(request)
+        text = (data.get('text') or '').strip()
+        if not text:
+            return JSONResponse({"error": "Text is required"}, status_code=400)
+
+        path, audio_bytes, translated_text = await run_in_threadpool(
+            text_to_speech, text, data.get('language', 'en')
+        )
+        if audio_bytes:
+            inline = data.get('inline', True) is not False
+            return JSONResponse({
+                "audio": base64.b64encode(audio_bytes).decode('utf-8') if inline else None,
+                "audio_url": audio_url(key_from_path(path)),
+                "translated_text": translated_text,
+                "format": "mp3"
+            })
+        if translated_text:
+            # gTTS is unavailable: text only, the frontend speaks it with the browser voice
+            return JSONResponse({"audio": None, "translated_text": translated_text, "format": None, "degraded": True})
+        return JSONResponse({"error": "Failed to generate audio"}, status_code=500)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def tts_stream(request: Request):
+    """Chunked audio/mpeg body; translated text in the X-Translated-Text header, replay URL in X-Audio-Url."""
+    try:
+        data = await _json_body(request) if request.method == 'POST' else request.query_params
+        text = (data.get('text') or '').strip()
+        if not text:
+            return JSONResponse({"error": "Text is required"}, status_code=400)
+
+        translated_text, lang_used = await run_in_threadpool(translate_text, text, data.get('language', 'en'))
+        gtts_upstream = upstream("gtts")
+        if gtts_upstream.breaker.is_open():
+            return _unavailable(UpstreamUnavailable("Speech synthesis is temporarily unavailable",
+                                                    retry_after=gtts_upstream.breaker.retry_after()),
+                                translated_text=translated_text)
+        return StreamingResponse(
+            iterate_in_threadpool(stream_speech(translated_text, lang_used)),
+            media_type='audio/mpeg',
+            headers={
+                'X-Translated-Text': quote(translated_text),
+                'X-Language': lang_used,
+                'X-Audio-Url': audio_url(clip_key(translated_text, lang_used)),
+                'Cache-Control': 'no-store',
+            },
+        )
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def audio(request: Request):
+    """
+    A synthesized clip by content hash: immutable, conditional, and seekable with Range requests.
+    Evicted clips are synthesized again from their remembered text.
+    """
+    key = request.path_params['key']
+    try:
+        clip = await run_in_threadpool(audio_clip, key) if is_audio_key(key) else None
+    except UpstreamUnavailable as exc:
+        return _unavailable(exc)
+    if clip is None:
+        return JSONResponse({"error": "Unknown or expired audio clip"}, status_code=404)
+
+    headers = {'ETag': f'"{key}"', 'Cache-Control': AUDIO_CACHE_CONTROL, 'Accept-Ranges': 'bytes'}
+    if conditional_status(request.headers, key) == 304:
+        return Response(status_code=304, headers=headers)
+    requested = byte_range(request.headers.get('range'), len(clip))
+    if requested == "unsatisfiable":
+        return Response(status_code=416, headers={**headers, 'Content-Range': f"bytes */{len(clip)}"})
+    if requested:
+        start, end = requested
+        return Response(clip[start:end + 1], status_code=206, media_type='audio/mpeg',
+                        headers={**headers, 'Content-Range': f"bytes {start}-{end}/{len(clip)}"})
+    return Response(clip, media_type='audio/mpeg', headers=headers)
+
+
+# -------------------------------------------------------
+# 🎙 VOICE TURN ENDPOINT
+# -------------------------------------------------------
+async def voice(request: Request):
+    """FormData with 'audio', 'language', optional 'weatherContext'/'sessionId' -> full voice turn."""
+    try:
+        form = await request.form()
+        audio_file = form.get('audio')
+        if audio_file is None or isinstance(audio_file, str):
+            return JSONResponse({"error": "Audio file is required"}, status_code=400)
+
+        audio_bytes = await audio_file.read()
+        if len(audio_bytes) == 0:
+            return JSONResponse({"error": "Audio file is empty"}, status_code=400)
+
+        result = await run_voice_pipeline_async(
+            audio_bytes,
+            language=form.get('language', 'en'),
+            weather_context=form.get('weatherContext') or None,
+            session_id=form.get('sessionId') or None,
+        )
+        audio_bytes = result["audio"]
+        return JSONResponse({
+            "text": result["transcript"],
+            "language": result["language"],
+            "response": result["response"],
+            "translated_text": result["translated_text"] or result["response"],
+            "audio": base64.b64encode(audio_bytes).decode('utf-8') if audio_bytes else None,
+            "format": "mp3",
+            "timings": result["timings"]
+        })
+
+    except VoicePipelineError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=422)
+    except Exception as e:
+        safe_print(f"[API ERROR] Voice turn failed: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# -------------------------------------------------------
+# 🖼 IMAGE ANALYSIS ENDPOINT
+# -------------------------------------------------------
+def _queue_full(exc: QueueFullError) -> JSONResponse:
+    """429 while the image analysis queue is full."""
+    retry_after = math.ceil(exc.retry_after)
+    return JSONResponse({"error": str(exc), "retry_after": retry_after}, status_code=429,
+                        headers={'Retry-After': str(retry_after)})
+
+
+def _job_accepted(job) -> JSONResponse:
+    poll_url = f"/api/analyze-image/jobs/{job.id}"
+    return JSONResponse({**job.to_dict(), "poll_url": poll_url}, status_code=202, headers={'Location': poll_url})
+
+
+async def _uploaded_image(request: Request) -> bytes | None:
+    form = await request.form()
+    image_file = form.get('image')
+    if image_file is None or isinstance(image_file, str):
+        return None
+    return await image_file.read()
+
+
+async def analyze_image(request: Request):
+    """
+    FormData with 'image' file -> {"analysis": "AI analysis text", "cached": bool}.
+    Waits (on the event loop) for a job on the image worker pool; 429 when its queue is full.
+    """
+    try:
+        data = await _uploaded_image(request)
+        if data is None:
+            return JSONResponse({"error": "Image file is required"}, status_code=400)
+
+        job = image_jobs.submit(data)
+        await job.wait_async()
+
+        result = job.to_dict()
+        if job.status == "done":
+            return JSONResponse({"analysis": result["analysis"], "cached": result["cached"]})
+        if job.degraded:
+            return _unavailable(UpstreamUnavailable(job.error, retry_after=job.retry_after))
+        return JSONResponse({"error": job.error}, status_code=500)
+
+    except QueueFullError as exc:
+        return _queue_full(exc)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def analyze_image_submit(request: Request):
+    """FormData with 'image' file -> 202 {"job_id", "status", "poll_url"}, or 429 with Retry-After when busy."""
+    data = await _uploaded_image(request)
+    if data is None:
+        return JSONResponse({"error": "Image file is required"}, status_code=400)
+    try:
+        job = image_jobs.submit(data)
+    except QueueFullError as exc:
+        return _queue_full(exc)
+    return _job_accepted(job)
+
+
+async def analyze_image_job(request: Request):
+    """Job status; ?wait=N long-polls up to N seconds (max IMAGE_MAX_WAIT) for the result."""
+    job = image_jobs.get(request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({"error": "Unknown or expired job"}, status_code=404)
+    try:
+        wait = min(max(float(request.query_params.get('wait', 0)), 0.0), IMAGE_MAX_WAIT)
+    except ValueError:
+        return JSONResponse({"error": "wait must be a number of seconds"}, status_code=400)
+    if wait and not job.done:
+        await job.wait_async(wait)
+    return JSONResponse(job.to_dict())
+
+
+# -------------------------------------------------------
+# 🏥 HEALTH CHECK
+# -------------------------------------------------------
+async def health(request: Request):
+    return JSONResponse({
+        "status": "healthy",
+        "service": "AgroBot API",
+        "version": "1.0.0",
+        "providers": registry.status(),
+        "upstreams": upstream_status()
+    })
+
+
+# -------------------------------------------------------
+# 📊 METRICS
+# -------------------------------------------------------
+async def metrics(request: Request):
+    return Response(render_metrics(), headers={"Content-Type": CONTENT_TYPE})
+
+
+class MetricsMiddleware:
+    """Times every HTTP request until its body has been sent (including streamed bodies)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; its path keeps label cardinality fixed
+            endpoint = getattr(scope.get("route"), "path", "unmatched")
+            observe_request(endpoint, scope["method"], status["code"], time.perf_counter() - start)
+
+
+# -------------------------------------------------------
+# 🚦 ADMISSION CONTROL
+# -------------------------------------------------------
+class AdmissionMiddleware:
+    """Per-client rate limits and load shedding (see admission.py), before any work is done."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        client = client_id(scope["client"][0] if scope.get("client") else None, headers.get("x-forwarded-for"))
+        try:
+            admitted = admission.admit(client, scope["path"])
+        except AdmissionRejected as exc:
+            # Routing has not run yet; record the route so the request metrics keep their endpoint label
+            scope["route"] = next((route for route in scope["app"].routes
+                                   if route.matches(scope)[0] == Match.FULL), None)
+            response = JSONResponse({"error": str(exc), "retry_after": exc.retry_after},
+                                    status_code=exc.status, headers={"Retry-After": str(exc.retry_after)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if admitted:
+                admission.release()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # run_in_threadpool uses anyio's limiter; asyncio.to_thread (audio preprocessing) the loop's default executor
+    anyio.to_thread.current_default_thread_limiter().total_tokens = ASGI_BLOCKING_WORKERS
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASGI_BLOCKING_WORKERS, thread_name_prefix="asgi-blocking")
+    )
+    warm_up_if_configured()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/weather', weather, methods=['GET']),
+        Route('/api/weather/bulk', weather_bulk, methods=['POST']),
+        Route('/api/farms', farms_register, methods=['POST']),
+        Route('/api/farms/{farm_id}', farms_unregister, methods=['DELETE']),
+        Route('/api/transcribe', transcribe, methods=['POST']),
+        Route('/api/tts', tts, methods=['POST']),
+        Route('/api/tts/stream', tts_stream, methods=['GET', 'POST']),
+        Route('/api/audio/{key}.mp3', audio, methods=['GET']),
+        Route('/api/voice', voice, methods=['POST']),
+        Route('/api/analyze-image', analyze_image, methods=['POST']),
+        Route('/api/analyze-image/jobs', analyze_image_submit, methods=['POST']),
+        Route('/api/analyze-image/jobs/{job_id}', analyze_image_job, methods=['GET']),
+        Route('/api/health', health, methods=['GET']),
+        Route('/api/metrics', metrics, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=['*'],
+            allow_methods=['*'],
+            allow_headers=['*'],
+            expose_headers=['X-Translated-Text', 'X-Language', 'X-Audio-Url', 'Retry-After'],
+        ),
+        Middleware(MetricsMiddleware),
+        Middleware(AdmissionMiddleware),
+    ],
+    lifespan=lifespan,
+)
+
+
+# -------------------------------------------------------
+# RUN SERVER
+# -------------------------------------------------------
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv("PORT", 5000))
+    print(f"AgroBot ASGI API running on http://localhost:{port}")
+    uvicorn.run(app, host='0.0.0.0', port=port)
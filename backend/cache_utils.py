@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Cache Utilities for AgroBot
+---------------------------
+Small thread-safe LRU cache with optional TTL and byte budget,
+shared by the backend's in-memory stores.
+"""
+
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+def default_sizeof(value) -> int:
+    """Approximate memory footprint of a cached value."""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by entry count and/or total bytes.
+    Entries older than `ttl` seconds are treated as missing.
+    """
+
+    def __init__(self, max_items: int = 1024, max_bytes: int | None = None,
+                 ttl: float | None = None, sizeof=default_sizeof):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._data = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[2]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._remove(key)
+            return value
+
+    def _evict(self):
+        while self._data and (
+            len(self._data) > self.max_items
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Drop expired entries eagerly; returns how many were removed."""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            stale = [k for k, (_, _, stored_at) in self._data.items() if self._expired(stored_at)]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[2])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+FAQ Answer Cache for AgroBot
+----------------------------
+Answers repeat farming questions ("how to control aphids on cotton") without
+another Gemini call. Questions are reduced to their content words and
+compared with MinHash signatures; LSH banding finds candidates in constant
+time and the exact word-set Jaccard similarity decides the match. Answers
+are only shared between requests for the same location in the same coarse
+weather bucket, since a reply may quote the place and its conditions.
+
+Follow-up turns ("what about for chilli?", "how much of it?") depend on the
+conversation so far and always bypass the cache.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from metrics import register_cache
+from text_utils import is_follow_up, tokenize
+
+FAQ_CACHE_ENABLED = os.getenv("FAQ_CACHE", "1") != "0"
+FAQ_CACHE_SIZE = int(os.getenv("FAQ_CACHE_SIZE", 2000))
+FAQ_CACHE_TTL = int(os.getenv("FAQ_CACHE_TTL", 6 * 3600))            # seconds
+# Minimum word-set Jaccard similarity for two questions to share an answer
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", 0.75))
+
+_NUM_PERM = 32
+_BANDS = 16                                 # 2 rows per band: finds pairs with Jaccard >= ~0.5
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_NUM_PERM)]
+
+
+def question_terms(question: str) -> frozenset:
+    """Content words of a question, lowercased and singularized."""
+    return frozenset(tokenize(question))
+
+
+def weather_bucket(weather_context: str | None) -> str:
+    """
+    Coarse bucket for the weather context: its location plus the "Action:"
+    advice produced by weather_service, which only changes when conditions
+    cross a threshold and so groups the hours of one place together. Other
+    contexts fall back to a digest of the whole text.
+    """
+    if not weather_context:
+        return "none"
+    match = re.search(r"Action:\s*(.+)", weather_context, re.DOTALL)
+    text = match.group(1) if match else weather_context
+    location = re.match(r"\s*Local weather for (.+?):", weather_context)
+    if location:
+        text = f"{location.group(1)}|{text}"
+    normalized = " ".join(text.lower().split()).rstrip(".")
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def minhash(terms) -> tuple:
+    hashes = [zlib.crc32(term.encode("utf-8")) for term in terms]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class FAQCache:
+    """Bounded, expiring {question terms + weather bucket: answer} store with near-duplicate lookup."""
+
+    def __init__(self, max_items: int = FAQ_CACHE_SIZE, ttl: float = FAQ_CACHE_TTL,
+                 threshold: float = FAQ_SIMILARITY):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()       # entry id -> (bucket, terms, band keys, answer, stored_at)
+        self._bands = {}                    # (bucket, band, values) -> set of entry ids
+        self._exact = {}                    # (bucket, terms) -> entry id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def _band_keys(self, bucket: str, terms) -> list:
+        signature = minhash(terms)
+        return [(bucket, band, signature[band * _ROWS:(band + 1) * _ROWS]) for band in range(_BANDS)]
+
+    def _drop(self, entry_id: int):
+        bucket, terms, band_keys, _, _ = self._entries.pop(entry_id)
+        if self._exact.get((bucket, terms)) == entry_id:
+            del self._exact[(bucket, terms)]
+        for key in band_keys:
+            members = self._bands.get(key)
+            if members is not None:
+                members.discard(entry_id)
+                if not members:
+                    del self._bands[key]
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl
+
+    def lookup(self, question: str, weather_context: str | None = None, has_history: bool = False) -> str | None:
+        """Cached answer for a near-identical question in the same weather bucket, if any."""
+        if not FAQ_CACHE_ENABLED:
+            return None
+        if is_follow_up(question, has_history):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        terms = question_terms(question)
+        if not terms:
+            return None
+        bucket = weather_bucket(weather_context)
+        with self._lock:
+            best_id, best_score = self._exact.get((bucket, terms)), 1.0
+            if best_id is None:
+                best_score = self.threshold
+                candidates = set()
+                for key in self._band_keys(bucket, terms):
+                    candidates |= self._bands.get(key, set())
+                for entry_id in candidates:
+                    score = jaccard(terms, self._entries[entry_id][1])
+                    if score >= best_score:
+                        best_id, best_score = entry_id, score
+
+            if best_id is not None and self._expired(self._entries[best_id][4]):
+                self._drop(best_id)
+                best_id = None
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def store(self, question: str, weather_context: str | None, answer: str, has_history: bool = False):
+        """
+        Remember an answer. Only self-contained first turns are stored, so a
+        cached answer never carries context from someone else's conversation.
+        """
+        if not FAQ_CACHE_ENABLED or has_history or not answer:
+            return
+        terms = question_terms(question)
+        if len(terms) < 2:
+            return
+        bucket = weather_bucket(weather_context)
+        with self._lock:
+            existing = self._exact.get((bucket, terms))
+            if existing is not None:
+                self._drop(existing)
+            entry_id = self._next_id
+            self._next_id += 1
+            band_keys = self._band_keys(bucket, terms)
+            self._entries[entry_id] = (bucket, terms, band_keys, answer, time.monotonic())
+            self._exact[(bucket, terms)] = entry_id
+            for key in band_keys:
+                self._bands.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_items:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+            self._exact.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+faq_cache = FAQCache()
+register_cache("faq", faq_cache.stats)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP Caching Helpers for AgroBot
+--------------------------------
+Validators and Cache-Control values shared by both servers, so browsers,
+service workers and CDNs can keep what the API sends:
+
+- synthesized speech lives at /api/audio/<content hash>.mp3. The URL never
+  changes meaning, so clips are immutable and served with Range support for
+  seeking;
+- weather summaries carry an ETag and Last-Modified, with max-age set to
+  whatever is left of the server-side cache TTL, so repeat fetches become
+  304s or edge hits until the server would fetch fresh data anyway.
+
+Flask answers conditional and Range requests with werkzeug's
+make_conditional; the ASGI server uses conditional_status() and
+byte_range() below.
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import math
+import os
+import re
+import time
+
+AUDIO_MAX_AGE = int(os.getenv("AUDIO_MAX_AGE", 365 * 24 * 3600))      # seconds
+AUDIO_CACHE_CONTROL = f"public, max-age={AUDIO_MAX_AGE}, immutable"
+
+_AUDIO_KEY = re.compile(r"^[0-9a-f]{64}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def audio_url(key: str) -> str:
+    return f"/api/audio/{key}.mp3"
+
+
+def is_audio_key(key: str) -> bool:
+    return bool(_AUDIO_KEY.match(key))
+
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag (without quotes) for a response body."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def weather_max_age(summary: dict, ttl: float) -> int:
+    """Seconds the summary stays fresh: what is left of its server-side cache TTL."""
+    age = time.time() - summary.get("fetched_at", time.time())
+    return max(0, math.floor(ttl - age))
+
+
+def weather_headers(summary: dict, ttl: float, etag: str) -> dict:
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={weather_max_age(summary, ttl)}",
+    }
+    if "fetched_at" in summary:
+        headers["Last-Modified"] = formatdate(summary["fetched_at"], usegmt=True)
+    return headers
+
+
+def conditional_status(request_headers, etag: str, last_modified: float | None = None) -> int | None:
+    """304 if the client's cached copy (If-None-Match / If-Modified-Since) is still current."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return 304 if "*" in tags or f'"{etag}"' in tags else None
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            if int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return 304
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def byte_range(range_header: str | None, size: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the whole
+    body, or "unsatisfiable" (416). Multi-range requests get the whole body.
+    """
+    if not range_header:
+        return None
+    match = _RANGE.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            return "unsatisfiable"
+    else:
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        start, end = max(size - length, 0), size - 1
+    return start, end
@@ -1,41 +1,196 @@
+import argparse
+import hashlib
+from io import BytesIO
+import json
 import sys
-import google.generativeai as genai
-from PIL import Image
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from image_dedup import image_cache, perceptual_hash
+from metrics import stage_timer
+from providers import GEMINI_MODEL, get_gemini, get_pil_image
+from rate_limit import TokenBucket
+from resilience import UPSTREAM_TIMEOUTS, upstream
+from singleflight import SingleFlight
 
-def analyze_image(image_path: str = "plant.jpg"):
-    # Configure API key from environment variable
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-    # Initialize the Gemini model
-    model = genai.GenerativeModel("gemini-2.5-flash")
-
-    image = Image.open(image_path)
-
-    # Prompt for the model
-    prompt = """
-    Analyze the uploaded plant image.
-    Identify the plant name, disease name, and the level of infection (mild, medium, or severe).
-    Give a short, simple, and friendly reply using plain everyday words that sound natural when spoken aloud.
-    Explain the problem in one short line and give an organic solution only — no chemical fertilizers unless the user asks for chemical treatment.
-    Keep the answer short, crisp, and clear so a farmer can understand it easily.
-    Write the response with no symbols or markdown. Keep it plain text.
-    
+if TYPE_CHECKING:
+    from PIL import Image
+
+MODEL_NAME = GEMINI_MODEL
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# Uploads with the same perceptual hash that arrive together share one Gemini call
+_image_flights = SingleFlight("image")
+
+# Prompt for the model
+IMAGE_PROMPT = """
+Analyze the uploaded plant image.
+Identify the plant name, disease name, and the level of infection (mild, medium, or severe).
+Give a short, simple, and friendly reply using plain everyday words that sound natural when spoken aloud.
+Explain the problem in one short line and give an organic solution only — no chemical fertilizers unless the user asks for chemical treatment.
+Keep the answer short, crisp, and clear so a farmer can understand it easily.
+Write the response with no symbols or markdown. Keep it plain text.
+"""
+
+
+def analyze_plant_image(image: "Image.Image") -> str:
+    """Run the Gemini vision call on an opened image and return the analysis text."""
+    model = get_gemini().GenerativeModel(MODEL_NAME)
+    with stage_timer("image_model"):
+        response = upstream("gemini").call(model.generate_content, [IMAGE_PROMPT, image],
+                                           request_options={"timeout": UPSTREAM_TIMEOUTS["gemini"]})
+    return getattr(response, "text", str(response))
+
+
+def analyze_plant_image_dedup(image: "Image.Image"):
     """
+    Analyze an image unless a perceptually near-identical one was analyzed recently.
+    An identical image already being analyzed is waited for instead of sent again.
+    Returns (analysis, cached).
+    """
+    phash = perceptual_hash(image)
+    cached = image_cache.lookup(phash)
+    if cached is not None:
+        print(f"[IMAGE] Near-duplicate of a cached image ({phash:016x}), skipping Gemini call")
+        return cached, True
+
+    return _image_flights.do(phash, _analyze_and_store, phash, image), False
+
+
+def _analyze_and_store(phash: int, image: "Image.Image") -> str:
+    analysis = analyze_plant_image(image)
+    image_cache.store(phash, analysis)
+    return analysis
+
+
+def analyze_image(image_path: str = "plant.jpg"):
+    image = get_pil_image().open(image_path)
 
     # Generate response
-    response = model.generate_content([prompt, image])
-    text = getattr(response, "text", str(response))
+    text = analyze_plant_image(image)
 
     print("\nGenerated text:\n")
     print(text)
 
 
+def _iter_images(directory: str):
+    """Yield image paths under directory in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def _load_completed(out_path: str) -> set:
+    """Paths already analyzed successfully in a previous (possibly interrupted) run."""
+    completed = set()
+    if not os.path.exists(out_path):
+        return completed
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash; that image is retried
+            if "analysis" in record:
+                completed.add(record["path"])
+    return completed
+
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _analyze_file(path: str, directory: str, bucket: TokenBucket, seen: dict,
+                  near_duplicates: bool = False) -> dict:
+    record = {"path": os.path.relpath(path, directory)}
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        record["sha256"] = digest
+
+        with get_pil_image().open(BytesIO(data)) as image:
+            phash = perceptual_hash(image)
+            record["phash"] = f"{phash:016x}"
+            # Two different plants photographed alike can be a few dHash bits apart, so a
+            # survey only reuses analyses of byte-identical files unless asked otherwise
+            analysis = seen.get(digest)
+            if analysis is None and near_duplicates:
+                analysis = image_cache.lookup(phash)
+            record["cached"] = analysis is not None
+            if analysis is None:
+                bucket.acquire()  # only real Gemini calls count against the rate budget
+                analysis = analyze_plant_image(image)
+                if near_duplicates:
+                    image_cache.store(phash, analysis)
+            seen[digest] = analysis
+        record["analysis"] = analysis.strip()
+    except Exception as e:
+        record["error"] = str(e)
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def analyze_directory(directory: str, out_path: str, workers: int = 8, rps: float = 2.0,
+                      near_duplicates: bool = False):
+    """
+    Analyze every image under directory and append one JSONL record per image.
+    Images already recorded in out_path are skipped, so an interrupted survey
+    can be resumed by running the same command again. Identical files share one
+    analysis; near_duplicates also reuses it for perceptually similar photos.
+    """
+    completed = _load_completed(out_path)
+    pending = [p for p in _iter_images(directory) if os.path.relpath(p, directory) not in completed]
+    print(f"[BULK] {len(completed)} image(s) already done, {len(pending)} to analyze "
+          f"with {workers} worker(s) at <= {rps} request(s)/s")
+
+    bucket = TokenBucket(rate=rps, capacity=max(1, workers))
+    seen = {}                               # sha256 of file contents -> analysis
+    write_lock = threading.Lock()
+    failures = 0
+    started = time.perf_counter()
+
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        if _ends_mid_line(out_path):
+            out.write("\n")  # start fresh after a record torn by an earlier crash
+        futures = [pool.submit(_analyze_file, path, directory, bucket, seen, near_duplicates) for path in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            failures += "error" in record
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            if done % 50 == 0 or done == len(futures):
+                rate = done / (time.perf_counter() - started)
+                print(f"[BULK] {done}/{len(futures)} done ({rate:.1f} images/s, {failures} failed)")
+
+    return len(pending), failures
+
+
 if __name__ == "__main__":
-    # Allow optional image path argument
-    args = sys.argv[1:]
-    image_path = args[0] if len(args) >= 1 else "plant.jpg"
-    analyze_image(image_path)
+    parser = argparse.ArgumentParser(description="Analyze plant images with Gemini.")
+    parser.add_argument("image_path", nargs="?", default="plant.jpg", help="single image to analyze")
+    parser.add_argument("--bulk", metavar="DIR", help="analyze every image under DIR instead")
+    parser.add_argument("--out", default="analysis.jsonl", help="JSONL output for --bulk (appended, resumable)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent analyses in --bulk mode")
+    parser.add_argument("--rps", type=float, default=2.0, help="max Gemini calls per second in --bulk mode")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="in --bulk mode, reuse analyses for perceptually similar photos, not just identical files")
+    args = parser.parse_args()
+
+    if args.bulk:
+        _, failed = analyze_directory(args.bulk, args.out, workers=args.workers, rps=args.rps,
+                                      near_duplicates=args.near_duplicates)
+        sys.exit(1 if failed else 0)
+    else:
+        analyze_image(args.image_path)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Image Analysis Dedup Cache for AgroBot
+--------------------------------------
+Remembers recent plant-image analyses by perceptual hash (dHash), so the
+same leaf photo or a near-identical burst shot is answered without another
+Gemini vision call. Matches are found by Hamming distance between hashes.
+"""
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import os
+import threading
+
+from metrics import register_cache, timed
+from providers import get_pil_image
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", 1024))
+# Max differing bits (out of 64) for two photos to count as the same picture
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", 6))
+
+_HASH_SIZE = 8
+
+
+@timed("image_hash")
+def perceptual_hash(image: "Image.Image") -> int:
+    """
+    64-bit difference hash: shrink to 9x8 greyscale and record whether each
+    pixel is brighter than its right-hand neighbour. Robust to re-encoding,
+    resizing and small exposure changes.
+    """
+    resample = get_pil_image().Resampling.LANCZOS
+    small = image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), resample)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(_HASH_SIZE):
+        offset = row * (_HASH_SIZE + 1)
+        for col in range(_HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class ImageAnalysisCache:
+    """Bounded LRU of {perceptual hash: analysis} with nearest-neighbour lookup."""
+
+    def __init__(self, max_items: int = IMAGE_CACHE_SIZE, max_distance: int = IMAGE_DEDUP_MAX_DISTANCE):
+        self.max_items = max_items
+        self.max_distance = max_distance
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, phash: int) -> str | None:
+        """Return the analysis of the closest cached image within max_distance, if any."""
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            if phash in self._data:
+                best_key, best_distance = phash, 0
+            else:
+                for key in self._data:
+                    distance = hamming_distance(phash, key)
+                    if distance < best_distance:
+                        best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(best_key)
+            self.hits += 1
+            return self._data[best_key]
+
+    def store(self, phash: int, analysis: str):
+        with self._lock:
+            self._data[phash] = analysis
+            self._data.move_to_end(phash)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+image_cache = ImageAnalysisCache()
+register_cache("image", image_cache.stats)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Image Analysis Job Queue for AgroBot
+------------------------------------
+Plant-photo analysis (decode, perceptual hash, Gemini vision call) runs on a
+small dedicated worker pool fed by a bounded queue, never on the request
+threads. A burst of uploads therefore waits in the queue (or is turned away
+with 429 and a Retry-After hint once the queue is full) while chat, weather
+and health requests keep being served.
+
+Clients either submit a job and poll it, or use /api/analyze-image, which
+submits and waits for the result in one request (a job always finishes: the
+Gemini call inside it has a deadline).
+"""
+
+from io import BytesIO
+import asyncio
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+
+from image import analyze_plant_image_dedup
+from metrics import Counter, metrics_registry, observe_stage, stage_timer
+from providers import get_pil_image
+from resilience import UpstreamUnavailable
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 4))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", 32))
+IMAGE_JOB_TTL = int(os.getenv("IMAGE_JOB_TTL", 600))                  # seconds a finished job can be polled
+IMAGE_MAX_WAIT = float(os.getenv("IMAGE_MAX_WAIT", 30))               # longest long-poll (ASGI), seconds
+IMAGE_POLL_INTERVAL = int(os.getenv("IMAGE_POLL_INTERVAL", 2))        # Retry-After for unfinished jobs on Flask
+
+IMAGE_JOBS = Counter("agrobot_image_jobs_total",
+                     "Image analysis jobs by outcome (done, failed, rejected when the queue was full).",
+                     ("outcome",))
+
+
+class QueueFullError(Exception):
+    """The image queue is full; retry_after estimates when a slot frees up."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Image analysis is busy, please retry shortly")
+        self.retry_after = retry_after
+
+
+class ImageJob:
+    """One uploaded photo and, once a worker has processed it, its analysis or error."""
+
+    def __init__(self, data: bytes):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"              # queued -> running -> done | failed
+        self.analysis = None
+        self.cached = False
+        self.error = None
+        self.degraded = False               # failed because Gemini was unavailable
+        self.retry_after = None
+        self.created = time.monotonic()
+        self.finished = None
+        self._data = data
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    async def wait_async(self, timeout: float | None = None) -> bool:
+        """Wait on the event loop without holding a thread."""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def wake(_job):
+            loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+        self._add_done_callback(wake)
+        try:
+            await asyncio.wait_for(finished, timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.done
+
+    def _add_done_callback(self, callback):
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        # Runs on an image worker: a failing callback must not take the worker down with it
+        try:
+            callback(self)
+        except Exception as exc:
+            print(f"[IMAGE] Job {self.id} done-callback failed: {exc}")
+
+    def _finish(self, status: str):
+        with self._lock:
+            self.status = status
+            self.finished = time.monotonic()
+            self._data = None               # the upload is not needed once processed
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def to_dict(self) -> dict:
+        result = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            result.update(analysis=self.analysis, cached=self.cached)
+        elif self.status == "failed":
+            result["error"] = self.error
+            if self.degraded:
+                result["degraded"] = True
+            if self.retry_after:
+                result["retry_after"] = math.ceil(self.retry_after)
+        return result
+
+
+class ImageJobQueue:
+    """Bounded FIFO of ImageJobs served by IMAGE_WORKERS daemon threads (started on first submit)."""
+
+    def __init__(self, workers: int = IMAGE_WORKERS, max_queued: int = IMAGE_QUEUE_SIZE,
+                 ttl: float = IMAGE_JOB_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}                     # job id -> ImageJob, finished ones kept for ttl
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._average_seconds = 5.0         # per-job service time, updated as jobs finish
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._work, name=f"image-worker-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def retry_after(self) -> float:
+        """Rough seconds until a queue slot frees up."""
+        backlog = self._queue.qsize() + self._running
+        return max(1.0, backlog * self._average_seconds / max(self.workers, 1))
+
+    def submit(self, data: bytes) -> ImageJob:
+        """Queue an uploaded image; raises QueueFullError instead of waiting when there is no room."""
+        self._ensure_started()
+        self._prune()
+        job = ImageJob(data)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            IMAGE_JOBS.inc(outcome="rejected")
+            raise QueueFullError(self.retry_after()) from None
+        return job
+
+    def get(self, job_id: str) -> ImageJob | None:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            observe_stage("image_queue_wait", time.monotonic() - job.created)
+            with self._lock:
+                self._running += 1
+            job.status = "running"
+            start = time.monotonic()
+            try:
+                with stage_timer("image_decode"):
+                    image = get_pil_image().open(BytesIO(job._data))
+                    image.load()
+                job.analysis, job.cached = analyze_plant_image_dedup(image)
+                status = "done"
+            except UpstreamUnavailable as exc:
+                job.error, job.degraded, job.retry_after = str(exc), True, exc.retry_after
+                status = "failed"
+            except Exception as exc:
+                print(f"[IMAGE] Job {job.id} failed: {exc}")
+                job.error = str(exc)
+                status = "failed"
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._average_seconds += 0.2 * (time.monotonic() - start - self._average_seconds)
+            IMAGE_JOBS.inc(outcome=status)
+            job._finish(status)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "running": self._running, "workers": self.workers}
+
+
+image_jobs = ImageJobQueue()
+
+
+def _collect_image_queue():
+    stats = image_jobs.stats()
+    return [
+        ("agrobot_image_queue_depth", "gauge", "Image analysis jobs waiting for a worker.",
+         [({}, stats["queued"])]),
+        ("agrobot_image_jobs_running", "gauge", "Image analysis jobs being processed.",
+         [({}, stats["running"])]),
+    ]
+
+
+metrics_registry.register_collector(_collect_image_queue)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Crop Knowledge Base for AgroBot
+-------------------------------
+A small local library of crop / pest / disease notes (data/crop_knowledge.json)
+with a BM25 inverted index built once at startup. Chat uses it two ways:
+
+- a confident match (the crop is named, nearly every content word of the
+  question is covered by the entry's title and keywords, and the best entry
+  clearly beats the runner-up) is answered directly in a few milliseconds;
+- otherwise the top few entries are passed to Gemini as short reference
+  notes, so the model can ground a brief answer instead of writing one from
+  scratch.
+"""
+
+from collections import Counter
+import json
+import math
+import os
+import threading
+
+from metrics import register_cache, stage_timer
+from text_utils import is_follow_up, snippet, tokenize
+
+KB_ENABLED = os.getenv("KNOWLEDGE_BASE", "1") != "0"
+KB_PATH = os.getenv(
+    "KNOWLEDGE_BASE_PATH", os.path.join(os.path.dirname(__file__), "data", "crop_knowledge.json")
+)
+KB_CONTEXT_K = int(os.getenv("KB_CONTEXT_K", 3))
+# Minimum BM25 score for an entry to be used as reference context
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", 3.0))
+# Share of the question's content words that the entry's title/keywords must cover
+KB_DIRECT_COVERAGE = float(os.getenv("KB_DIRECT_COVERAGE", 0.75))
+# How far the best entry must be ahead of the second best to be answered directly
+KB_DIRECT_MARGIN = float(os.getenv("KB_DIRECT_MARGIN", 1.3))
+KB_SNIPPET_CHARS = int(os.getenv("KB_SNIPPET_CHARS", 320))
+
+_K1 = 1.5
+_B = 0.75
+_HEAD_WEIGHT = 3                            # title, crop and keywords count three times as much as the answer
+
+# Question words that say what kind of help is wanted, not what it is about
+_INTENT = {
+    "how", "what", "when", "why", "which", "where", "control", "manage", "treat", "treatment", "cure",
+    "prevent", "remedy", "solution", "problem", "issue", "help", "stop", "kill", "get", "rid", "use",
+    "getting", "see", "seeing", "plant", "disease", "pest", "spray", "organic", "method",
+}
+# Other names farmers use for the crops in the data file
+_CROP_ALIASES = {
+    "rice": {"paddy"},
+    "maize": {"corn"},
+    "brinjal": {"eggplant", "baingan"},
+    "groundnut": {"peanut"},
+    "chilli": {"chili", "chilly", "pepper", "mirchi"},
+    "mustard": {"rapeseed", "sarson"},
+}
+
+
+class KnowledgeBase:
+    """Entries plus an inverted index {term: {entry index: weighted term frequency}} scored with BM25."""
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self._postings = {}
+        self._lengths = []
+        self._heads = []                    # entry index -> set of title/crop/keyword terms
+        self._crops = []                    # entry index -> set of names the crop goes by
+        for index, entry in enumerate(entries):
+            crop = entry.get("crop", "general")
+            crops = {crop} | _CROP_ALIASES.get(crop, set()) if crop != "general" else set()
+            head = tokenize(" ".join([entry["title"], *crops, *entry.get("keywords", [])]))
+            body = tokenize(entry["answer"])
+            frequencies = Counter(body)
+            for term in head:
+                frequencies[term] += _HEAD_WEIGHT
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[index] = frequency
+            self._lengths.append(sum(frequencies.values()))
+            self._heads.append(set(head))
+            self._crops.append(crops)
+        self._average_length = sum(self._lengths) / len(self._lengths) if entries else 0.0
+        self._lock = threading.Lock()
+        self.direct_hits = 0
+        self.context_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str = KB_PATH) -> "KnowledgeBase":
+        if not KB_ENABLED:
+            return cls([])
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[KB] Knowledge base unavailable ({path}): {e}")
+            return cls([])
+        print(f"[KB] Loaded {len(entries)} entries from {os.path.basename(path)}")
+        return cls(entries)
+
+    def _idf(self, term: str) -> float:
+        matching = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self.entries) - matching + 0.5) / (matching + 0.5))
+
+    def _rank(self, query: str, k: int) -> list:
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for index, frequency in postings.items():
+                norm = _K1 * (1 - _B + _B * self._lengths[index] / self._average_length)
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (_K1 + 1) / (frequency + norm)
+        return sorted(((score, index) for index, score in scores.items()), reverse=True)[:k]
+
+    def search(self, query: str, k: int = KB_CONTEXT_K) -> list:
+        """Up to k (score, entry) pairs, best first."""
+        return [(score, self.entries[index]) for score, index in self._rank(query, k)]
+
+    def _fits_crop(self, index: int, terms: set) -> bool:
+        return not self._crops[index] or bool(terms & self._crops[index])
+
+    def _is_direct(self, terms: set, ranked: list) -> bool:
+        best_score, index = ranked[0]
+        if not self._fits_crop(index, terms):
+            return False
+        covered = len(terms & self._heads[index]) / len(terms)
+        # Entries about another crop ("aphids on wheat" for a cotton question) are not real contenders
+        runner_up = next((score for score, other in ranked[1:] if self._fits_crop(other, terms)), 0.0)
+        return covered >= KB_DIRECT_COVERAGE and best_score >= KB_DIRECT_MARGIN * runner_up
+
+    def lookup(self, question: str, has_history: bool = False) -> tuple:
+        """
+        (direct answer, reference notes) for a chat question; at most one is set.
+        Follow-up turns are never answered directly because they depend on the
+        conversation, but they still get reference notes.
+        """
+        if not self.entries:
+            return None, None
+        with stage_timer("kb_search"):
+            ranked = [(score, index) for score, index in self._rank(question, max(KB_CONTEXT_K, 5))
+                      if score >= KB_MIN_SCORE]
+            terms = set(tokenize(question)) - _INTENT
+        if not ranked:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        if len(terms) >= 2 and not is_follow_up(question, has_history) and self._is_direct(terms, ranked):
+            with self._lock:
+                self.direct_hits += 1
+            return self.entries[ranked[0][1]]["answer"], None
+
+        with self._lock:
+            self.context_hits += 1
+        # Keep the prompt short: only notes that score close to the best one
+        notes = "\n".join(
+            f"- {self.entries[index]['title']}: {snippet(self.entries[index]['answer'], KB_SNIPPET_CHARS)}"
+            for score, index in ranked[:KB_CONTEXT_K] if score >= ranked[0][0] / 2
+        )
+        return None, notes
+
+    def best_answer(self, question: str) -> str | None:
+        """Answer of the best-matching entry, confident or not (fallback while Gemini is down)."""
+        ranked = self._rank(question, 1) if self.entries else []
+        if ranked and ranked[0][0] >= KB_MIN_SCORE:
+            return self.entries[ranked[0][1]]["answer"]
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "direct_hits": self.direct_hits,
+            "context_hits": self.context_hits,
+            "misses": self.misses,
+        }
+
+
+knowledge_base = KnowledgeBase.load()
+register_cache("knowledge_base", knowledge_base.stats)
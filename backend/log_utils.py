@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Logging helpers shared by the Flask and ASGI servers.
+"""
+
+
+# Helper function for safe printing on Windows console
+def safe_print(message):
+    """Print message safely, handling Unicode encoding errors on Windows"""
+    try:
+        print(message)
+    except UnicodeEncodeError:
+        # Fallback: print ASCII-safe version
+        safe_message = message.encode('ascii', errors='ignore').decode('ascii')
+        if safe_message.strip():
+            print(safe_message)
+        else:
+            print("[Output contains non-ASCII characters]")
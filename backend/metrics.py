@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics for AgroBot
+-------------------
+Thread-safe counters, gauges and histograms rendered in the Prometheus text
+exposition format (served at /api/metrics). Besides per-endpoint request
+latency, every pipeline stage (model call, translation, gTTS synthesis,
+cache I/O, image decode, Whisper upload, ...) is timed into one histogram
+labelled by stage, and each upstream call is counted by outcome. Caches
+register their stats() so hit rates show up next to the latencies.
+"""
+
+from contextlib import contextmanager
+import functools
+import inspect
+import threading
+import time
+
+# Seconds; covers cache hits (ms) up to slow Gemini/Whisper calls (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        metrics_registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(state["counts"]), state["sum"], state["count"])
+                        for key, state in self._values.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds metrics plus collectors that report values owned by other modules (e.g. cache stats)."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        """collector() returns a list of (name, kind, documentation, [(labels, value), ...])."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        families = [(m.name, m.kind, m.documentation, [(n, l, v) for n, l, v in m.samples()])
+                    for m in self._metrics]
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, values in collector():
+                    families.append((name, kind, documentation, [(name, l, v) for l, v in values]))
+            except Exception as e:
+                print(f"[METRICS] Collector failed: {e}")
+
+        # Collectors may report the same family for several caches; merge them under one header
+        merged = {}
+        for name, kind, documentation, samples in families:
+            if name in merged:
+                merged[name][2].extend(samples)
+            else:
+                merged[name] = (kind, documentation, list(samples))
+
+        for name, (kind, documentation, samples) in merged.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = Counter("agrobot_http_requests_total", "HTTP requests by endpoint, method and status.",
+                   ("endpoint", "method", "status"))
+REQUEST_LATENCY = Histogram("agrobot_http_request_duration_seconds",
+                            "Time to handle an HTTP request (Flask: until the response headers are ready).",
+                            ("endpoint",))
+IN_FLIGHT = Gauge("agrobot_http_requests_in_flight", "HTTP requests currently being handled.")
+STAGE_LATENCY = Histogram("agrobot_stage_duration_seconds",
+                          "Time spent in one stage of the request pipeline.", ("stage",))
+UPSTREAM_CALLS = Counter("agrobot_upstream_calls_total",
+                         "Calls to upstream services by outcome.", ("upstream", "outcome"))
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float):
+    REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    REQUEST_LATENCY.observe(seconds, endpoint=endpoint)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.observe(seconds, stage=stage)
+
+
+def stage_timer(stage: str):
+    """Context manager timing a block into agrobot_stage_duration_seconds{stage=...}."""
+    return STAGE_LATENCY.time(stage=stage)
+
+
+@contextmanager
+def upstream_call(upstream: str):
+    """Count one upstream call as ok or error depending on whether the block raises."""
+    try:
+        yield
+    except Exception:
+        UPSTREAM_CALLS.inc(upstream=upstream, outcome="error")
+        raise
+    UPSTREAM_CALLS.inc(upstream=upstream, outcome="ok")
+
+
+def timed(stage: str):
+    """Decorator: time every call of a function (sync or async) as a pipeline stage."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_cache(cache_name: str, stats):
+    """
+    Export a cache's stats() dict. Keys ending in hits/misses/evictions become
+    agrobot_cache_<key>_total counters; other numbers become agrobot_cache_<key> gauges.
+    """
+    def collect():
+        families = []
+        for key, value in stats().items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key.endswith(("hits", "misses", "evictions")):
+                families.append((f"agrobot_cache_{key}_total", "counter",
+                                 f"Cache {key.replace('_', ' ')} since startup.", [({"cache": cache_name}, value)]))
+            else:
+                families.append((f"agrobot_cache_{key}", "gauge",
+                                 f"Cache {key.replace('_', ' ')}.", [({"cache": cache_name}, value)]))
+        return families
+
+    metrics_registry.register_collector(collect)
+
+
+def render_metrics() -> str:
+    return metrics_registry.render()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+MP3 Utilities for AgroBot
+-------------------------
+Joins MP3 clips synthesized separately (one per sentence group) into one
+playable clip. MPEG audio is a plain sequence of self-contained frames, so
+clips can be concatenated once the per-file extras are removed: ID3 tags at
+either end and the Xing/Info header frame, whose frame count and duration
+would describe only the first clip. Input that does not look like MP3 is
+passed through unchanged.
+"""
+
+# Layer III bitrates in kbit/s by bitrate index, for MPEG-1 and for MPEG-2/2.5
+_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),               # MPEG-1
+    2: (22050, 24000, 16000),               # MPEG-2
+    0: (11025, 12000, 8000),                # MPEG-2.5
+}
+
+
+def _strip_id3(data: bytes) -> bytes:
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def _frame_length(data: bytes) -> int:
+    """Length of the Layer III frame starting at data[0], or 0 if there is none."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return 0
+    version = (data[1] >> 3) & 0x03
+    layer = (data[1] >> 1) & 0x03
+    bitrate_index = data[2] >> 4
+    rate_index = (data[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    bitrate = _BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (data[2] >> 1) & 0x01
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrate // sample_rate + padding
+
+
+def audio_frames(data: bytes) -> bytes:
+    """The clip's audio frames without ID3 tags or a leading Xing/Info header frame."""
+    data = _strip_id3(data)
+    length = _frame_length(data)
+    # The tag sits right after the side information, well inside the first 64 bytes
+    if length and (b"Xing" in data[:min(length, 64)] or b"Info" in data[:min(length, 64)]):
+        data = data[length:]
+    return data
+
+
+def join_mp3(clips: list) -> bytes:
+    """Concatenate MP3 clips, in order, into one clip."""
+    if len(clips) == 1:
+        return clips[0]
+    return b"".join(audio_frames(clip) for clip in clips)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Provider Registry for AgroBot
+-----------------------------
+Single place where .env is loaded and where upstream SDKs are imported
+and connected. Each provider is created on first use, so importing the
+backend stays fast and a missing API key only fails the endpoints that
+need it instead of the whole server.
+
+Set AGROBOT_WARMUP=1 to load every provider (and pre-open connections)
+in the background right after startup.
+
+The *_BASE_URL variables point the providers at other hosts, e.g. the
+local stand-ins in upstream_stubs.py used for offline load tests.
+"""
+
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+from resilience import UPSTREAM_TIMEOUTS
+
+load_dotenv()
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# Upstream hosts (unset = the provider's public API)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+TRANSLATE_BASE_URL = os.getenv("TRANSLATE_BASE_URL")      # Google Translate web + gTTS
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org")
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when an upstream provider cannot be initialized (e.g. missing API key)."""
+
+
+def _require_env(name: str) -> str:
+    value = os.getenv(name)
+    if not value:
+        raise ProviderUnavailableError(f"{name} is missing. Please add it to your .env file.")
+    return value
+
+
+class ProviderRegistry:
+    """Lazily constructed, process-wide upstream clients."""
+
+    def __init__(self):
+        self._factories = {}
+        self._warmers = {}
+        self._instances = {}
+        self._init_ms = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory, warm=None):
+        """Register a zero-argument factory and an optional warm(instance) connection opener."""
+        self._factories[name] = factory
+        if warm is not None:
+            self._warmers[name] = warm
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._init_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+                print(f"[PROVIDERS] {name} ready in {self._init_ms[name]} ms")
+            return self._instances[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def warm_up(self, names=None) -> dict:
+        """Initialize providers and pre-open their connections; returns per-provider status."""
+        report = {}
+        for name in names or list(self._factories):
+            start = time.perf_counter()
+            try:
+                instance = self.get(name)
+                if name in self._warmers:
+                    self._warmers[name](instance)
+                report[name] = f"ok ({round((time.perf_counter() - start) * 1000, 1)} ms)"
+            except Exception as exc:
+                report[name] = f"unavailable: {exc}"
+        print(f"[PROVIDERS] Warm-up finished: {report}")
+        return report
+
+    def warm_up_in_background(self):
+        threading.Thread(target=self.warm_up, name="provider-warmup", daemon=True).start()
+
+    def status(self) -> dict:
+        return {name: ("loaded" if name in self._instances else "lazy") for name in self._factories}
+
+
+registry = ProviderRegistry()
+
+
+# -------------------------------------------------------
+# Provider factories (heavy imports happen here, on first use)
+# -------------------------------------------------------
+def _gemini():
+    import google.generativeai as genai
+
+    if GEMINI_BASE_URL:
+        # Custom hosts are reached over REST; the async (gRPC) client is not available this way
+        genai.configure(api_key=_require_env("GOOGLE_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": GEMINI_BASE_URL})
+    else:
+        genai.configure(api_key=_require_env("GOOGLE_API_KEY"))
+    return genai
+
+
+def _warm_gemini(genai):
+    genai.get_model(f"models/{GEMINI_MODEL}")
+
+
+def _groq():
+    from groq import Groq
+
+    return Groq(api_key=_require_env("GROQ_API_KEY"), base_url=GROQ_BASE_URL,
+                timeout=UPSTREAM_TIMEOUTS["groq"])
+
+
+def _warm_groq(client):
+    client.models.list()
+
+
+def _groq_async():
+    from groq import AsyncGroq
+
+    return AsyncGroq(api_key=_require_env("GROQ_API_KEY"), base_url=GROQ_BASE_URL,
+                     timeout=UPSTREAM_TIMEOUTS["groq"])
+
+
+def _gtts():
+    from gtts import gTTS
+
+    if TRANSLATE_BASE_URL:
+        import gtts.tts
+
+        # gTTS builds its endpoint from a fixed https://translate.google.<tld> template
+        gtts.tts._translate_url = lambda tld="com", path="": f"{TRANSLATE_BASE_URL}/{path}"
+    return gTTS
+
+
+def _translator():
+    from deep_translator import GoogleTranslator
+
+    if not TRANSLATE_BASE_URL:
+        return GoogleTranslator
+
+    class _RedirectedTranslator(GoogleTranslator):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._base_url = f"{TRANSLATE_BASE_URL}/m"
+
+    return _RedirectedTranslator
+
+
+def _weather_http():
+    import httpx
+
+    return httpx.Client(
+        timeout=UPSTREAM_TIMEOUTS["openweather"],
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+
+
+def _warm_weather_http(client):
+    # Any response (even 401 without a key) leaves a warm keep-alive connection in the pool
+    client.get(f"{OPENWEATHER_BASE_URL}/data/2.5/weather")
+
+
+def _pil_image():
+    from PIL import Image
+
+    return Image
+
+
+registry.register("gemini", _gemini, warm=_warm_gemini)
+registry.register("groq", _groq, warm=_warm_groq)
+registry.register("groq_async", _groq_async)
+registry.register("gtts", _gtts)
+registry.register("translator", _translator)
+registry.register("weather_http", _weather_http, warm=_warm_weather_http)
+registry.register("pil", _pil_image)
+
+
+def get_gemini():
+    """The configured google.generativeai module."""
+    return registry.get("gemini")
+
+
+def get_groq_client():
+    return registry.get("groq")
+
+
+def get_groq_async_client():
+    return registry.get("groq_async")
+
+
+def get_gtts():
+    """The gTTS class."""
+    return registry.get("gtts")
+
+
+def get_translator_class():
+    """deep_translator.GoogleTranslator."""
+    return registry.get("translator")
+
+
+def get_weather_http_client():
+    """Shared keep-alive httpx.Client for OpenWeather."""
+    return registry.get("weather_http")
+
+
+def get_pil_image():
+    """The PIL.Image module."""
+    return registry.get("pil")
+
+
+def _collect_provider_status():
+    return [("agrobot_provider_loaded", "gauge", "1 once the upstream provider has been initialized.",
+             [({"provider": name}, int(state == "loaded")) for name, state in registry.status().items()])]
+
+
+metrics_registry.register_collector(_collect_provider_status)
+
+
+def warm_up_if_configured():
+    """Server startup hook: pre-load providers in the background when AGROBOT_WARMUP=1."""
+    if os.getenv("AGROBOT_WARMUP") == "1":
+        registry.warm_up_in_background()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Limiting for AgroBot
+-------------------------
+Thread-safe token bucket used to keep upstream calls under a rate budget.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate` operations per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available right now; never blocks."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` would be available (0 if they already are)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+            return max(missing / self.rate, 0.0) if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until tokens are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
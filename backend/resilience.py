@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Upstream Resilience for AgroBot
+-------------------------------
+Every call to Gemini, Groq, Google Translate, gTTS and OpenWeather goes
+through an Upstream, which gives it:
+
+- a deadline: the caller gets UpstreamTimeout after UPSTREAM_TIMEOUTS[name]
+  seconds even if the SDK itself would keep waiting (the SDK call is also
+  given a native timeout where it has one, see providers.py);
+- hedging for idempotent calls (translate, gTTS, weather): if the first
+  attempt is slower than the upstream's recent p95, a second identical
+  request is sent and whichever answers first wins;
+- a circuit breaker: after CIRCUIT_FAILURE_THRESHOLD consecutive failures
+  (timeouts, connection errors, 5xx and 429 answers; a 4xx or invalid-input
+  error means the request was bad, not the upstream) the upstream is skipped for CIRCUIT_RESET_SECONDS (CircuitOpenError) and
+  callers fall back to a degraded response, then one probe call decides
+  whether it is healthy again.
+
+Upstream.call / call_async wrap one unary call; Upstream.guard() wraps
+streaming calls, which only get the breaker and their native timeout.
+Unary calls also feed a recent-latency average (timeouts included), which
+admission control (admission.py) uses to shed load early.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import asyncio
+import os
+import threading
+import time
+
+from metrics import Counter, UPSTREAM_CALLS, metrics_registry, upstream_call
+
+# Seconds before a caller stops waiting for each upstream
+UPSTREAM_TIMEOUTS = {
+    "gemini": float(os.getenv("GEMINI_TIMEOUT", 30)),
+    "groq": float(os.getenv("GROQ_TIMEOUT", 30)),
+    "translate": float(os.getenv("TRANSLATE_TIMEOUT", 8)),
+    "gtts": float(os.getenv("GTTS_TIMEOUT", 15)),
+    "openweather": float(os.getenv("OPENWEATHER_TIMEOUT", 10)),
+}
+# Idempotent upstreams that may receive a duplicate (hedged) request, with the
+# delay used until enough latencies have been seen to estimate their p95
+HEDGE_INITIAL_DELAYS = {"translate": 1.0, "gtts": 2.0, "openweather": 1.0}
+HEDGING_ENABLED = os.getenv("UPSTREAM_HEDGING", "1") != "0"
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.05))          # seconds
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+# Threads per upstream that run deadline-bound sync calls; a hung SDK call holds one until its
+# native timeout. Each upstream has its own pool, so a slow one cannot starve the others.
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", 32))
+
+_LATENCY_WINDOW = 200
+_MIN_SAMPLES = 20
+_LATENCY_STALE = 60.0                       # seconds after which the recent-latency average no longer counts
+
+HEDGED_CALLS = Counter("agrobot_upstream_hedged_total",
+                       "Hedged duplicate requests by upstream; winner is primary or hedge.",
+                       ("upstream", "winner"))
+DEGRADED_RESPONSES = Counter("agrobot_degraded_responses_total",
+                             "Responses served in degraded form because an upstream was unavailable.",
+                             ("feature",))
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream could not be used for this request (timed out or circuit open)."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(UpstreamUnavailable):
+    """The call did not finish before the upstream's deadline."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """The upstream failed repeatedly and is being skipped for a while."""
+
+
+# Exception classes (or their bases) of the SDKs that mean the service could not be reached:
+# httpx, the Groq SDK, Deep Translator's non-200 / rate-limit errors
+_UNREACHABLE_ERRORS = {"TransportError", "APIConnectionError", "RequestError", "TooManyRequests"}
+
+
+def _status_code(exc: BaseException) -> int | None:
+    """HTTP status behind an SDK error, wherever the SDK keeps it."""
+    for holder in (exc, getattr(exc, "response", None), getattr(exc, "rsp", None)):
+        status = getattr(holder, "status_code", None)
+        if isinstance(status, int):
+            return status
+    code = getattr(exc, "code", None)           # google.api_core errors carry the HTTP status as .code
+    return code if isinstance(code, int) else None
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """True if the error says the upstream is unhealthy (timeout, connection, 5xx, 429) rather than the request."""
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError, UpstreamTimeout)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status >= 500 or status == 429
+    if isinstance(exc, OSError) or any(cls.__name__ in _UNREACHABLE_ERRORS for cls in type(exc).__mro__):
+        return True
+    # SDK errors that wrap the real cause (gTTS raises gTTSError while handling a requests error)
+    cause = exc.__cause__ or exc.__context__
+    return cause is not None and is_upstream_failure(cause)
+
+
+def note_degraded(feature: str):
+    """Count one response that was served without its upstream."""
+    DEGRADED_RESPONSES.inc(feature=feature)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open (fail fast) -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (does not use up the half-open probe)."""
+        return self.state == "open" and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """The call ended without a verdict (caller went away); let another request probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """Returns True when this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class Upstream:
+    """Deadline, optional hedging and a circuit breaker for one upstream service."""
+
+    def __init__(self, name: str, timeout: float, hedge_initial_delay: float | None = None,
+                 workers: int = UPSTREAM_WORKERS):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_initial_delay = hedge_initial_delay if HEDGING_ENABLED else None
+        self.breaker = CircuitBreaker()
+        # Bulkhead: sync calls (and their hedges) only ever wait for this upstream's own threads
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"upstream-{name}")
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._recent_latency = 0.0          # moving average of unary calls, failures and timeouts included
+        self._latency_at = 0.0
+
+    def hedge_delay(self) -> float | None:
+        """Recent p95 latency of successful calls (None if this upstream is not hedged)."""
+        if self.hedge_initial_delay is None:
+            return None
+        samples = sorted(self._latencies)
+        if len(samples) < _MIN_SAMPLES:
+            return self.hedge_initial_delay
+        return min(max(samples[int(len(samples) * 0.95) - 1], HEDGE_MIN_DELAY), self.timeout)
+
+    @contextmanager
+    def guard(self):
+        """Circuit breaker around a block that talks to this upstream (also counts it as ok/error)."""
+        if not self.breaker.allow():
+            UPSTREAM_CALLS.inc(upstream=self.name, outcome="rejected")
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable",
+                                   retry_after=self.breaker.retry_after())
+        start = time.perf_counter()
+        try:
+            with upstream_call(self.name):
+                yield
+        except Exception as exc:
+            if not is_upstream_failure(exc):
+                # The upstream answered; the request itself was rejected (bad input, 4xx)
+                self.breaker.record_success()
+                raise
+            if self.breaker.record_failure():
+                print(f"[RESILIENCE] Circuit for {self.name} opened after {self.breaker.failures} failure(s)")
+            raise
+        except BaseException:
+            # Abandoned stream or cancelled task: says nothing about the upstream's health
+            self.breaker.release()
+            raise
+        self._latencies.append(time.perf_counter() - start)
+        self.breaker.record_success()
+
+    def recent_latency(self) -> float:
+        """Average duration of recent unary calls in seconds (0 when there have been none lately)."""
+        if time.monotonic() - self._latency_at > _LATENCY_STALE:
+            return 0.0
+        return self._recent_latency
+
+    def _observe_latency(self, seconds: float):
+        if time.monotonic() - self._latency_at > _LATENCY_STALE:
+            self._recent_latency = seconds
+        else:
+            self._recent_latency += 0.2 * (seconds - self._recent_latency)
+        self._latency_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        """Run a blocking call with this upstream's deadline, hedging and breaker."""
+        with self.guard():
+            start = time.perf_counter()
+            try:
+                return self._run(fn, args, kwargs)
+            finally:
+                self._observe_latency(time.perf_counter() - start)
+
+    def _run(self, fn, args, kwargs):
+        deadline = time.monotonic() + self.timeout
+        attempts = [self._executor.submit(fn, *args, **kwargs)]
+        delay = self.hedge_delay()
+        if delay is not None and delay < self.timeout:
+            done, _ = wait(attempts, timeout=delay)
+            if not done:
+                attempts.append(self._executor.submit(fn, *args, **kwargs))
+
+        error = None
+        pending = list(attempts)
+        while pending:
+            done, _ = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for attempt in done:
+                pending.remove(attempt)
+                if attempt.exception() is None:
+                    self._count_hedge(attempts, attempt)
+                    for other in pending:
+                        other.cancel()
+                    return attempt.result()
+                error = attempt.exception()
+        if error is not None and not pending:
+            raise error
+        for attempt in pending:
+            attempt.cancel()                # still queued: nobody will wait for it any more
+        raise UpstreamTimeout(f"{self.name} did not respond within {self.timeout:g}s")
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) with this upstream's deadline, hedging and breaker."""
+        with self.guard():
+            start = time.perf_counter()
+            try:
+                return await self._run_async(fn, args, kwargs)
+            finally:
+                self._observe_latency(time.perf_counter() - start)
+
+    async def _run_async(self, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        attempts = [asyncio.ensure_future(fn(*args, **kwargs))]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < self.timeout:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    attempts.append(asyncio.ensure_future(fn(*args, **kwargs)))
+
+            error = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for attempt in done:
+                    if attempt.exception() is None:
+                        self._count_hedge(attempts, attempt)
+                        return attempt.result()
+                    error = attempt.exception()
+            if error is not None and not pending:
+                raise error
+            raise UpstreamTimeout(f"{self.name} did not respond within {self.timeout:g}s")
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    def _count_hedge(self, attempts: list, winner):
+        if len(attempts) > 1:
+            HEDGED_CALLS.inc(upstream=self.name, winner="primary" if winner is attempts[0] else "hedge")
+
+    def status(self) -> dict:
+        delay = self.hedge_delay()
+        state = self.breaker.state
+        if state == "open" and not self.breaker.is_open():
+            state = "half_open"             # the next call will be let through as a probe
+        return {
+            "circuit": state,
+            "timeout_s": self.timeout,
+            "hedge_after_ms": round(delay * 1000, 1) if delay is not None else None,
+            "recent_latency_ms": round(self.recent_latency() * 1000, 1),
+        }
+
+
+upstreams = {name: Upstream(name, timeout, HEDGE_INITIAL_DELAYS.get(name))
+             for name, timeout in UPSTREAM_TIMEOUTS.items()}
+
+
+def upstream(name: str) -> Upstream:
+    return upstreams[name]
+
+
+def upstream_status() -> dict:
+    """Per-upstream circuit state and deadlines, for /api/health."""
+    return {name: u.status() for name, u in upstreams.items()}
+
+
+def _collect_circuit_state():
+    return [("agrobot_upstream_circuit_open", "gauge", "1 while the upstream's circuit breaker is not closed.",
+             [({"upstream": name}, int(u.breaker.state != "closed")) for name, u in upstreams.items()])]
+
+
+metrics_registry.register_collector(_collect_circuit_state)
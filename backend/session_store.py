@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Chat Session Store for AgroBot
+------------------------------
+Keeps a bounded conversation history per client session id.
+Idle sessions expire after a TTL and the least recently used ones are
+evicted once the session count or memory cap is reached.
+
+Each session holds the most recent turns verbatim plus a rolling summary of
+the older ones. Once the history would cost more than CHAT_TOKEN_BUDGET
+prompt tokens (or holds more than CHAT_HISTORY_TURNS exchanges), the oldest
+exchanges are folded into the summary, so every chat request sends a prompt
+of roughly constant size however long the conversation runs. The summary is
+built locally from the folded turns (the farmer's question and the first
+sentence of the answer), so compaction never costs an extra model call.
+"""
+
+import os
+import threading
+
+from cache_utils import LRUCache
+from metrics import Counter, register_cache
+from text_utils import snippet
+
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 5000))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", 3600))          # seconds idle
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", 6))         # user+model pairs kept verbatim
+CHAT_SESSION_MEMORY_MB = int(os.getenv("CHAT_SESSION_MEMORY_MB", 64))
+CHAT_MAX_TURN_CHARS = int(os.getenv("CHAT_MAX_TURN_CHARS", 2000))
+# Prompt tokens the summary plus the verbatim turns may use before older turns are folded
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", 1200))
+CHAT_SUMMARY_CHARS = int(os.getenv("CHAT_SUMMARY_CHARS", 1200))
+
+_QUESTION_CHARS = 160
+_ADVICE_CHARS = 200
+_SUMMARY_INTRO = "Summary of our earlier conversation:\n"
+_SUMMARY_ACK = "Understood, I will keep that in mind."
+
+SESSION_COMPACTIONS = Counter("agrobot_chat_compactions_total",
+                              "Chat exchanges folded from verbatim history into the rolling summary.")
+
+# Characters per prompt token, recalibrated from the token counts Gemini reports
+_chars_per_token = 4.0
+_calibration_lock = threading.Lock()
+
+
+def record_prompt_tokens(chars: int, tokens: int):
+    """Feed one measured (prompt characters, prompt tokens) pair into the token estimate."""
+    global _chars_per_token
+    if chars <= 0 or tokens <= 0:
+        return
+    with _calibration_lock:
+        _chars_per_token += 0.1 * (chars / tokens - _chars_per_token)
+
+
+def estimate_tokens(chars: int) -> int:
+    return int(chars / _chars_per_token) + 1
+
+
+def history_chars(history: list) -> int:
+    return sum(len(part) for turn in history for part in turn["parts"])
+
+
+def _session_size(state) -> int:
+    return len(state["summary"]) + history_chars(state["turns"])
+
+
+def _fold(summary: str, user_turn: dict, model_turn: dict) -> str:
+    """Add one exchange to the summary, dropping its oldest lines once it is over CHAT_SUMMARY_CHARS."""
+    question = " ".join(user_turn["parts"][0].split())[:_QUESTION_CHARS]
+    advice = snippet(" ".join(model_turn["parts"][0].split()), _ADVICE_CHARS)[:_ADVICE_CHARS]
+    lines = summary.splitlines() + [f"- Farmer asked: {question} | Advice: {advice}"]
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > CHAT_SUMMARY_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class SessionStore:
+    """Per-session rolling summary plus recent turns, served as Gemini {"role", "parts"} history."""
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, ttl: int = CHAT_SESSION_TTL,
+                 max_turns: int = CHAT_HISTORY_TURNS, memory_cap_mb: int = CHAT_SESSION_MEMORY_MB,
+                 token_budget: int = CHAT_TOKEN_BUDGET):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self._cache = LRUCache(
+            max_items=max_sessions,
+            max_bytes=memory_cap_mb * 1024 * 1024,
+            ttl=ttl,
+            sizeof=_session_size,
+        )
+        self._lock = threading.Lock()
+
+    def get_history(self, session_id: str | None) -> list:
+        """Return a copy of the session's history (empty for anonymous requests)."""
+        if not session_id:
+            return []
+        state = self._cache.get(session_id)
+        if state is None:
+            return []
+        history = []
+        if state["summary"]:
+            # Gemini histories alternate user/model, so the summary goes in as one acknowledged exchange
+            history.append({"role": "user", "parts": [_SUMMARY_INTRO + state["summary"]]})
+            history.append({"role": "model", "parts": [_SUMMARY_ACK]})
+        return history + state["turns"]
+
+    def _over_budget(self, summary: str, turns: list) -> bool:
+        if len(turns) > 2 * self.max_turns:
+            return True
+        summary_chars = len(_SUMMARY_INTRO) + len(summary) + len(_SUMMARY_ACK) if summary else 0
+        return estimate_tokens(summary_chars + history_chars(turns)) > self.token_budget
+
+    def append_turn(self, session_id: str | None, user_text: str, model_text: str):
+        """Record one exchange, folding the oldest ones into the summary while over budget."""
+        if not session_id:
+            return
+        with self._lock:
+            state = self._cache.get(session_id) or {"summary": "", "turns": []}
+            summary = state["summary"]
+            turns = state["turns"] + [
+                {"role": "user", "parts": [user_text[:CHAT_MAX_TURN_CHARS]]},
+                {"role": "model", "parts": [model_text[:CHAT_MAX_TURN_CHARS]]},
+            ]
+            folded = 0
+            # The newest exchange always stays verbatim
+            while len(turns) > 2 and self._over_budget(summary, turns):
+                summary = _fold(summary, turns[0], turns[1])
+                turns = turns[2:]
+                folded += 1
+            if folded:
+                SESSION_COMPACTIONS.inc(folded)
+            # Re-setting recomputes the entry size and refreshes its TTL
+            self._cache.set(session_id, {"summary": summary, "turns": turns})
+
+    def reset(self, session_id: str | None):
+        if session_id:
+            self._cache.pop(session_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+sessions = SessionStore()
+register_cache("sessions", sessions.stats)
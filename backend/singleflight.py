@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Request Coalescing for AgroBot
+------------------------------
+Single-flight groups: while a call for some key is in flight, identical
+calls wait for it and share its result (or its exception) instead of going
+upstream again. Used in front of weather lookups, text-to-speech and image
+analysis, where a whole village tends to ask the same thing at once.
+
+SingleFlight is for threads (Flask, thread pools); AsyncSingleFlight is for
+coroutines on the ASGI event loop.
+"""
+
+import asyncio
+import threading
+
+from metrics import Counter
+
+SINGLEFLIGHT_CALLS = Counter("agrobot_singleflight_calls_total",
+                             "Coalesced calls by group; role is leader (went upstream) or follower (shared).",
+                             ("group", "role"))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "traceback")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.traceback = None
+
+
+class SingleFlight:
+    """Run fn once per key at a time across threads; concurrent callers share the outcome."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        SINGLEFLIGHT_CALLS.inc(group=self.name, role="leader" if leader else "follower")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                # Each follower re-raises the leader's exception; start from the leader's traceback
+                raise call.error.with_traceback(call.traceback)
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error, call.traceback = e, e.__traceback__
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Coroutine version of SingleFlight. The shared call runs as its own task,
+    so a caller that disconnects (and is cancelled) does not cancel it for the
+    others still waiting.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self._forget(key, done))
+        SINGLEFLIGHT_CALLS.inc(group=self.name, role="leader" if leader else "follower")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()                # retrieved here so an unawaited failure is not logged as lost
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
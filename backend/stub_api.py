@@ -1,5 +1,9 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, Response
+from urllib.parse import quote
 import base64
+import json
+
+from knowledge_base import KB_MIN_SCORE, knowledge_base
 
 app = Flask(__name__)
 
@@ -9,6 +13,7 @@ def add_cors_headers(response: 'flask.wrappers.Response'):
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     response.headers['Access-Control-Allow-Methods'] = 'GET,POST,OPTIONS'
+    response.headers['Access-Control-Expose-Headers'] = 'X-Translated-Text, X-Language'
     return response
 
 
@@ -23,28 +28,32 @@ def chat():
     message = data.get('message', '')
     if not message:
         return jsonify({"error": "Message is required"}), 400
-    # Provide a helpful, realistic response when user asks about tomato diseases
-    lower = message.lower()
-    if 'tomato' in lower:
-        reply = (
-            "Common tomato diseases: Early blight (Alternaria), Late blight (Phytophthora), "
-            "Septoria leaf spot, Fusarium wilt, Verticillium wilt, Bacterial spot/speck, Tomato mosaic virus, "
-            "Powdery mildew, and Blossom end rot (physiological).\n\n"
-            "Short remedies: For fungal leaf spots (early/late blight, Septoria): remove infected leaves, improve air flow, "
-            "avoid overhead watering, rotate crops, and use organic fungicides like copper or neem if needed.\n\n"
-            "For wilts (Fusarium/Verticillium): plant resistant varieties, solarize soil if possible, remove severely infected plants, "
-            "and avoid planting tomatoes in the same spot for several seasons.\n\n"
-            "For bacterial diseases: remove and destroy infected plants, avoid working when plants are wet, use clean seed and tools.\n\n"
-            "For blossom end rot: ensure even calcium in soil and consistent watering; mulch and avoid over-fertilizing.\n\n"
-            "If you want, upload a clear photo of the affected plant and I can give a more specific diagnosis."
-        )
-        return jsonify({"response": reply})
+    # Answer from the local crop knowledge base when a note matches, like the real backend
+    matches = knowledge_base.search(message, k=1)
+    if matches and matches[0][0] >= KB_MIN_SCORE:
+        return jsonify({"response": matches[0][1]["answer"]})
 
     # Default echo-ish response
     reply = f"(stub) I received your message: {message[:200]}"
     return jsonify({"response": reply})
 
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json or {}
+    message = data.get('message', '')
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+    reply = f"(stub) I received your message: {message[:200]}"
+
+    def generate():
+        for word in reply.split(' '):
+            yield f"event: delta\ndata: {json.dumps({'text': word + ' '})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'response': reply})}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream')
+
+
 @app.route('/api/transcribe', methods=['POST'])
 def transcribe():
     # Return a fixed transcription for testing
@@ -61,28 +70,94 @@ def tts():
     return jsonify({"audio": None, "translated_text": text, "format": None})
 
 
+@app.route('/api/tts/stream', methods=['GET', 'POST'])
+def tts_stream():
+    data = (request.json or {}) if request.method == 'POST' else request.args
+    text = data.get('text', '')
+    if not text:
+        return jsonify({"error": "Text is required"}), 400
+    # Empty audio body; the translated text header is what the frontend needs
+    response = Response(b'', mimetype='audio/mpeg')
+    response.headers['X-Translated-Text'] = quote(text)
+    response.headers['X-Language'] = data.get('language', 'en')
+    return response
+
+
+@app.route('/api/audio/<key>.mp3', methods=['GET'])
+def audio(key):
+    # Empty clip, like /api/tts/stream: the stub has no synthesized audio to serve
+    response = Response(b'', mimetype='audio/mpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/api/voice', methods=['POST'])
+def voice():
+    # Fixed transcription plus echo answer; no audio so frontend can use browser TTS
+    return jsonify({
+        "text": "this is a stub transcription",
+        "language": request.form.get('language', 'en'),
+        "response": "(stub) I received your voice message.",
+        "translated_text": "(stub) I received your voice message.",
+        "audio": None,
+        "format": None,
+        "timings": {}
+    })
+
+
+_STUB_ANALYSIS = "(stub) Plant looks healthy. No disease detected."
+
+
 @app.route('/api/analyze-image', methods=['POST'])
 def analyze_image():
     # Return a stub analysis
-    return jsonify({"analysis": "(stub) Plant looks healthy. No disease detected."})
+    return jsonify({"analysis": _STUB_ANALYSIS, "cached": False})
+
+
+@app.route('/api/analyze-image/jobs', methods=['POST'])
+def analyze_image_submit():
+    # Jobs finish instantly in the stub
+    return jsonify({"job_id": "stub", "status": "done", "analysis": _STUB_ANALYSIS, "cached": False,
+                    "poll_url": "/api/analyze-image/jobs/stub"}), 202
+
+
+@app.route('/api/analyze-image/jobs/<job_id>', methods=['GET'])
+def analyze_image_job(job_id):
+    return jsonify({"job_id": job_id, "status": "done", "analysis": _STUB_ANALYSIS, "cached": False})
+
+
+_STUB_WEATHER = {
+    "context": "Local weather for demo farm: Clear sky, 30°C, humidity 55%, wind 8 km/h. Soil moisture is moderate, irrigate lightly tonight.",
+    "details": {
+        "location": "Demo Farm",
+        "temperature": 30,
+        "humidity": 55,
+        "feels_like": 31,
+        "pressure": 1008,
+        "wind_speed": 8,
+        "description": "Clear sky",
+        "rain_mm": 0,
+        "soil_moisture_hint": "Soil moisture is moderate, check before irrigating"
+    }
+}
 
 
 @app.route('/api/weather', methods=['GET'])
 def weather():
-    return jsonify({
-        "context": "Local weather for demo farm: Clear sky, 30°C, humidity 55%, wind 8 km/h. Soil moisture is moderate, irrigate lightly tonight.",
-        "details": {
-            "location": "Demo Farm",
-            "temperature": 30,
-            "humidity": 55,
-            "feels_like": 31,
-            "pressure": 1008,
-            "wind_speed": 8,
-            "description": "Clear sky",
-            "rain_mm": 0,
-            "soil_moisture_hint": "Soil moisture is moderate, check before irrigating"
-        }
-    })
+    return jsonify(_STUB_WEATHER)
+
+
+@app.route('/api/farms', methods=['POST'])
+def farms_register():
+    farms = (request.json or {}).get('farms') or []
+    return jsonify({"registered": len(farms), "errors": {}, "farms": len(farms)})
+
+
+@app.route('/api/weather/bulk', methods=['POST'])
+def weather_bulk():
+    farm_ids = (request.json or {}).get('farms') or []
+    results = {str(farm_id): {"status": "ready", **_STUB_WEATHER, "forecast": [], "age_s": 0} for farm_id in farm_ids}
+    return jsonify({"farms": results, "ready": len(results), "pending": 0, "unknown": 0})
 
 
 if __name__ == '__main__':
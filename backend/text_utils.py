@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Text Utilities for AgroBot
+--------------------------
+Word normalization and follow-up detection shared by the FAQ cache and the crop
+knowledge base, so a question is reduced to the same content words everywhere,
+plus sentence-level trimming for notes and conversation summaries.
+"""
+
+import re
+
+WORD = re.compile(r"[^\W_]+", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Politeness and function words that do not change what is being asked
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "be", "do", "does", "did", "i", "me", "my", "we", "our",
+    "you", "your", "can", "could", "would", "should", "shall", "will", "please", "pls", "kindly", "tell",
+    "hi", "hello", "sir", "madam", "to", "of", "for", "on", "in", "at", "with", "and", "or", "about",
+    "give", "suggest", "know", "want", "need", "some", "any", "best", "good", "way", "ways",
+    "crop", "crops", "field", "farm",
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "there", "here", "so", "if",
+    "as", "by", "from", "into", "than", "very", "just", "been", "were", "has", "have", "had", "then",
+}
+
+_IRREGULAR = {"leaves": "leaf", "knives": "knife", "potatoes": "potato", "tomatoes": "tomato"}
+
+
+def stem(word: str) -> str:
+    """Plural-insensitive without a stemmer dependency: aphids -> aphid, flies -> fly."""
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list:
+    """Lowercased, singularized content words in order (repeats kept)."""
+    return [stem(w) for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def snippet(text: str, limit: int) -> str:
+    """Whole sentences from the start of text, up to about limit characters."""
+    kept = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if kept and sum(len(s) + 1 for s in kept) + len(sentence) > limit:
+            break
+        kept.append(sentence)
+    return " ".join(kept)
+
+# Words that point back at an earlier turn
+_REFERENCES = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "there", "same", "also",
+    "else", "more", "above", "previous", "earlier", "again", "instead", "then",
+}
+_FOLLOW_UP_OPENERS = ("what about", "how about", "and ", "but ", "also ", "then ", "what if", "why not")
+
+
+def is_follow_up(question: str, has_history: bool) -> bool:
+    """True when the question probably relies on earlier turns of the conversation."""
+    if not has_history:
+        return False
+    lowered = " ".join(question.lower().split())
+    if lowered.startswith(_FOLLOW_UP_OPENERS):
+        return True
+    words = set(WORD.findall(lowered))
+    return bool(words & _REFERENCES) or len(set(tokenize(question))) < 3
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+TTS Audio Cache for AgroBot
+---------------------------
+Content-addressed cache for synthesized speech.
+Clips are keyed by a hash of (translated text, language, voice settings)
+and kept in a small in-memory hot tier backed by an on-disk tier.
+Both tiers evict least recently used clips once their byte budget is hit.
+The key is also the clip's public name: GET /api/audio/<key>.mp3. The text
+and language behind each key are remembered (in memory, far more of them than
+clips) so an evicted clip can be synthesized again when its URL is requested.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from cache_utils import LRUCache
+from metrics import register_cache
+
+TTS_MEMORY_CACHE_MB = int(os.getenv("TTS_MEMORY_CACHE_MB", 32))
+TTS_DISK_CACHE_MB = int(os.getenv("TTS_DISK_CACHE_MB", 512))
+TTS_SOURCE_ITEMS = int(os.getenv("TTS_SOURCE_ITEMS", 200_000))       # key -> (text, lang) records
+# Outside the source tree so generated clips never end up in the repository
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "agrobot", "tts"
+)
+
+
+def cache_key(text: str, lang: str, slow: bool = False) -> str:
+    """Stable content hash for a clip."""
+    payload = f"{lang}\x00{int(slow)}\x00{text.strip()}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def key_from_path(path: str) -> str:
+    """Cache key of a clip from its on-disk path (the file is named after the key)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class AudioCache:
+    """
+    Two-tier (memory + disk) LRU cache of MP3 clips. The cache directory is
+    created and indexed on first use, not at import, to keep startup fast.
+    """
+
+    def __init__(self, cache_dir: str = TTS_CACHE_DIR,
+                 memory_bytes: int = TTS_MEMORY_CACHE_MB * 1024 * 1024,
+                 disk_bytes: int = TTS_DISK_CACHE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self._memory = LRUCache(max_items=100_000, max_bytes=memory_bytes)
+        self._sources = LRUCache(max_items=TTS_SOURCE_ITEMS)
+        self._disk_index = OrderedDict()  # key -> size, oldest first
+        self._disk_total = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_ready = False
+
+    def _ensure_disk(self):
+        if self._disk_ready:
+            return
+        with self._lock:
+            if not self._disk_ready:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._load_disk_index()
+                self._disk_ready = True
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU order from file access times after a restart (caller holds _lock)."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".mp3"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_total += size
+        self._evict_disk()
+
+    def remember_source(self, key: str, text: str, lang: str):
+        self._sources.set(key, (text, lang))
+
+    def source_of(self, key: str) -> tuple | None:
+        """(text, lang) the clip was synthesized from, if still known."""
+        return self._sources.get(key)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def get(self, key: str) -> bytes | None:
+        audio = self._memory.get(key)
+        if audio is not None:
+            with self._lock:
+                self.memory_hits += 1
+                if key in self._disk_index:
+                    self._disk_index.move_to_end(key)
+            return audio
+
+        self._ensure_disk()
+        with self._lock:
+            on_disk = key in self._disk_index
+            if on_disk:
+                self._disk_index.move_to_end(key)
+        if on_disk:
+            try:
+                with open(self.path_for(key), "rb") as f:
+                    audio = f.read()
+            except OSError:
+                with self._lock:
+                    size = self._disk_index.pop(key, 0)
+                    self._disk_total -= size
+                audio = None
+        if audio is not None:
+            self._memory.set(key, audio)
+            with self._lock:
+                self.disk_hits += 1
+            return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        self._memory.set(key, audio)
+
+        self._ensure_disk()
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[TTS CACHE] Could not write clip to disk: {e}")
+            return
+
+        with self._lock:
+            self._disk_total -= self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(audio)
+            self._disk_total += len(audio)
+            self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_index and self._disk_total > self.disk_bytes:
+            key, size = self._disk_index.popitem(last=False)
+            self._disk_total -= size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "memory_bytes": self._memory.total_bytes,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_total,
+            "disk_items": len(self._disk_index),
+        }
+
+
+audio_cache = AudioCache()
+register_cache("audio", audio_cache.stats)
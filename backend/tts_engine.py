@@ -4,84 +4,347 @@ TTS Engine for AgroBot
 ----------------------
 Converts text responses to speech using gTTS.
 Supports translation to Indian languages via Deep Translator.
-Returns playable audio bytes for Streamlit + saves MP3 file locally.
+Returns playable audio bytes; clips are cached by content hash (see tts_cache.py).
+Longer texts are split into sentence groups that are synthesized in parallel
+and joined back into one MP3 clip.
 """
 
-from gtts import gTTS
-from deep_translator import GoogleTranslator
-import os
+from concurrent.futures import ThreadPoolExecutor
 import io
+import os
+import re
+import threading
+
+from cache_utils import LRUCache
+from metrics import register_cache, stage_timer, timed
+from mp3_utils import audio_frames, join_mp3
+from providers import get_gtts, get_translator_class
+from resilience import UPSTREAM_TIMEOUTS, UpstreamUnavailable, note_degraded, upstream
+from singleflight import SingleFlight
+from tts_cache import audio_cache, cache_key
+
+# Language mapping - ensure consistency
+# Map common codes to what GoogleTranslator and gTTS both support
+LANG_MAP = {
+    'en': 'en',  # English
+    'hi': 'hi',  # Hindi
+    'te': 'te',  # Telugu
+    'ta': 'ta',  # Tamil
+    'mr': 'mr',  # Marathi
+    'bn': 'bn',  # Bengali
+    'gu': 'gu',  # Gujarati
+}
+
+# Voice settings that are part of the cache key
+TTS_SLOW = False
+
+# Sentence boundary: terminal punctuation (incl. Devanagari danda) followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?।])\s+')
+
+# Memoized sentence translations, keyed by (target language, English sentence)
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", 20000))
+translation_cache = LRUCache(max_items=TRANSLATION_CACHE_SIZE)
+register_cache("translation", translation_cache.stats)
+
+# Google Translate rejects requests above 5000 characters
+_MAX_BATCH_CHARS = 4500
+
+# gTTS sends one request per ~100 characters and makes them one after another, so
+# longer texts are cut into sentence groups of that size and synthesized side by side
+TTS_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", 100))
+TTS_SYNTHESIS_WORKERS = int(os.getenv("TTS_SYNTHESIS_WORKERS", 32))
+_segment_pool = ThreadPoolExecutor(max_workers=TTS_SYNTHESIS_WORKERS, thread_name_prefix="tts-segment")
 
-def text_to_speech(text: str, lang_code: str = "en", filename: str = "speech.mp3"):
+# Translate and gTTS calls are idempotent, so slow ones are hedged (see resilience.py)
+_translate = upstream("translate")
+_gtts = upstream("gtts")
+
+# The same broadcast advice is often requested by many listeners at once
+_tts_flights = SingleFlight("tts")
+
+# GoogleTranslator keeps per-request state, so reuse one instance per thread and language
+_translators = threading.local()
+
+
+def normalize_language(lang_code: str) -> str:
+    """Map a client language code to one both translator and gTTS accept."""
+    return LANG_MAP.get((lang_code or 'en').lower(), 'en')
+
+
+def split_sentences(text: str):
     """
-    Converts text into speech audio.
-    Returns (filename, audio_bytes) for playback.
+    Split text into complete sentences.
+    Returns (sentences, remainder) where remainder is trailing text that
+    has not been terminated yet (useful while a response is still streaming).
+    """
+    parts = _SENTENCE_END.split(text)
+    remainder = parts.pop() if parts else ""
+    sentences = [p.strip() for p in parts if p.strip()]
+    return sentences, remainder
+
+
+def _get_translator(target: str):
+    cache = getattr(_translators, "by_lang", None)
+    if cache is None:
+        cache = _translators.by_lang = {}
+    if target not in cache:
+        cache[target] = get_translator_class()(source="en", target=target)
+    return cache[target]
+
+
+def _translate_one(text: str, target: str) -> str:
+    # Runs on a resilience worker thread, which keeps its own translator instance
+    return _get_translator(target).translate(text)
+
+
+def _translate_batch(sentences: list, target: str) -> list:
+    """
+    Translate several sentences in as few upstream requests as possible.
+    Sentences are sent newline-separated and split back apart; if the
+    line count does not survive the round trip they are sent one by one.
+    """
+    results = []
+    batch, batch_chars = [], 0
+    for sentence in sentences + [None]:
+        if sentence is not None and (not batch or batch_chars + len(sentence) + 1 <= _MAX_BATCH_CHARS):
+            batch.append(sentence)
+            batch_chars += len(sentence) + 1
+            continue
+
+        translated = _translate.call(_translate_one, "\n".join(batch), target) or ""
+        lines = [line.strip() for line in translated.split("\n") if line.strip()]
+        if len(lines) != len(batch):
+            lines = [_translate.call(_translate_one, item, target) or item for item in batch]
+        results.extend(lines)
+
+        if sentence is not None:
+            batch, batch_chars = [sentence], len(sentence) + 1
+    return results
+
+
+@timed("translate")
+def translate_text(text: str, lang_code: str):
+    """
+    Translate English text to the target language.
+    Sentences are memoized per language; only unseen sentences go upstream, in one batch.
+    Returns (translated_text, language_used); falls back to English on failure.
     """
+    normalized_lang = normalize_language(lang_code)
+    if normalized_lang == "en":
+        return text, "en"
+
+    try:
+        # Keep paragraph breaks so the translated reply reads like the original
+        paragraphs = []
+        for line in text.split("\n"):
+            sentences, remainder = split_sentences(line)
+            if remainder.strip():
+                sentences.append(remainder.strip())
+            paragraphs.append(sentences)
+
+        translated = {}
+        missing = []
+        for sentence in (s for sentences in paragraphs for s in sentences):
+            if sentence in translated or sentence in missing:
+                continue
+            cached = translation_cache.get((normalized_lang, sentence))
+            if cached is None:
+                missing.append(sentence)
+            else:
+                translated[sentence] = cached
+
+        if missing:
+            # Explicitly translate from English to target language
+            print(f"[TTS] Translating {len(missing)} new sentence(s) from 'en' to '{normalized_lang}' "
+                  f"({len(translated)} cached)...")
+            for sentence, result in zip(missing, _translate_batch(missing, normalized_lang)):
+                translated[sentence] = result
+                translation_cache.set((normalized_lang, sentence), result)
+        else:
+            print(f"[TTS] All {len(translated)} sentence(s) served from translation cache")
+
+        translated_text = "\n".join(
+            " ".join(translated[s] for s in sentences) for sentences in paragraphs
+        )
+        # Use safe encoding for Windows console
+        try:
+            print(f"[TTS] Translated to {normalized_lang}: {translated_text[:50]}...")
+        except UnicodeEncodeError:
+            print(f"[TTS] Translation completed to {normalized_lang}")
+        return translated_text, normalized_lang
+    except Exception as e:
+        if isinstance(e, UpstreamUnavailable):
+            note_degraded("translate")
+        try:
+            print(f"[TTS] Translation failed ({str(e)}), using original English text.")
+        except UnicodeEncodeError:
+            print("[TTS] Translation failed, using original text.")
+        # Keep original text and use English for TTS
+        return text, "en"
 
+
+def clip_key(text: str, lang: str) -> str:
+    """Audio cache key (the /api/audio/<key>.mp3 name) of the clip for already translated text."""
+    return cache_key(text, lang, TTS_SLOW)
+
+
+def split_segments(text: str, limit: int = TTS_SEGMENT_CHARS) -> list:
+    """Whole sentences packed into segments of up to limit characters (a longer sentence stays whole)."""
+    segments, current = [], ""
+    for line in text.split("\n"):
+        sentences, remainder = split_sentences(line)
+        if remainder.strip():
+            sentences.append(remainder.strip())
+        for sentence in sentences:
+            if current and len(current) + 1 + len(sentence) > limit:
+                segments.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _synthesize(text: str, lang: str) -> bytes:
+    buffer = io.BytesIO()
+    get_gtts()(text=text, lang=lang, slow=TTS_SLOW, timeout=UPSTREAM_TIMEOUTS["gtts"]).write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def _synthesize_segments(segments: list, lang: str):
+    """
+    Yield each segment's clip in order. All but the first are started on the
+    segment pool right away, so the total time is about that of the slowest
+    segment; the first runs on the caller's thread, which keeps a busy pool
+    from holding up the start of a clip.
+    """
+    futures = [_segment_pool.submit(_gtts.call, _synthesize, segment, lang) for segment in segments[1:]]
     try:
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Update filename to include temp directory path
-        filename = os.path.join(temp_dir, os.path.basename(filename))
-        
-        # Validate input
-        if not text or not text.strip():
-            print("[TTS] No text provided for speech.")
-            return None, None
+        yield _gtts.call(_synthesize, segments[0], lang)
+        for future in futures:
+            yield future.result()
+    finally:
+        # Stop queued segments once the caller gives up (error or closed stream)
+        for future in futures:
+            future.cancel()
+
+
+def _synthesize_text(text: str, lang: str) -> bytes:
+    segments = split_segments(text)
+    if len(segments) <= 1:
+        return _gtts.call(_synthesize, text, lang)
+    return join_mp3(list(_synthesize_segments(segments, lang)))
+
+
+def synthesize_speech(text: str, lang_code: str = "en") -> bytes:
+    """
+    Synthesize already-translated text with gTTS and return MP3 bytes.
+    Repeated clips are served from the audio cache without calling gTTS.
+    """
+    lang = normalize_language(lang_code)
+    key = clip_key(text, lang)
+    audio_cache.remember_source(key, text, lang)
+    with stage_timer("tts_cache_read"):
+        audio_bytes = audio_cache.get(key)
+    if audio_bytes is not None:
+        print(f"[TTS] Cache hit for clip {key[:12]}")
+        return audio_bytes
+
+    with stage_timer("tts_synthesis"):
+        audio_bytes = _synthesize_text(text, lang)
+    with stage_timer("tts_cache_write"):
+        audio_cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def stream_speech(text: str, lang_code: str = "en", chunk_size: int = 16 * 1024):
+    """
+    Yield MP3 bytes for already-translated text as soon as they are available.
+    Segments are synthesized in parallel and sent in order as each one is
+    ready; the finished clip is added to the audio cache so replays are
+    served without calling gTTS.
+    """
+    lang = normalize_language(lang_code)
+    key = clip_key(text, lang)
+    audio_cache.remember_source(key, text, lang)
+    with stage_timer("tts_cache_read"):
+        audio_bytes = audio_cache.get(key)
+    if audio_bytes is not None:
+        print(f"[TTS] Cache hit for streamed clip {key[:12]}")
+        view = memoryview(audio_bytes)
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+        return
+
+    buffer = io.BytesIO()
+    segments = split_segments(text) or [text]
+    with stage_timer("tts_synthesis"):
+        for clip in _synthesize_segments(segments, lang):
+            chunk = audio_frames(clip) if len(segments) > 1 else clip
+            buffer.write(chunk)
+            yield chunk
+    with stage_timer("tts_cache_write"):
+        audio_cache.put(key, buffer.getvalue())
+
+
+def audio_clip(key: str) -> bytes | None:
+    """
+    The clip behind an /api/audio/<key>.mp3 URL. A clip that has been evicted
+    is synthesized again from its remembered text; None if the key is unknown.
+    Raises UpstreamUnavailable while gTTS cannot be used.
+    """
+    audio_bytes = audio_cache.get(key)
+    if audio_bytes is None:
+        source = audio_cache.source_of(key)
+        if source is not None:
+            print(f"[TTS] Re-synthesizing evicted clip {key[:12]}")
+            audio_bytes = synthesize_speech(*source)
+    return audio_bytes
+
+
+@timed("text_to_speech")
+def text_to_speech(text: str, lang_code: str = "en", filename: str | None = None):
+    """
+    Converts text into speech audio.
+    Returns (cache_path, audio_bytes, translated_text) for playback; while gTTS is
+    unavailable the audio is None but the translated text is still returned.
+    Identical requests in flight at the same time share one translation and synthesis.
+    `filename` is accepted for backwards compatibility; clips are stored by content hash.
+    """
+    # Validate input
+    if not text or not text.strip():
+        print("[TTS] No text provided for speech.")
+        return None, None, None
+
+    return _tts_flights.do((normalize_language(lang_code), text), _text_to_speech, text, lang_code)
 
+
+def _text_to_speech(text: str, lang_code: str):
+    try:
         print(f"[TTS] Requested language: {lang_code}")
         print(f"[TTS] Original text (first 50 chars): {text[:50]}...")
 
-        # Language mapping - ensure consistency
-        # Map common codes to what GoogleTranslator and gTTS both support
-        lang_map = {
-            'en': 'en',  # English
-            'hi': 'hi',  # Hindi
-            'te': 'te',  # Telugu  
-            'ta': 'ta',  # Tamil
-            'mr': 'mr',  # Marathi
-            'bn': 'bn',  # Bengali
-            'gu': 'gu',  # Gujarati
-        }
-        
         # Get normalized language code
-        normalized_lang = lang_map.get(lang_code.lower(), 'en')
+        normalized_lang = normalize_language(lang_code)
         print(f"[TTS] Normalized language: {normalized_lang}")
 
         # Step 1: Translate text if needed
-        translated_text = text
-        if normalized_lang != "en":
-            try:
-                # Explicitly translate from English to target language
-                print(f"[TTS] Translating from 'en' to '{normalized_lang}'...")
-                translated_text = GoogleTranslator(source="en", target=normalized_lang).translate(text)
-                # Use safe encoding for Windows console
-                try:
-                    print(f"[TTS] Translated to {normalized_lang}: {translated_text[:50]}...")
-                except UnicodeEncodeError:
-                    print(f"[TTS] Translation completed to {normalized_lang}")
-            except Exception as e:
-                try:
-                    print(f"[TTS] Translation failed ({str(e)}), using original English text.")
-                except UnicodeEncodeError:
-                    print("[TTS] Translation failed, using original text.")
-                # Keep original text and use English for TTS
-                translated_text = text
-                normalized_lang = "en"
-
-        # Step 2: Generate TTS
+        translated_text, normalized_lang = translate_text(text, normalized_lang)
+
+        # Step 2: Generate TTS (or reuse a cached clip)
         print(f"[TTS] Generating speech in language: {normalized_lang}")
-        tts = gTTS(text=translated_text, lang=normalized_lang, slow=False)
-        tts.save(filename)
-        print(f"[TTS] Audio saved as '{filename}'")
+        try:
+            audio_bytes = synthesize_speech(translated_text, normalized_lang)
+        except UpstreamUnavailable as e:
+            # Text only: the frontend falls back to the browser's own voice
+            print(f"[TTS] Speech synthesis unavailable ({e}), returning text only")
+            note_degraded("tts")
+            return None, None, translated_text
 
         # Step 3: Return audio bytes and translated text for playback
-        with open(filename, "rb") as f:
-            audio_bytes = f.read()
-
-        return filename, audio_bytes, translated_text
+        path = audio_cache.path_for(clip_key(translated_text, normalized_lang))
+        return path, audio_bytes, translated_text
 
     except Exception as e:
         print(f"[TTS ERROR] Error in TTS: {e}")
@@ -5,43 +5,139 @@ Universal Speech-to-Text (Groq)
 Transcribes speech using Groq Whisper API.
 """
 
-from groq import Groq
-from dotenv import load_dotenv
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import re
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+from audio_preprocess import preprocess_audio
+from metrics import stage_timer, timed
+from providers import get_groq_client, get_groq_async_client
+from resilience import upstream
 
-def transcribe_audio_groq(audio_bytes: bytes, lang: str = "en"):
-    """Transcribe audio using Groq Whisper API"""
+WHISPER_MODEL = "whisper-large-v3-turbo"
+LANG_NAMES = {"en": "English", "hi": "Hindi", "te": "Telugu"}
+
+# Chunks of one long recording are transcribed concurrently on this pool
+STT_CHUNK_WORKERS = int(os.getenv("STT_CHUNK_WORKERS", 4))
+_chunk_executor = ThreadPoolExecutor(max_workers=STT_CHUNK_WORKERS, thread_name_prefix="stt-chunk")
+# Longest run of repeated words looked for where two overlapping chunks meet
+_MAX_OVERLAP_WORDS = 12
+
+
+def _transcription_prompt(lang: str) -> str:
+    lang_name = LANG_NAMES.get(lang, lang)
+    return f"Farming conversation in {lang_name}."
+
+
+def _finish(text: str, lang: str):
+    text = text.strip()
+    print(f"[STT] Language: {lang}")
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(audio_bytes)
-            tmp_path = tmp.name
-        
-        with open(tmp_path, "rb") as audio_file:
-            lang_names = {"en": "English", "hi": "Hindi", "te": "Telugu"}
-            lang_name = lang_names.get(lang, lang)
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-large-v3-turbo",
+        print(f"[STT] Text: {text}")
+    except UnicodeEncodeError:
+        print(f"[STT] Done")
+    return {"original_text": text, "language_used": lang}
+
+
+def _prepare_uploads(audio_bytes: bytes):
+    """Preprocess in memory; returns the list of (filename, bytes) uploads (empty for silence)."""
+    with stage_timer("stt_preprocess"):
+        uploads, info = preprocess_audio(audio_bytes)
+    if info["preprocessed"]:
+        print(f"[STT] Preprocessed {info['input_bytes']} -> {info['output_bytes']} bytes "
+              f"({info['input_seconds']}s -> {info['speech_seconds']}s of speech, {info['chunks']} chunk(s))")
+    if not uploads:
+        print("[STT] Recording contains no speech, skipping Whisper call")
+    return uploads
+
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def stitch_transcripts(parts) -> str:
+    """
+    Join chunk transcripts in order, dropping the words repeated at each
+    boundary because neighbouring chunks overlap in time.
+    """
+    words = []
+    for part in parts:
+        new_words = part.split()
+        tail = [_normalize_word(w) for w in words[-_MAX_OVERLAP_WORDS:]]
+        head = [_normalize_word(w) for w in new_words[:_MAX_OVERLAP_WORDS]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+        words.extend(new_words[overlap:])
+    return " ".join(words)
+
+
+def _transcribe_upload(upload, lang: str) -> str:
+    with stage_timer("stt_upload"):
+        transcription = upstream("groq").call(
+            get_groq_client().audio.transcriptions.create,
+            file=upload,
+            model=WHISPER_MODEL,
+            language=lang,
+            prompt=_transcription_prompt(lang)
+        )
+    return transcription.text.strip()
+
+
+async def _transcribe_upload_async(upload, lang: str, limiter: asyncio.Semaphore) -> str:
+    async with limiter:
+        with stage_timer("stt_upload"):
+            transcription = await upstream("groq").call_async(
+                get_groq_async_client().audio.transcriptions.create,
+                file=upload,
+                model=WHISPER_MODEL,
                 language=lang,
-                prompt=f"Farming conversation in {lang_name}."
+                prompt=_transcription_prompt(lang)
             )
-        
-        os.unlink(tmp_path)
-        text = transcription.text.strip()
-        print(f"[STT] Language: {lang}")
-        try:
-            print(f"[STT] Text: {text}")
-        except UnicodeEncodeError:
-            print(f"[STT] Done")
-        return {"original_text": text, "language_used": lang}
+    return transcription.text.strip()
+
+
+def _report_error(e):
+    try:
+        print(f"[STT ERROR] {e}")
+    except:
+        print("[STT ERROR] Error occurred")
+
+
+@timed("transcribe_audio_groq")
+def transcribe_audio_groq(audio_bytes: bytes, lang: str = "en"):
+    """Transcribe audio using Groq Whisper API"""
+    try:
+        uploads = _prepare_uploads(audio_bytes)
+        if not uploads:
+            return {"original_text": "", "language_used": lang}
+
+        if len(uploads) == 1:
+            return _finish(_transcribe_upload(uploads[0], lang), lang)
+
+        # map() keeps chunk order while the uploads run concurrently
+        parts = list(_chunk_executor.map(lambda upload: _transcribe_upload(upload, lang), uploads))
+        return _finish(stitch_transcripts(parts), lang)
+    except Exception as e:
+        _report_error(e)
+        return {"original_text": "", "language_used": lang}
+
+
+@timed("transcribe_audio_groq")
+async def transcribe_audio_groq_async(audio_bytes: bytes, lang: str = "en"):
+    """Async variant of transcribe_audio_groq."""
+    try:
+        # Decoding/encoding is CPU work; keep it off the event loop
+        uploads = await asyncio.to_thread(_prepare_uploads, audio_bytes)
+        if not uploads:
+            return {"original_text": "", "language_used": lang}
+
+        limiter = asyncio.Semaphore(STT_CHUNK_WORKERS)
+        parts = await asyncio.gather(*(_transcribe_upload_async(u, lang, limiter) for u in uploads))
+        return _finish(stitch_transcripts(parts), lang)
     except Exception as e:
-        try:
-            print(f"[STT ERROR] {e}")
-        except:
-            print("[STT ERROR] Error occurred")
+        _report_error(e)
         return {"original_text": "", "language_used": lang}
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Upstream Stand-ins for AgroBot Load Tests
+-----------------------------------------
+One local ASGI server that impersonates every upstream the backend calls:
+Gemini (REST), Groq Whisper, Google Translate, gTTS and OpenWeather.
+Each upstream answers after a latency drawn from a log-normal distribution
+(given as median and p95 in ms) and fails at a configurable rate, so the
+real backend can be benchmarked without network access or API spend.
+
+Run with:  python upstream_stubs.py --port 9100 --latency gemini=900:2500 --errors groq=0.02:429
+Then start the backend with:
+    GEMINI_BASE_URL=http://127.0.0.1:9100 GROQ_BASE_URL=http://127.0.0.1:9100
+    TRANSLATE_BASE_URL=http://127.0.0.1:9100 OPENWEATHER_BASE_URL=http://127.0.0.1:9100
+GET /stats returns per-upstream call and error counts.
+"""
+
+from html import escape
+from urllib.parse import unquote
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# (median ms, p95 ms) per upstream; roughly what the public APIs show from India
+DEFAULT_LATENCY = {
+    "gemini": (900, 2500),
+    "groq": (450, 1200),
+    "translate": (150, 450),
+    "tts": (300, 900),
+    "weather": (120, 350),
+}
+# Gemini streams its answer in this many chunks after the first-chunk delay
+GEMINI_STREAM_CHUNKS = 6
+# Fraction of the sampled latency spent before the first streamed chunk
+GEMINI_FIRST_CHUNK_SHARE = 0.4
+# gTTS returns roughly this many MP3 bytes per character of text (32 kbit/s speech)
+TTS_BYTES_PER_CHAR = 270
+
+CANNED_ANSWERS = [
+    "Water your tomatoes early in the morning and keep the leaves dry. "
+    "Remove yellow lower leaves and mulch around the stems to hold moisture.",
+    "For rice at tillering, apply the second split of urea after draining the field. "
+    "Keep two to three centimetres of water afterwards and watch for stem borer.",
+    "Cotton with curling leaves often has whitefly or jassids. "
+    "Check the underside of leaves and spray neem oil in the evening if you find them.",
+    "Test your soil before the next season. Add well rotted farmyard manure and "
+    "avoid heavy nitrogen doses when the crop is flowering.",
+]
+CANNED_TRANSCRIPTS = [
+    "My tomato leaves have brown spots, what should I spray?",
+    "When should I apply urea to my paddy field?",
+    "Is it a good time to sow wheat this week?",
+    "How much water does groundnut need in summer?",
+]
+
+
+class Upstream:
+    """Latency and error model for one stand-in upstream."""
+
+    def __init__(self, name: str, median_ms: float, p95_ms: float, error_rate: float = 0.0, error_status: int = 503):
+        self.name = name
+        self.median_ms = median_ms
+        self.p95_ms = max(p95_ms, median_ms)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = 0
+        self.errors = 0
+
+    def sample_seconds(self) -> float:
+        # log-normal with the requested median and 95th percentile
+        sigma = math.log(self.p95_ms / self.median_ms) / 1.645 if self.median_ms > 0 else 0.0
+        return random.lognormvariate(math.log(max(self.median_ms, 0.001)), sigma) / 1000
+
+    def should_fail(self) -> bool:
+        self.calls += 1
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "median_ms": self.median_ms,
+            "p95_ms": self.p95_ms,
+            "error_rate": self.error_rate,
+        }
+
+
+upstreams = {name: Upstream(name, *latency) for name, latency in DEFAULT_LATENCY.items()}
+_audio_blob = os.urandom(256 * 1024)
+
+
+def _error(upstream: Upstream) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"code": upstream.error_status, "message": f"{upstream.name} stand-in injected error"}},
+        status_code=upstream.error_status,
+    )
+
+
+# -------------------------------------------------------
+# 🤖 GEMINI (generativelanguage REST)
+# -------------------------------------------------------
+def _gemini_response(text: str, prompt_chars: int) -> dict:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": 1,
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_chars // 4,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": (prompt_chars + len(text)) // 4,
+        },
+    }
+
+
+async def gemini(request: Request):
+    upstream = upstreams["gemini"]
+    model, _, method = request.path_params["target"].partition(":")
+    if not method:
+        # models.get, used by the provider warm-up
+        return JSONResponse({"name": f"models/{model}", "displayName": model})
+
+    body = await request.json()
+    prompt_chars = len(json.dumps(body.get("contents", []))) + len(json.dumps(body.get("systemInstruction", "")))
+    answer = random.choice(CANNED_ANSWERS)
+    delay = upstream.sample_seconds()
+    if upstream.should_fail():
+        await asyncio.sleep(delay)
+        return _error(upstream)
+
+    if method != "streamGenerateContent":
+        await asyncio.sleep(delay)
+        return JSONResponse(_gemini_response(answer, prompt_chars))
+
+    words = answer.split(" ")
+    size = math.ceil(len(words) / GEMINI_STREAM_CHUNKS)
+    pieces = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    async def generate():
+        await asyncio.sleep(delay * GEMINI_FIRST_CHUNK_SHARE)
+        gap = delay * (1 - GEMINI_FIRST_CHUNK_SHARE) / max(len(pieces) - 1, 1)
+        yield "["
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(gap)
+                yield ",\r\n"
+            yield json.dumps(_gemini_response(piece, prompt_chars))
+        yield "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+# -------------------------------------------------------
+# 🎤 GROQ WHISPER
+# -------------------------------------------------------
+async def groq_transcriptions(request: Request):
+    upstream = upstreams["groq"]
+    form = await request.form()
+    upload = form.get("file")
+    audio_bytes = len(await upload.read()) if upload is not None and not isinstance(upload, str) else 0
+    # Whisper time grows with audio length; 16 KB is roughly 5 s of compressed speech
+    await asyncio.sleep(upstream.sample_seconds() * (1 + audio_bytes / (16 * 1024) / 10))
+    if upstream.should_fail():
+        return _error(upstream)
+    return JSONResponse({"text": random.choice(CANNED_TRANSCRIPTS)})
+
+
+async def groq_models(request: Request):
+    return JSONResponse({"object": "list", "data": [{"id": "whisper-large-v3-turbo", "object": "model"}]})
+
+
+# -------------------------------------------------------
+# 🌐 GOOGLE TRANSLATE (mobile web page scraped by deep_translator)
+# -------------------------------------------------------
+async def translate(request: Request):
+    upstream = upstreams["translate"]
+    await asyncio.sleep(upstream.sample_seconds())
+    if upstream.should_fail():
+        return Response("Too many requests", status_code=upstream.error_status)
+
+    target = request.query_params.get("tl", "xx")
+    text = request.query_params.get("q", "")
+    translated = "\n".join(f"[{target}] {line}" if line.strip() else line for line in text.split("\n"))
+    return HTMLResponse(f'<html><body><div class="result-container">{escape(translated)}</div></body></html>')
+
+
+# -------------------------------------------------------
+# 🔊 GTTS (Translate batchexecute RPC)
+# -------------------------------------------------------
+def _tts_text(form_body: str) -> str:
+    try:
+        rpc = json.loads(unquote(form_body.split("f.req=", 1)[1].rstrip("&")))
+        return json.loads(rpc[0][0][1])[0]
+    except (IndexError, ValueError, TypeError):
+        return ""
+
+
+async def tts(request: Request):
+    upstream = upstreams["tts"]
+    text = _tts_text((await request.body()).decode("utf-8", "ignore"))
+    await asyncio.sleep(upstream.sample_seconds())
+    if upstream.should_fail():
+        return Response("", status_code=upstream.error_status)
+
+    size = min(max(len(text), 1) * TTS_BYTES_PER_CHAR, len(_audio_blob))
+    audio = base64.b64encode(_audio_blob[:size]).decode("ascii")
+    payload = json.dumps([["wrb.fr", "jQ1olc", json.dumps([audio]), None, None, None, "generic"]],
+                         separators=(",", ":"))
+    return Response(f")]}}'\n\n{len(payload)}\n{payload}\n", media_type="application/json")
+
+
+# -------------------------------------------------------
+# 🌦 OPENWEATHER (current conditions and 5-day forecast)
+# -------------------------------------------------------
+async def weather(request: Request):
+    upstream = upstreams["weather"]
+    await asyncio.sleep(upstream.sample_seconds())
+    if upstream.should_fail():
+        return JSONResponse({"cod": upstream.error_status, "message": "stand-in injected error"},
+                            status_code=upstream.error_status)
+
+    params = request.query_params
+    # Stable per location so repeated lookups look like real (slow-changing) weather
+    rng = random.Random(f"{params.get('lat')},{params.get('lon')},{params.get('q')}")
+    return JSONResponse({
+        "name": params.get("q") or "Stand-in Farm",
+        "sys": {"country": "IN"},
+        "main": {
+            "temp": round(rng.uniform(16, 38), 1),
+            "feels_like": round(rng.uniform(16, 40), 1),
+            "humidity": rng.randint(25, 95),
+            "pressure": rng.randint(995, 1020),
+        },
+        "wind": {"speed": round(rng.uniform(0, 10), 1)},
+        "weather": [{"description": rng.choice(["clear sky", "scattered clouds", "light rain", "haze"])}],
+        "rain": {"1h": round(rng.uniform(0, 8), 1)} if rng.random() < 0.3 else {},
+    })
+
+
+async def forecast(request: Request):
+    upstream = upstreams["weather"]
+    await asyncio.sleep(upstream.sample_seconds())
+    if upstream.should_fail():
+        return JSONResponse({"cod": str(upstream.error_status), "message": "stand-in injected error"},
+                            status_code=upstream.error_status)
+
+    params = request.query_params
+    rng = random.Random(f"forecast:{params.get('lat')},{params.get('lon')},{params.get('q')}")
+    start = int(time.time()) // 10800 * 10800
+    items = []
+    for step in range(40):                  # five days of 3-hourly slots, like the real API
+        item = {
+            "dt": start + step * 10800,
+            "main": {"temp": round(rng.uniform(16, 38), 1), "humidity": rng.randint(25, 95)},
+            "wind": {"speed": round(rng.uniform(0, 10), 1)},
+            "weather": [{"description": rng.choice(["clear sky", "scattered clouds", "light rain", "haze"])}],
+        }
+        if rng.random() < 0.2:
+            item["rain"] = {"3h": round(rng.uniform(0, 6), 1)}
+        items.append(item)
+    return JSONResponse({"cnt": len(items), "list": items,
+                         "city": {"name": params.get("q") or "Stand-in Farm", "country": "IN", "timezone": 19800}})
+
+
+async def stats(request: Request):
+    return JSONResponse({name: upstream.stats() for name, upstream in upstreams.items()})
+
+
+app = Starlette(routes=[
+    Route('/v1beta/models/{target}', gemini, methods=['GET', 'POST']),
+    Route('/openai/v1/audio/transcriptions', groq_transcriptions, methods=['POST']),
+    Route('/openai/v1/models', groq_models, methods=['GET']),
+    Route('/m', translate, methods=['GET']),
+    Route('/_/TranslateWebserverUi/data/batchexecute', tts, methods=['POST']),
+    Route('/data/2.5/weather', weather, methods=['GET']),
+    Route('/data/2.5/forecast', forecast, methods=['GET']),
+    Route('/stats', stats, methods=['GET']),
+])
+
+
+def _parse_overrides(values, label: str) -> dict:
+    """Parse repeated NAME=A[:B] flags into {name: [A, B?]}."""
+    parsed = {}
+    for value in values or []:
+        name, _, spec = value.partition("=")
+        if name not in upstreams or not spec:
+            raise SystemExit(f"--{label} expects NAME=VALUE with NAME in {sorted(upstreams)}, got {value!r}")
+        parsed[name] = spec.split(":")
+    return parsed
+
+
+def configure(latency=None, errors=None, seed=None):
+    """Apply --latency NAME=MEDIAN[:P95] and --errors NAME=RATE[:STATUS] overrides."""
+    if seed is not None:
+        random.seed(seed)
+    for name, spec in _parse_overrides(latency, "latency").items():
+        upstreams[name].median_ms = float(spec[0])
+        upstreams[name].p95_ms = max(float(spec[1]) if len(spec) > 1 else float(spec[0]), float(spec[0]))
+    for name, spec in _parse_overrides(errors, "errors").items():
+        upstreams[name].error_rate = float(spec[0])
+        if len(spec) > 1:
+            upstreams[name].error_status = int(spec[1])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Latency-injecting stand-ins for AgroBot's upstream APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("UPSTREAM_STUBS_PORT", 9100)))
+    parser.add_argument("--latency", action="append", metavar="NAME=MEDIAN[:P95]",
+                        help=f"Latency in ms for one of {', '.join(upstreams)} (repeatable)")
+    parser.add_argument("--errors", action="append", metavar="NAME=RATE[:STATUS]",
+                        help="Injected error rate (0-1) and HTTP status, default 503 (repeatable)")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible latency/error sequences")
+    args = parser.parse_args()
+
+    configure(args.latency, args.errors, args.seed)
+    for upstream in upstreams.values():
+        print(f"[STUBS] {upstream.name}: median {upstream.median_ms} ms, p95 {upstream.p95_ms} ms, "
+              f"errors {upstream.error_rate:.1%} ({upstream.error_status})")
+    print(f"Upstream stand-ins running on http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
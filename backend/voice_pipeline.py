@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Voice Pipeline for AgroBot
+--------------------------
+Runs a whole voice turn (STT -> chat -> translate -> TTS) server-side in
+one request. Sentences are translated and synthesized on a worker pool
+while Gemini is still streaming the rest of the answer. If translating any
+sentence fails, the whole reply is spoken in English rather than a mix.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
+
+from agrobot_chat import stream_agro_response, stream_agro_response_async
+from mp3_utils import join_mp3
+from tts_engine import split_sentences, translate_text, synthesize_speech, normalize_language
+from universal_stt import transcribe_audio_groq, transcribe_audio_groq_async
+
+# Every concurrent turn fans its sentences out to this pool, so it is sized per turn:
+# a long answer's sentences should not queue behind other farmers' turns
+VOICE_CONCURRENT_TURNS = int(os.getenv("VOICE_CONCURRENT_TURNS", 8))
+VOICE_WORKERS_PER_TURN = int(os.getenv("VOICE_WORKERS_PER_TURN", 6))
+VOICE_PIPELINE_WORKERS = int(os.getenv("VOICE_PIPELINE_WORKERS", VOICE_CONCURRENT_TURNS * VOICE_WORKERS_PER_TURN))
+
+# Separate from tts_engine's segment pool: sentence tasks submit their segments there,
+# and waiting on a pool from inside the same pool can deadlock once it is full
+_executor = ThreadPoolExecutor(max_workers=VOICE_PIPELINE_WORKERS, thread_name_prefix="voice")
+
+
+class VoicePipelineError(Exception):
+    """Raised when a voice turn cannot be completed."""
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _synthesize(text: str, lang: str) -> bytes:
+    try:
+        return synthesize_speech(text, lang)
+    except Exception as e:
+        print(f"[VOICE] Speech synthesis failed for one sentence: {e}")
+        return b""
+
+
+def _speak_sentence(sentence: str, lang_code: str, english_only: threading.Event):
+    """
+    Translate and synthesize one sentence; returns (sentence, translated, lang, audio, translate_ms, tts_ms).
+    A failed translation sets english_only, and later sentences of the turn skip translating.
+    """
+    start = time.perf_counter()
+    if english_only.is_set():
+        translated, lang_used = sentence, "en"
+    else:
+        translated, lang_used = translate_text(sentence, lang_code)
+        if lang_used != lang_code:
+            english_only.set()
+    translate_ms = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    audio = _synthesize(translated, lang_used)
+    return sentence, translated, lang_used, audio, translate_ms, _elapsed_ms(start)
+
+
+def _speak_english(result: tuple) -> tuple:
+    """Redo a sentence that was spoken in the target language, in English."""
+    sentence, _, _, _, translate_ms, tts_ms = result
+    start = time.perf_counter()
+    audio = _synthesize(sentence, "en")
+    return sentence, sentence, "en", audio, translate_ms, tts_ms + _elapsed_ms(start)
+
+
+def _sentences_to_redo(results: list, english_only: threading.Event) -> list:
+    """The sentences that need redoing in English because another sentence's translation failed."""
+    if not english_only.is_set():
+        return []
+    redo = [index for index, result in enumerate(results) if result[2] != "en"]
+    if redo:
+        print(f"[VOICE] Translation failed for part of the reply; speaking all {len(results)} sentences in English")
+    return redo
+
+
+def run_voice_pipeline(audio_bytes: bytes, language: str = "en", weather_context: str | None = None,
+                       session_id: str | None = None) -> dict:
+    """
+    Transcribe the recording, answer it and speak the answer.
+    Returns transcript, English answer, translated text, MP3 bytes and per-stage timings.
+    """
+    total_start = time.perf_counter()
+    timings = {}
+    lang_code = normalize_language(language)
+
+    # Stage 1: speech-to-text
+    start = time.perf_counter()
+    stt = transcribe_audio_groq(audio_bytes, lang=language)
+    timings["stt_ms"] = _elapsed_ms(start)
+
+    transcript = (stt or {}).get("original_text", "")
+    if not transcript:
+        raise VoicePipelineError("Transcription returned empty result")
+
+    # Stage 2: stream the answer, handing finished sentences to the speech workers
+    start = time.perf_counter()
+    english_only = threading.Event()
+    futures = []
+    chunks = []
+    pending = ""
+    for chunk in stream_agro_response(transcript, weather_context=weather_context, session_id=session_id):
+        if not chunks:
+            timings["chat_first_chunk_ms"] = _elapsed_ms(start)
+        chunks.append(chunk)
+        sentences, pending = split_sentences(pending + chunk)
+        for sentence in sentences:
+            futures.append(_executor.submit(_speak_sentence, sentence, lang_code, english_only))
+
+    if pending.strip():
+        futures.append(_executor.submit(_speak_sentence, pending.strip(), lang_code, english_only))
+    timings["chat_ms"] = _elapsed_ms(start)
+
+    # Stage 3: wait for the remaining translation/synthesis work, keeping sentence order
+    start = time.perf_counter()
+    results = [future.result() for future in futures]
+    redo = _sentences_to_redo(results, english_only)
+    for index, result in zip(redo, _executor.map(_speak_english, [results[i] for i in redo])):
+        results[index] = result
+    timings["speech_tail_ms"] = _elapsed_ms(start)
+    return _assemble(stt, language, transcript, chunks, results, timings, total_start)
+
+
+def _assemble(stt: dict, language: str, transcript: str, chunks: list, results: list, timings: dict,
+              total_start: float) -> dict:
+    timings["translate_ms"] = round(sum(r[4] for r in results), 1)
+    timings["tts_ms"] = round(sum(r[5] for r in results), 1)
+    timings["total_ms"] = _elapsed_ms(total_start)
+
+    response_text = "".join(chunks).strip()
+    print(f"[VOICE] Turn finished in {timings['total_ms']} ms ({len(results)} sentences)")
+
+    return {
+        "transcript": transcript,
+        "language": stt.get("language_used", language),
+        "response": response_text,
+        "translated_text": " ".join(r[1] for r in results if r[1]),
+        "audio": join_mp3([r[3] for r in results if r[3]]),
+        "timings": timings,
+    }
+
+
+async def run_voice_pipeline_async(audio_bytes: bytes, language: str = "en", weather_context: str | None = None,
+                                   session_id: str | None = None) -> dict:
+    """
+    Async variant of run_voice_pipeline for the ASGI server.
+    Translation and gTTS have no async clients, so each sentence runs on the same worker pool.
+    """
+    total_start = time.perf_counter()
+    timings = {}
+    lang_code = normalize_language(language)
+    loop = asyncio.get_running_loop()
+
+    start = time.perf_counter()
+    stt = await transcribe_audio_groq_async(audio_bytes, lang=language)
+    timings["stt_ms"] = _elapsed_ms(start)
+
+    transcript = (stt or {}).get("original_text", "")
+    if not transcript:
+        raise VoicePipelineError("Transcription returned empty result")
+
+    start = time.perf_counter()
+    english_only = threading.Event()
+    tasks = []
+    chunks = []
+    pending = ""
+    async for chunk in stream_agro_response_async(transcript, weather_context=weather_context, session_id=session_id):
+        if not chunks:
+            timings["chat_first_chunk_ms"] = _elapsed_ms(start)
+        chunks.append(chunk)
+        sentences, pending = split_sentences(pending + chunk)
+        for sentence in sentences:
+            tasks.append(loop.run_in_executor(_executor, _speak_sentence, sentence, lang_code, english_only))
+
+    if pending.strip():
+        tasks.append(loop.run_in_executor(_executor, _speak_sentence, pending.strip(), lang_code, english_only))
+    timings["chat_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    results = list(await asyncio.gather(*tasks))
+    redo = _sentences_to_redo(results, english_only)
+    redone = await asyncio.gather(*(loop.run_in_executor(_executor, _speak_english, results[i]) for i in redo))
+    for index, result in zip(redo, redone):
+        results[index] = result
+    timings["speech_tail_ms"] = _elapsed_ms(start)
+    return _assemble(stt, language, transcript, chunks, results, timings, total_start)
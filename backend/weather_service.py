@@ -1,13 +1,59 @@
+from collections import Counter as TallyCounter
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import heapq
+import itertools
 import os
+import threading
+import time
 from typing import Optional, Dict, Any, Tuple
 
-import httpx
-from dotenv import load_dotenv
-
-load_dotenv()
+from cache_utils import LRUCache
+from metrics import Counter, metrics_registry, register_cache, stage_timer, timed
+from providers import OPENWEATHER_BASE_URL, get_weather_http_client
+from rate_limit import TokenBucket
+from resilience import UPSTREAM_TIMEOUTS, UpstreamUnavailable, upstream
+from singleflight import AsyncSingleFlight, SingleFlight
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+OPENWEATHER_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/weather"
+OPENWEATHER_FORECAST_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/forecast"
+
+# Weather changes slowly: neighbouring farms in the same grid cell share one lookup
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 600))          # seconds
+WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", 0.05))  # ~5 km cells
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", 5000))
+
+# Registered farms: current conditions and a daily forecast are refreshed in the
+# background before they expire, within WEATHER_PREFETCH_RPS OpenWeather calls per second
+WEATHER_FORECAST_TTL = int(os.getenv("WEATHER_FORECAST_TTL", 3 * 3600))   # seconds
+WEATHER_FORECAST_DAYS = int(os.getenv("WEATHER_FORECAST_DAYS", 5))
+WEATHER_PREFETCH_RPS = float(os.getenv("WEATHER_PREFETCH_RPS", 2))
+WEATHER_PREFETCH_WORKERS = int(os.getenv("WEATHER_PREFETCH_WORKERS", 4))
+WEATHER_PREFETCH_RETRY = int(os.getenv("WEATHER_PREFETCH_RETRY", 60))     # seconds after a failed refresh
+WEATHER_MAX_FARMS = int(os.getenv("WEATHER_MAX_FARMS", 20000))
+WEATHER_BULK_MAX = int(os.getenv("WEATHER_BULK_MAX", 500))                # farms per bulk request
+_REFRESH_AT = 0.8                                                          # share of the TTL before a refresh
+
+# Room for every cell the prefetcher may keep warm (at most one per farm) on top of the
+# on-demand lookups, so background refreshes never evict each other
+_CACHE_ITEMS = WEATHER_CACHE_SIZE + WEATHER_MAX_FARMS
+weather_cache = LRUCache(max_items=_CACHE_ITEMS, ttl=WEATHER_CACHE_TTL)
+register_cache("weather", weather_cache.stats)
+forecast_cache = LRUCache(max_items=_CACHE_ITEMS, ttl=WEATHER_FORECAST_TTL)
+register_cache("forecast", forecast_cache.stats)
+
+# Farmers opening the app together ask for the same cell at once; only one lookup per cell goes upstream
+_weather_flights = SingleFlight("weather")
+_async_weather_flights = AsyncSingleFlight("weather")
+_forecast_flights = SingleFlight("forecast")
+
+WEATHER_PREFETCHES = Counter("agrobot_weather_prefetch_total",
+                             "Background refreshes of registered farms by kind (current, forecast) and outcome.",
+                             ("kind", "outcome"))
+
+_openweather = upstream("openweather")
+_async_http_client = None
 
 
 class WeatherServiceError(Exception):
@@ -24,6 +70,34 @@ def _build_params(lat: Optional[str], lon: Optional[str], city: Optional[str]) -
     return {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
 
 
+def _get_async_http_client():
+    """Shared keep-alive httpx.AsyncClient for the ASGI server (one event loop per process)."""
+    global _async_http_client
+    if _async_http_client is None:
+        import httpx
+
+        _async_http_client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUTS["openweather"],
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        )
+    return _async_http_client
+
+
+def _cache_key(lat: Optional[str], lon: Optional[str], city: Optional[str]) -> Tuple:
+    if city:
+        return ("city", " ".join(city.lower().split()))
+
+    if lat is None or lon is None:
+        raise WeatherServiceError("Latitude and longitude or a city name are required.")
+
+    try:
+        lat_f, lon_f = float(lat), float(lon)
+    except (TypeError, ValueError) as exc:
+        raise WeatherServiceError("Latitude and longitude must be numbers.") from exc
+
+    return ("grid", round(lat_f / WEATHER_GRID_DEGREES), round(lon_f / WEATHER_GRID_DEGREES))
+
+
 def _build_context(details: Dict[str, Any]) -> str:
     temperature = details["temperature"]
     humidity = details["humidity"]
@@ -91,26 +165,362 @@ def _extract_details(weather_json: Dict[str, Any]) -> Tuple[Dict[str, Any], str]
     return details, context
 
 
+def _store_summary(key: Tuple, weather_json: Dict[str, Any]) -> Dict[str, Any]:
+    details, context = _extract_details(weather_json)
+    summary = {
+        "context": context,
+        "details": details,
+        "fetched_at": int(time.time()),     # drives Last-Modified / max-age on /api/weather
+    }
+    weather_cache.set(key, summary)
+    return summary
+
+
+def _get_weather(params: Dict[str, Any]):
+    response = get_weather_http_client().get(OPENWEATHER_URL, params=params)
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()         # only server errors and rate limiting count against the breaker
+    return response
+
+
+async def _get_weather_async(params: Dict[str, Any]):
+    response = await _get_async_http_client().get(OPENWEATHER_URL, params=params)
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return response
+
+
+def _get_forecast(params: Dict[str, Any]):
+    response = get_weather_http_client().get(OPENWEATHER_FORECAST_URL, params=params)
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return response
+
+
+def _call_openweather(fetch, params: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    try:
+        response = _openweather.call(fetch, params)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        raise WeatherServiceError(f"Weather API error: {exc.response.text}") from exc
+    except httpx.RequestError as exc:
+        raise WeatherServiceError(f"Connection to weather service failed: {str(exc)}") from exc
+    return response.json()
+
+
+def _fetch_and_store(key: Tuple, params: Dict[str, Any]) -> Dict[str, Any]:
+    """One OpenWeather request; concurrent callers for the same cell share it (see _weather_flights)."""
+    with stage_timer("weather_upstream"):
+        weather_json = _call_openweather(_get_weather, params)
+    return _store_summary(key, weather_json)
+
+
+def _extract_forecast(forecast_json: Dict[str, Any]) -> list:
+    """Collapse OpenWeather's 3-hourly forecast into one entry per local calendar day."""
+    offset = (forecast_json.get("city") or {}).get("timezone", 0)
+    days = {}
+    for item in forecast_json.get("list", []):
+        day = time.strftime("%Y-%m-%d", time.gmtime(item.get("dt", 0) + offset))
+        days.setdefault(day, []).append(item)
+
+    forecast = []
+    for day, items in sorted(days.items())[:WEATHER_FORECAST_DAYS]:
+        temperatures = [item.get("main", {}).get("temp", 0) for item in items]
+        descriptions = TallyCounter((item.get("weather") or [{}])[0].get("description", "") for item in items)
+        forecast.append({
+            "date": day,
+            "min_temp": round(min(temperatures), 1),
+            "max_temp": round(max(temperatures), 1),
+            "rain_mm": round(sum((item.get("rain") or {}).get("3h", 0) for item in items), 1),
+            "max_wind_speed": round(max(item.get("wind", {}).get("speed", 0) for item in items) * 3.6, 1),
+            "description": descriptions.most_common(1)[0][0].capitalize(),
+        })
+    return forecast
+
+
+def _fetch_forecast_and_store(key: Tuple, params: Dict[str, Any]) -> list:
+    with stage_timer("weather_forecast_upstream"):
+        forecast_json = _call_openweather(_get_forecast, params)
+    forecast = _extract_forecast(forecast_json)
+    forecast_cache.set(key, forecast)
+    return forecast
+
+
+async def _fetch_and_store_async(key: Tuple, params: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    try:
+        with stage_timer("weather_upstream"):
+            response = await _openweather.call_async(_get_weather_async, params)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        raise WeatherServiceError(f"Weather API error: {exc.response.text}") from exc
+    except httpx.RequestError as exc:
+        raise WeatherServiceError(f"Connection to weather service failed: {str(exc)}") from exc
+
+    return _store_summary(key, response.json())
+
+
+@timed("fetch_weather_summary")
 def fetch_weather_summary(lat: Optional[str] = None, lon: Optional[str] = None, city: Optional[str] = None) -> Dict[str, Any]:
     """
     Fetch weather data from OpenWeather and convert it into a concise summary.
+    Results are cached per grid cell (or normalized city name) for WEATHER_CACHE_TTL seconds,
+    and concurrent misses for the same cell wait on a single upstream request.
     """
     if not OPENWEATHER_API_KEY:
         raise WeatherServiceError("OPENWEATHER_API_KEY is missing. Please add it to your .env file.")
 
+    key = _cache_key(lat, lon, city)
+    cached = weather_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
     params = _build_params(lat, lon, city)
+    return copy.deepcopy(_weather_flights.do(key, _fetch_and_store, key, params))
 
-    try:
-        response = httpx.get(OPENWEATHER_BASE_URL, params=params, timeout=10)
-        response.raise_for_status()
-    except httpx.HTTPStatusError as exc:
-        raise WeatherServiceError(f"Weather API error: {exc.response.text}") from exc
-    except httpx.RequestError as exc:
-        raise WeatherServiceError(f"Connection to weather service failed: {str(exc)}") from exc
 
-    details, context = _extract_details(response.json())
-    return {
-        "context": context,
-        "details": details,
-    }
+@timed("fetch_weather_summary")
+async def fetch_weather_summary_async(lat: Optional[str] = None, lon: Optional[str] = None,
+                                      city: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Async variant of fetch_weather_summary for the ASGI server; shares the same cache.
+    """
+    if not OPENWEATHER_API_KEY:
+        raise WeatherServiceError("OPENWEATHER_API_KEY is missing. Please add it to your .env file.")
+
+    key = _cache_key(lat, lon, city)
+    cached = weather_cache.get(key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    params = _build_params(lat, lon, city)
+    return copy.deepcopy(await _async_weather_flights.do(key, _fetch_and_store_async, key, params))
+
+
+
+class FarmPrefetcher:
+    """
+    Registered farms, grouped by weather cell, with a due-time queue per
+    (cell, kind). A scheduler thread takes due cells in order, waits for the
+    rate budget and hands them to a few workers, so hundreds of farms are
+    kept warm without bursts against OpenWeather. Cells are shared with the
+    on-demand /api/weather cache, so a prefetched farm is also a cache hit there.
+    """
+
+    _KINDS = ("current", "forecast")
+
+    def __init__(self, rate: float = WEATHER_PREFETCH_RPS, workers: int = WEATHER_PREFETCH_WORKERS,
+                 max_farms: int = WEATHER_MAX_FARMS):
+        self.max_farms = max_farms
+        self._bucket = TokenBucket(rate=rate, capacity=max(1, workers))
+        self._slots = threading.BoundedSemaphore(workers)
+        self._workers = workers
+        self._executor = None
+        self._farms = {}                    # farm id -> cell key
+        self._cells = {}                    # cell key -> {"params", "farms", "due", "updated"}
+        self._queue = []                    # heap of (due at, sequence, cell key, kind)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # ---- registration ----
+    def register(self, farm_id: str, lat: Optional[str] = None, lon: Optional[str] = None,
+                 city: Optional[str] = None):
+        """Add or move a farm; its cell is fetched as soon as the budget allows."""
+        if not OPENWEATHER_API_KEY:
+            raise WeatherServiceError("OPENWEATHER_API_KEY is missing. Please add it to your .env file.")
+        key = _cache_key(lat, lon, city)
+        params = _build_params(lat, lon, city)
+        with self._cond:
+            if self._farms.get(farm_id) == key:
+                return
+            if farm_id not in self._farms and len(self._farms) >= self.max_farms:
+                raise WeatherServiceError(f"Farm limit reached ({self.max_farms}).")
+            self._remove(farm_id)
+            self._farms[farm_id] = key
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = {"params": params, "farms": set(),
+                                           "due": {}, "updated": {}}
+                now = time.monotonic()
+                for kind in self._KINDS:
+                    self._schedule(key, kind, now)
+            cell["farms"].add(farm_id)
+        self._ensure_started()
+
+    def unregister(self, farm_id: str) -> bool:
+        with self._cond:
+            return self._remove(farm_id)
+
+    def _remove(self, farm_id: str) -> bool:
+        key = self._farms.pop(farm_id, None)
+        if key is None:
+            return False
+        cell = self._cells[key]
+        cell["farms"].discard(farm_id)
+        if not cell["farms"]:
+            del self._cells[key]            # its queued refreshes are dropped when they come due
+        return True
+
+    # ---- bulk read ----
+    def bulk_summaries(self, farm_ids: list) -> Dict[str, Any]:
+        """
+        Current summary and daily forecast per farm, read from the warm store
+        without any upstream call. Farms whose cell is not warm yet are
+        reported as pending and moved to the front of the queue.
+        """
+        results = {}
+        now = time.monotonic()
+        with self._cond:
+            for farm_id in farm_ids:
+                key = self._farms.get(farm_id)
+                if key is None:
+                    results[farm_id] = {"status": "unknown"}
+                    continue
+                cell = self._cells[key]
+                current = weather_cache.get(key)
+                if current is None:
+                    self._expedite(key, "current", now)
+                    results[farm_id] = {"status": "pending"}
+                    continue
+                forecast = forecast_cache.get(key)
+                if forecast is None:
+                    self._expedite(key, "forecast", now)
+                updated = cell["updated"].get("current")
+                # Cached objects are shared read-only here; the response is serialized before they change
+                results[farm_id] = {
+                    "status": "ready",
+                    "context": current["context"],
+                    "details": current["details"],
+                    "forecast": forecast,
+                    "age_s": round(now - updated, 1) if updated is not None else None,
+                }
+        return results
+
+    # ---- scheduling ----
+    def _schedule(self, key: Tuple, kind: str, due_at: float):
+        self._cells[key]["due"][kind] = due_at
+        heapq.heappush(self._queue, (due_at, next(self._sequence), key, kind))
+        self._cond.notify()
+
+    def _expedite(self, key: Tuple, kind: str, now: float):
+        due_at = self._cells[key]["due"].get(kind)
+        if due_at is not None and due_at > now:
+            self._schedule(key, kind, now)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="weather-prefetch")
+                self._thread = threading.Thread(target=self._run, name="weather-prefetch-scheduler", daemon=True)
+                self._thread.start()
+                print("[WEATHER] Prefetch scheduler started")
+
+    def _next_due(self):
+        """Block until a queued refresh is due; returns (key, kind, params)."""
+        with self._cond:
+            while True:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                due_at, _, key, kind = self._queue[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                cell = self._cells.get(key)
+                # Stale entries: the cell was unregistered or its refresh was rescheduled
+                if cell is None or cell["due"].get(kind) != due_at:
+                    continue
+                cell["due"][kind] = None    # in progress; not expedited again until rescheduled
+                return key, kind, cell["params"]
+
+    def _run(self):
+        while True:
+            key, kind, params = self._next_due()
+            self._bucket.acquire()
+            self._slots.acquire()
+            self._executor.submit(self._refresh, key, kind, params)
+
+    def _refresh(self, key: Tuple, kind: str, params: Dict[str, Any]):
+        try:
+            if kind == "current":
+                _weather_flights.do(key, _fetch_and_store, key, params)
+                delay = WEATHER_CACHE_TTL * _REFRESH_AT
+            else:
+                _forecast_flights.do(key, _fetch_forecast_and_store, key, params)
+                delay = WEATHER_FORECAST_TTL * _REFRESH_AT
+            outcome = "ok"
+        except UpstreamUnavailable as exc:
+            # Circuit open or deadline hit: wait the breaker out instead of queueing more calls
+            outcome, delay = "skipped", max(exc.retry_after or 0, WEATHER_PREFETCH_RETRY)
+        except Exception as exc:
+            print(f"[WEATHER] Prefetch of {kind} weather for {key} failed: {exc}")
+            outcome, delay = "error", WEATHER_PREFETCH_RETRY
+        finally:
+            self._slots.release()
+        WEATHER_PREFETCHES.inc(kind=kind, outcome=outcome)
+
+        with self._cond:
+            if key in self._cells:
+                if outcome == "ok":
+                    self._cells[key]["updated"][kind] = time.monotonic()
+                self._schedule(key, kind, time.monotonic() + delay)
+
+    def stats(self) -> Dict[str, int]:
+        return {"farms": len(self._farms), "cells": len(self._cells)}
+
+
+prefetcher = FarmPrefetcher()
+
+
+def register_farms(farms: list) -> Dict[str, Any]:
+    """
+    Keep each farm's conditions and forecast warm for bulk reads.
+    farms: [{"id": ..., "lat": ..., "lon": ...} or {"id": ..., "city": ...}]; invalid
+    entries are reported per farm id and do not stop the others.
+    """
+    registered, errors = 0, {}
+    for index, farm in enumerate(farms):
+        farm_id = farm.get("id") if isinstance(farm, dict) else None
+        if farm_id is None or farm_id == "":
+            errors[f"#{index}"] = "Each farm needs an id."
+            continue
+        try:
+            prefetcher.register(str(farm_id), lat=farm.get("lat"), lon=farm.get("lon"), city=farm.get("city"))
+            registered += 1
+        except WeatherServiceError as exc:
+            errors[str(farm_id)] = str(exc)
+    return {"registered": registered, "errors": errors, "farms": prefetcher.stats()["farms"]}
+
+
+def unregister_farm(farm_id: str) -> bool:
+    return prefetcher.unregister(farm_id)
+
+
+def bulk_weather_summaries(farm_ids: list) -> Dict[str, Any]:
+    """Summaries for up to WEATHER_BULK_MAX registered farms, straight from the warm store."""
+    if len(farm_ids) > WEATHER_BULK_MAX:
+        raise WeatherServiceError(f"At most {WEATHER_BULK_MAX} farms per request.")
+    results = prefetcher.bulk_summaries([str(farm_id) for farm_id in farm_ids])
+    counts = TallyCounter(result["status"] for result in results.values())
+    return {"farms": results, **{status: counts[status] for status in ("ready", "pending", "unknown")}}
+
+
+def _collect_prefetch_state():
+    stats = prefetcher.stats()
+    return [
+        ("agrobot_weather_farms", "gauge", "Farms registered for background weather refresh.",
+         [({}, stats["farms"])]),
+        ("agrobot_weather_prefetch_cells", "gauge", "Distinct weather cells those farms fall into.",
+         [({}, stats["cells"])]),
+    ]
+
 
+metrics_registry.register_collector(_collect_prefetch_state)
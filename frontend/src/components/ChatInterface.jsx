@@ -3,6 +3,35 @@ import { FaMicrophone, FaStop, FaPaperPlane, FaImage, FaVolumeUp, FaArrowLeft, F
 import { motion, AnimatePresence } from 'framer-motion'
 import axios from 'axios'
 
+// Prefer the cacheable /api/audio URL; older backends only send base64
+const ttsAudioUrl = (data) => {
+  if (data.audio_url) return data.audio_url
+  return data.audio ? `data:audio/${data.format || 'mp3'};base64,${data.audio}` : null
+}
+
+// Queue a photo for analysis, then long-poll the job until a worker has finished it
+const analyzeImage = async (file) => {
+  const formData = new FormData()
+  formData.append('image', file)
+  let { data: job } = await axios.post('/api/analyze-image/jobs', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' }
+  })
+  const pollUrl = job.poll_url || `/api/analyze-image/jobs/${job.job_id}`
+  while (job.status === 'queued' || job.status === 'running') {
+    const res = await axios.get(pollUrl, { params: { wait: 10 } })
+    job = res.data
+    // The Flask server answers at once with a Retry-After instead of long-polling
+    const retryAfter = Number(res.headers['retry-after'])
+    if (retryAfter && (job.status === 'queued' || job.status === 'running')) {
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000))
+    }
+  }
+  if (job.status !== 'done') {
+    throw new Error(job.error || 'Image analysis failed')
+  }
+  return job.analysis
+}
+
 const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
   // Load messages from localStorage on component mount
   const [messages, setMessages] = useState(() => {
@@ -22,6 +51,14 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
   const [isPaused, setIsPaused] = useState(false)
   const [weatherContext, setWeatherContext] = useState(null)
   const [isFetchingWeather, setIsFetchingWeather] = useState(false)
+  // Per-browser conversation id so the backend keeps a separate, bounded history
+  const [sessionId, setSessionId] = useState(() => {
+    const saved = localStorage.getItem('agrobot_session_id')
+    if (saved) return saved
+    const id = window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(16).slice(2)}`
+    localStorage.setItem('agrobot_session_id', id)
+    return id
+  })
   
   const messagesEndRef = useRef(null)
   const mediaRecorderRef = useRef(null)
@@ -46,10 +83,14 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     scrollToBottom()
   }, [messages])
 
+  const lastMessageIdRef = useRef(0)
+
   // Add message to chat
   const addMessage = (content, type, sender = 'user') => {
+    // Strictly increasing, so a question and its reply placeholder added in the same millisecond differ
+    lastMessageIdRef.current = Math.max(Date.now(), lastMessageIdRef.current + 1)
     const newMessage = {
-      id: Date.now(),
+      id: lastMessageIdRef.current,
       content,
       type, // 'text', 'voice', 'image'
       sender, // 'user' or 'bot'
@@ -59,6 +100,41 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     return newMessage.id
   }
 
+  // Replace the content of an existing message (used while a reply streams in)
+  const updateMessage = (id, content) => {
+    setMessages(prev => prev.map(m => (m.id === id ? { ...m, content } : m)))
+  }
+
+  const removeMessage = (id) => {
+    setMessages(prev => prev.filter(m => m.id !== id))
+  }
+
+  // POST to an SSE endpoint and call onEvent(event, data) for each message
+  const streamEvents = async (url, body, onEvent) => {
+    const res = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    })
+    if (!res.ok || !res.body) throw new Error(`Stream request failed (${res.status})`)
+
+    const reader = res.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const events = buffer.split('\n\n')
+      buffer = events.pop()
+      for (const raw of events) {
+        const eventLine = raw.split('\n').find(l => l.startsWith('event: '))
+        const dataLine = raw.split('\n').find(l => l.startsWith('data: '))
+        if (dataLine) onEvent(eventLine ? eventLine.slice(7) : 'message', JSON.parse(dataLine.slice(6)))
+      }
+    }
+  }
+
   // Handle text input send
   const handleTextSend = async () => {
     if (!inputText.trim() || isProcessing) return
@@ -69,30 +145,43 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     setIsProcessing(true)
     setError('')
 
+    let botMessageId = null
+    let aiResponse = ''
     try {
       // Get AI response
-      const payload = { message: userMessage }
+      const payload = { message: userMessage, sessionId }
       if (weatherContext?.context) {
         payload.weatherContext = weatherContext.context
       }
 
-      const chatRes = await axios.post('/api/chat', payload)
-      const aiResponse = chatRes.data.response
+      // Stream the English answer in as it is written
+      botMessageId = addMessage({ text: '', audio: null, autoPlay: false }, 'text', 'bot')
+      await streamEvents('/api/chat/stream', payload, (event, data) => {
+        if (event === 'delta') {
+          aiResponse += data.text
+          updateMessage(botMessageId, { text: aiResponse, audio: null, autoPlay: false })
+        } else if (event === 'done') {
+          aiResponse = data.response
+        } else if (event === 'error') {
+          throw new Error(data.error)
+        }
+      })
 
       // Get TTS and translated text
       const ttsRes = await axios.post('/api/tts', {
         text: aiResponse,
-        language: language
+        language: language,
+        inline: false
       })
 
       const translatedText = ttsRes.data.translated_text || aiResponse
-      const audioBase64 = ttsRes.data.audio
-      const format = ttsRes.data.format || 'mp3'
-      const audioUrl = audioBase64 ? `data:audio/${format};base64,${audioBase64}` : null
+      const audioUrl = ttsAudioUrl(ttsRes.data)
 
-      // Add bot message with audio but NO auto-play for text input
-      addMessage({ text: translatedText, audio: audioUrl, autoPlay: false }, 'text', 'bot')
+      // Swap in the translated text and audio, but NO auto-play for text input
+      updateMessage(botMessageId, { text: translatedText, audio: audioUrl, autoPlay: false })
     } catch (err) {
+      // Drop the empty answer bubble; a partly streamed or untranslated answer is kept
+      if (botMessageId && !aiResponse) removeMessage(botMessageId)
       setError('Failed to get response. Please try again.')
       console.error('Error:', err)
     } finally {
@@ -145,17 +234,21 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     setError('')
 
     try {
-      // Transcribe
+      // Transcribe, answer and speak in a single round trip
       const formData = new FormData()
       const filename = audioBlob.type.includes('webm') ? 'recording.webm' : 'recording.wav'
       formData.append('audio', audioBlob, filename)
       formData.append('language', language)
+      formData.append('sessionId', sessionId)
+      if (weatherContext?.context) {
+        formData.append('weatherContext', weatherContext.context)
+      }
 
-      const transcribeRes = await axios.post('/api/transcribe', formData, {
+      const voiceRes = await axios.post('/api/voice', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       })
 
-      const transcription = transcribeRes.data.text
+      const transcription = voiceRes.data.text
       if (!transcription) {
         setError('Could not transcribe audio.')
         setIsProcessing(false)
@@ -165,25 +258,10 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
       // Show transcription in chat as user message
       addMessage(transcription, 'voice', 'user')
 
-      // Get AI response
-      const payload = { message: transcription }
-      if (weatherContext?.context) {
-        payload.weatherContext = weatherContext.context
-      }
-
-      const chatRes = await axios.post('/api/chat', payload)
-      const aiResponse = chatRes.data.response
-
-      // Get TTS
-      const ttsRes = await axios.post('/api/tts', {
-        text: aiResponse,
-        language: language
-      })
-
-      const translatedText = ttsRes.data.translated_text || aiResponse
-        const audioBase64 = ttsRes.data.audio
-        const format = ttsRes.data.format || 'mp3'
-        const audioUrl = audioBase64 ? `data:audio/${format};base64,${audioBase64}` : null
+      const translatedText = voiceRes.data.translated_text || voiceRes.data.response
+      const audioBase64 = voiceRes.data.audio
+      const format = voiceRes.data.format || 'mp3'
+      const audioUrl = audioBase64 ? `data:audio/${format};base64,${audioBase64}` : null
 
       // Add bot message with audio
       const messageId = addMessage({ text: translatedText, audio: audioUrl, autoPlay: true }, 'voice', 'bot')
@@ -209,26 +287,18 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     setError('')
 
     try {
-      // Analyze image
-      const formData = new FormData()
-      formData.append('image', file)
-
-      const analyzeRes = await axios.post('/api/analyze-image', formData, {
-        headers: { 'Content-Type': 'multipart/form-data' }
-      })
-
-      const result = analyzeRes.data.analysis
+      // Analyze image (queued on the backend's image workers)
+      const result = await analyzeImage(file)
 
       // Get TTS
       const ttsRes = await axios.post('/api/tts', {
         text: result,
-        language: language
+        language: language,
+        inline: false
       })
 
       const translatedText = ttsRes.data.translated_text || result
-        const audioBase64 = ttsRes.data.audio
-        const format = ttsRes.data.format || 'mp3'
-        const audioUrl = audioBase64 ? `data:audio/${format};base64,${audioBase64}` : null
+      const audioUrl = ttsAudioUrl(ttsRes.data)
 
       addMessage({ text: translatedText, audio: audioUrl }, 'image', 'bot')
     } catch (err) {
@@ -338,6 +408,10 @@ const ChatInterface = ({ language, setLanguage, onBackToHome }) => {
     if (window.confirm('Are you sure you want to clear all chat messages?')) {
       setMessages([])
       localStorage.removeItem('agrobot_chat_messages')
+      // Start a fresh server-side conversation as well
+      const newId = window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(16).slice(2)}`
+      localStorage.setItem('agrobot_session_id', newId)
+      setSessionId(newId)
       stopAudio()
     }
   }
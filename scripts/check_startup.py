@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Startup-time budget check for the AgroBot backend.
+
+Imports backend_api in a fresh interpreter with no API keys set and fails if
+the import is slower than STARTUP_BUDGET_MS or pulls in an upstream SDK that
+should only load on first use (see backend/providers.py).
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 800))
+STARTUP_RUNS = int(os.getenv("STARTUP_RUNS", 3))
+
+HEAVY_MODULES = [
+    "google.generativeai",
+    "groq",
+    "gtts",
+    "deep_translator",
+    "PIL",
+    "av",
+    "numpy",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """Import `module` in a clean interpreter; returns (milliseconds, heavy modules loaded)."""
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    env.pop("AGROBOT_WARMUP", None)
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit(f"✗ import {module} failed without API keys")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["ms"], report["loaded"]
+
+
+def main():
+    print("=" * 50)
+    print("  AgroBot Startup Budget Check")
+    print("=" * 50)
+    all_good = True
+
+    for module in ("backend_api", "backend_asgi"):
+        timings, loaded = [], []
+        for _ in range(STARTUP_RUNS):
+            ms, loaded = measure(module)
+            timings.append(ms)
+        best = min(timings)
+
+        if best <= STARTUP_BUDGET_MS:
+            print(f"✓ import {module}: {best:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
+        else:
+            print(f"✗ import {module}: {best:.0f} ms exceeds budget of {STARTUP_BUDGET_MS:.0f} ms")
+            all_good = False
+
+        if loaded:
+            print(f"✗ {module} eagerly imports: {', '.join(loaded)}")
+            all_good = False
+        else:
+            print(f"✓ {module} defers all upstream SDKs")
+
+    print()
+    print("✅ Startup within budget" if all_good else "⚠️  Startup budget exceeded")
+    return 0 if all_good else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
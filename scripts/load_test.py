@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the AgroBot backend.
+
+Drives every /api/* endpoint at a target request rate (open loop, Poisson
+arrivals) and reports p50/p95/p99 latency, throughput and error rate per
+endpoint. With --spawn it starts backend/upstream_stubs.py and
+backend/backend_api.py itself, wired together through the *_BASE_URL
+overrides, so no network access or API keys are needed.
+
+Usage:
+    python scripts/load_test.py --spawn --rps 20 --duration 60
+    python scripts/load_test.py --target http://localhost:5000 --mix chat=3,weather=1
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+import wave
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+# Relative share of traffic per endpoint
+DEFAULT_MIX = {
+    "chat": 25,
+    "chat_stream": 20,
+    "weather": 15,
+    "weather_bulk": 3,
+    "farms": 1,
+    "tts": 10,
+    "tts_stream": 5,
+    "audio": 5,
+    "transcribe": 5,
+    "voice": 10,
+    "analyze_image": 5,
+    "analyze_image_job": 3,
+    "health": 5,
+    "metrics": 1,
+}
+LANGUAGES = ["en", "hi", "te"]
+QUESTIONS = [
+    "My tomato leaves have brown spots, what should I do?",
+    "When should I apply urea to paddy?",
+    "How often should I irrigate cotton in summer?",
+    "Which crop is good after groundnut?",
+    "How do I control aphids on mustard without chemicals?",
+    "What is the right spacing for chilli seedlings?",
+]
+SPEECH = [
+    "Water your plants early in the morning. Keep the leaves dry.",
+    "Apply the second dose of fertilizer after weeding. Then irrigate lightly.",
+    "Remove the infected leaves and burn them. Spray neem oil in the evening.",
+]
+
+
+# -------------------------------------------------------
+# Request payloads
+# -------------------------------------------------------
+def _make_wav(seconds: float) -> bytes:
+    """A 16 kHz mono WAV of tone bursts separated by pauses (speech-like for the VAD)."""
+    rate = 16000
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        voiced = (i // (rate // 2)) % 3 != 2
+        frames += struct.pack("<h", int(6000 * math.sin(i * 0.07)) if voiced else 0)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def _make_images(count: int) -> list:
+    """Distinct small PNGs so image dedup sees both repeats and new photos."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for index in range(count):
+        rng = random.Random(index)
+        image = Image.new("RGB", (160, 120), (40, 120 + rng.randint(0, 80), 40))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randint(0, 150), rng.randint(0, 110)
+            draw.ellipse((x, y, x + 10, y + 10), fill=(120 + rng.randint(0, 60), 80, 30))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+class Payloads:
+    def __init__(self, sessions: int, images: int, farms: int = 200):
+        self.session_ids = [f"loadtest-{i}" for i in range(sessions)]
+        self.audio = [_make_wav(seconds) for seconds in (3, 6, 12)]
+        self.images = _make_images(images)
+        self.audio_urls = []            # /api/audio/<key>.mp3 URLs handed out by /api/tts
+        self.farms = [{"id": f"loadtest-farm-{i}", "lat": lat, "lon": lon}
+                      for i, (lat, lon) in enumerate(self.coordinates() for _ in range(farms))]
+
+    def session(self) -> str:
+        return random.choice(self.session_ids)
+
+    def coordinates(self):
+        # Random farms across central/southern India; nearby ones share a weather grid cell
+        return round(random.uniform(12.0, 24.0), 3), round(random.uniform(73.0, 84.0), 3)
+
+
+async def _read_stream(response, result: dict):
+    """Consume a streamed body, recording time to first byte."""
+    async for chunk in response.aiter_bytes():
+        if chunk and "ttfb" not in result:
+            result["ttfb"] = time.perf_counter()
+        result.setdefault("body", b"")
+        result["body"] += chunk
+
+
+async def call_endpoint(client: httpx.AsyncClient, name: str, payloads: Payloads) -> dict:
+    """Issue one request; returns {"status": int, "ttfb": perf_counter?, "body": bytes?}."""
+    result = {}
+    if name == "chat":
+        response = await client.post("/api/chat", json={
+            "message": random.choice(QUESTIONS), "sessionId": payloads.session()})
+    elif name == "chat_stream":
+        async with client.stream("POST", "/api/chat/stream", json={
+                "message": random.choice(QUESTIONS), "sessionId": payloads.session()}) as response:
+            await _read_stream(response, result)
+        if b"event: error" in result.get("body", b""):
+            result["status"] = 599     # stream opened but the upstream failed mid-way
+            return result
+    elif name == "weather":
+        lat, lon = payloads.coordinates()
+        response = await client.get("/api/weather", params={"lat": lat, "lon": lon})
+    elif name == "weather_bulk":
+        farms = random.sample(payloads.farms, 50)
+        response = await client.post("/api/weather/bulk", json={"farms": [farm["id"] for farm in farms]})
+    elif name == "farms":
+        # Re-registering a farm is harmless, so the registered set simply grows over the run
+        response = await client.post("/api/farms", json={"farms": random.sample(payloads.farms, 10)})
+    elif name == "tts":
+        response = await client.post("/api/tts", json={
+            "text": random.choice(SPEECH), "language": random.choice(LANGUAGES)})
+        url = response.json().get("audio_url") if response.status_code == 200 else None
+        if url and url not in payloads.audio_urls:
+            payloads.audio_urls.append(url)
+    elif name == "audio":
+        if not payloads.audio_urls:
+            # Nothing synthesized yet: get a clip's URL first (only happens at the start of a run)
+            setup = await client.post("/api/tts", json={"text": random.choice(SPEECH), "language": "en",
+                                                        "inline": False})
+            if setup.status_code != 200 or not setup.json().get("audio_url"):
+                result["status"] = setup.status_code
+                return result
+            payloads.audio_urls.append(setup.json()["audio_url"])
+        response = await client.get(random.choice(payloads.audio_urls))
+    elif name == "tts_stream":
+        async with client.stream("POST", "/api/tts/stream", json={
+                "text": random.choice(SPEECH), "language": random.choice(LANGUAGES)}) as response:
+            await _read_stream(response, result)
+    elif name == "transcribe":
+        response = await client.post("/api/transcribe",
+                                     files={"audio": ("audio.wav", random.choice(payloads.audio), "audio/wav")},
+                                     data={"language": random.choice(LANGUAGES)})
+    elif name == "voice":
+        response = await client.post("/api/voice",
+                                     files={"audio": ("audio.wav", random.choice(payloads.audio), "audio/wav")},
+                                     data={"language": random.choice(LANGUAGES), "sessionId": payloads.session()})
+    elif name == "analyze_image":
+        response = await client.post("/api/analyze-image",
+                                     files={"image": ("leaf.png", random.choice(payloads.images), "image/png")})
+    elif name == "analyze_image_job":
+        # Submit, then poll until the job finishes; latency covers the whole analysis
+        response = await client.post("/api/analyze-image/jobs",
+                                     files={"image": ("leaf.png", random.choice(payloads.images), "image/png")})
+        job = response.json() if response.status_code == 202 else {}
+        while job.get("status") in ("queued", "running"):
+            response = await client.get(job["poll_url"], params={"wait": 10})
+            job = {**response.json(), "poll_url": job["poll_url"]} if response.status_code == 200 else {}
+            if job.get("status") in ("queued", "running") and "retry-after" in response.headers:
+                await asyncio.sleep(float(response.headers["retry-after"]))
+        if job.get("status") == "failed":
+            result["status"] = 599     # the job ran but its analysis failed
+            return result
+    elif name == "health":
+        response = await client.get("/api/health")
+    elif name == "metrics":
+        response = await client.get("/api/metrics")
+    else:
+        raise ValueError(f"Unknown endpoint {name}")
+
+    result["status"] = response.status_code
+    return result
+
+
+# -------------------------------------------------------
+# Load generation and reporting
+# -------------------------------------------------------
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.ttfbs = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, status: int, latency: float, ttfb: float | None):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if 200 <= status < 400:
+            self.latencies.append(latency)
+            if ttfb is not None:
+                self.ttfbs.append(ttfb)
+        else:
+            self.errors += 1
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies) + self.errors
+
+
+def percentile(values, q: float):
+    """Nearest-rank percentile in ms, or None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return round(ordered[rank] * 1000, 1)
+
+
+async def run_load(target: str, mix: dict, rps: float, duration: float, max_in_flight: int,
+                   payloads: Payloads, timeout: float) -> tuple:
+    stats = {name: EndpointStats() for name in mix}
+    names, weights = list(mix), list(mix.values())
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    in_flight = set()
+    dropped = 0
+
+    async def one(name: str, scheduled: float):
+        try:
+            result = await call_endpoint(client, name, payloads)
+            status = result["status"]
+        except httpx.HTTPError:
+            result, status = {}, 0
+        done = time.perf_counter()
+        # Latency counts from the scheduled send time, so client-side queueing is not hidden
+        ttfb = result["ttfb"] - scheduled if "ttfb" in result else None
+        stats[name].record(status, done - scheduled, ttfb)
+
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        next_send = start
+        while next_send - start < duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                dropped += 1
+            else:
+                task = asyncio.create_task(one(random.choices(names, weights)[0], next_send))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_send += random.expovariate(rps)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        elapsed = time.perf_counter() - start
+
+    return stats, elapsed, dropped
+
+
+def build_report(stats: dict, elapsed: float, dropped: int, rps: float) -> dict:
+    endpoints = {}
+    for name, endpoint in stats.items():
+        if not endpoint.count:
+            continue
+        endpoints[name] = {
+            "requests": endpoint.count,
+            "throughput_rps": round(len(endpoint.latencies) / elapsed, 2),
+            "error_rate": round(endpoint.errors / endpoint.count, 4),
+            "p50_ms": percentile(endpoint.latencies, 50),
+            "p95_ms": percentile(endpoint.latencies, 95),
+            "p99_ms": percentile(endpoint.latencies, 99),
+            "ttfb_p50_ms": percentile(endpoint.ttfbs, 50),
+            "ttfb_p95_ms": percentile(endpoint.ttfbs, 95),
+            "statuses": {str(code): n for code, n in sorted(endpoint.statuses.items())},
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(stats[name].errors for name in endpoints)
+    return {
+        "target_rps": rps,
+        "elapsed_s": round(elapsed, 1),
+        "requests": total,
+        "achieved_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "dropped": dropped,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: dict):
+    print()
+    print(f"{'endpoint':<18}{'reqs':>7}{'ok/s':>8}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb p50':>10}")
+    for name, row in report["endpoints"].items():
+        cells = [row[k] if row[k] is not None else "-" for k in ("p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms")]
+        print(f"{name:<18}{row['requests']:>7}{row['throughput_rps']:>8}{row['error_rate'] * 100:>6.1f}%"
+              f"{cells[0]:>9}{cells[1]:>9}{cells[2]:>9}{cells[3]:>10}")
+    print()
+    print(f"{report['requests']} requests in {report['elapsed_s']} s "
+          f"({report['achieved_rps']} rps, target {report['target_rps']}), "
+          f"error rate {report['error_rate'] * 100:.1f}%, dropped at client {report['dropped']}")
+
+
+# -------------------------------------------------------
+# --spawn: stand-in upstreams + real backend
+# -------------------------------------------------------
+def _check_port_free(port: int):
+    """Refuse to start when something already listens on the port: the test would attach to it."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        if sock.connect_ex(("127.0.0.1", port)) == 0:
+            raise SystemExit(f"Port {port} is already in use (a leftover server?); stop it or pick another port")
+
+
+def _wait_for(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{' '.join(process.args)} exited with code {process.returncode} "
+                             f"before {url} answered (rerun with --verbose to see its output)")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def upstream_calls(stubs_port: int) -> dict:
+    return {name: s["calls"] for name, s in httpx.get(f"http://127.0.0.1:{stubs_port}/stats").json().items()}
+
+
+def spawn_servers(args, processes: list):
+    """Start the stand-ins and the backend, appending them to processes (so the caller can stop them)."""
+    _check_port_free(args.stubs_port)
+    _check_port_free(args.backend_port)
+    stubs_url = f"http://127.0.0.1:{args.stubs_port}"
+    stub_cmd = [sys.executable, "upstream_stubs.py", "--port", str(args.stubs_port)]
+    for value in args.stub_latency or []:
+        stub_cmd += ["--latency", value]
+    for value in args.stub_errors or []:
+        stub_cmd += ["--errors", value]
+    if args.seed is not None:
+        stub_cmd += ["--seed", str(args.seed)]
+
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(args.backend_port),
+        "GEMINI_BASE_URL": stubs_url,
+        "GROQ_BASE_URL": stubs_url,
+        "TRANSLATE_BASE_URL": stubs_url,
+        "OPENWEATHER_BASE_URL": stubs_url,
+        "GOOGLE_API_KEY": "loadtest",
+        "GROQ_API_KEY": "loadtest",
+        "OPENWEATHER_API_KEY": "loadtest",
+    })
+    log = None if args.verbose else subprocess.DEVNULL
+    processes.append(subprocess.Popen(stub_cmd, cwd=BACKEND_DIR, stdout=log, stderr=log))
+    _wait_for(f"{stubs_url}/stats", processes[-1])
+    processes.append(subprocess.Popen([sys.executable, args.server], cwd=BACKEND_DIR, env=env,
+                                      stdout=log, stderr=log))
+    _wait_for(f"http://127.0.0.1:{args.backend_port}/api/health", processes[-1])
+
+
+def parse_mix(value: str | None, endpoints: str | None) -> dict:
+    mix = dict(DEFAULT_MIX)
+    if value:
+        mix = {}
+        for item in value.split(","):
+            name, _, weight = item.partition("=")
+            mix[name.strip()] = float(weight or 1)
+    if endpoints:
+        wanted = {name.strip() for name in endpoints.split(",")}
+        mix = {name: weight for name, weight in mix.items() if name in wanted}
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown or not mix:
+        raise SystemExit(f"Unknown or empty endpoint mix {sorted(unknown)}; choose from {sorted(DEFAULT_MIX)}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the AgroBot backend")
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="Backend base URL")
+    parser.add_argument("--rps", type=float, default=10, help="Target request rate (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--mix", help="Endpoint weights, e.g. chat=3,weather=1 (default: all endpoints)")
+    parser.add_argument("--endpoints", help="Comma-separated subset of endpoints to drive")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Client-side concurrency cap")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--sessions", type=int, default=50, help="Distinct chat session ids")
+    parser.add_argument("--images", type=int, default=20, help="Distinct leaf images")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible traffic")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start upstream_stubs.py and the backend locally and test against them")
+    parser.add_argument("--server", default="backend_api.py", help="Backend entry point used with --spawn")
+    parser.add_argument("--backend-port", type=int, default=5055)
+    parser.add_argument("--stubs-port", type=int, default=9100)
+    parser.add_argument("--stub-latency", action="append", metavar="NAME=MEDIAN[:P95]")
+    parser.add_argument("--stub-errors", action="append", metavar="NAME=RATE[:STATUS]")
+    parser.add_argument("--verbose", action="store_true", help="Show server output with --spawn")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = parse_mix(args.mix, args.endpoints)
+    payloads = Payloads(args.sessions, args.images)
+
+    processes = []
+    try:
+        if args.spawn:
+            spawn_servers(args, processes)
+            args.target = f"http://127.0.0.1:{args.backend_port}"
+            calls_before = upstream_calls(args.stubs_port)
+
+        print(f"Load testing {args.target} at {args.rps} rps for {args.duration} s: {mix}")
+        stats, elapsed, dropped = asyncio.run(run_load(
+            args.target, mix, args.rps, args.duration, args.max_in_flight, payloads, args.timeout))
+        if args.spawn:
+            for process in processes:
+                if process.poll() is not None:
+                    raise SystemExit(f"{' '.join(process.args)} exited with code {process.returncode} during the run")
+            # Only this run's calls, not whatever the stand-ins served before it
+            calls = {name: n - calls_before.get(name, 0) for name, n in upstream_calls(args.stubs_port).items()}
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = build_report(stats, elapsed, dropped, args.rps)
+    if args.spawn:
+        report["upstream_calls"] = calls
+    print_report(report)
+    if args.spawn:
+        print(f"Upstream calls: {report['upstream_calls']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""The backend modules import each other by name (they run from backend/), so tests do too."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
@@ -0,0 +1,67 @@
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, client_id, endpoint_class
+from resilience import upstream
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("/api/analyze-image", "vision"),
+    ("/api/analyze-image/jobs", "vision"),
+    ("/api/analyze-image/jobs/abc", "light"),
+    ("/api/weather", "weather"),
+    ("/api/weather/bulk", "weather_bulk"),
+    ("/api/chat/stream", "chat"),
+    ("/api/chatter", None),
+    ("/api/metrics", None),
+])
+def test_endpoint_class(path, expected):
+    assert endpoint_class(path) == expected
+
+
+def test_client_over_its_rate_gets_429_with_retry_after():
+    controller = AdmissionController(rate=1, burst=10)
+    assert controller.admit("farmer", "/api/analyze-image")         # vision costs 10
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit("farmer", "/api/analyze-image")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after == 10
+    # Other classes and other clients have their own buckets
+    assert controller.admit("farmer", "/api/weather")
+    assert controller.admit("neighbour", "/api/analyze-image")
+
+
+def test_over_concurrency_limit_gets_503_until_released():
+    controller = AdmissionController(rate=100, burst=100, max_concurrent=2)
+    assert controller.admit("a", "/api/weather") and controller.admit("b", "/api/weather")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit("c", "/api/weather")
+    assert rejected.value.status == 503
+    controller.release()
+    assert controller.admit("c", "/api/weather")
+    assert controller.stats()["in_flight"] == 2
+
+
+def test_slow_upstream_only_sheds_requests_that_need_it(monkeypatch):
+    controller = AdmissionController(rate=100, burst=100, max_concurrent=10, slow_concurrent=1)
+    monkeypatch.setattr(upstream("gemini"), "recent_latency", lambda: upstream("gemini").timeout)
+    assert controller.admit("a", "/api/chat")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit("b", "/api/chat")
+    assert rejected.value.status == 503
+    assert controller.admit("b", "/api/weather")
+
+
+def test_unclassified_paths_are_not_counted():
+    controller = AdmissionController(max_concurrent=0)
+    assert controller.admit("a", "/api/metrics") is False
+
+
+@pytest.mark.parametrize("rate, burst", [(0, 30), (10, 0), (-1, 30)])
+def test_non_positive_rate_or_burst_is_refused(rate, burst):
+    with pytest.raises(ValueError):
+        AdmissionController(rate=rate, burst=burst)
+
+
+def test_client_id_ignores_forwarded_for_unless_trusted():
+    assert client_id("10.0.0.1", "1.2.3.4, 10.0.0.1") == "10.0.0.1"
+    assert client_id(None) == "unknown"
@@ -0,0 +1,72 @@
+import io
+import math
+import struct
+import wave
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("av")
+
+import audio_preprocess as ap
+
+ap._load_codecs()
+
+
+def _wav(segments, rate=16000, channels=1) -> bytes:
+    """WAV of (seconds, voiced) segments: a 440 Hz tone or digital silence."""
+    frames = bytearray()
+    for seconds, voiced in segments:
+        for i in range(int(seconds * rate)):
+            value = int(8000 * math.sin(2 * math.pi * 440 * i / rate)) if voiced else 0
+            frames += struct.pack("<h", value) * channels
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def test_decode_downmixes_and_resamples_to_16k():
+    samples = ap.decode_audio(_wav([(1.0, True)], rate=44100, channels=2))
+    assert samples.dtype == ap.np.float32
+    assert abs(len(samples) - ap.TARGET_RATE) < 200
+    assert 0.2 < float(abs(samples).max()) <= 1.0
+
+
+def test_trim_silence_keeps_speech_plus_padding():
+    samples = ap.decode_audio(_wav([(1.0, False), (2.0, True), (1.0, False)]))
+    trimmed = ap.trim_silence(samples)
+    seconds = len(trimmed) / ap.TARGET_RATE
+    assert 2.0 <= seconds <= 2.0 + 2 * ap.VAD_PADDING_MS / 1000 + 0.1
+    assert len(ap.trim_silence(ap.np.zeros(ap.TARGET_RATE, dtype=ap.np.float32))) == 0
+
+
+def test_preprocess_shrinks_a_padded_recording():
+    audio = _wav([(2.0, False), (2.0, True), (2.0, False)])
+    uploads, info = ap.preprocess_audio(audio)
+    assert info["preprocessed"] and info["chunks"] == 1 and len(uploads) == 1
+    assert info["output_bytes"] < len(audio) / 4
+    assert info["speech_seconds"] < info["input_seconds"]
+
+
+def test_silent_recording_needs_no_upload():
+    uploads, info = ap.preprocess_audio(_wav([(2.0, False)]))
+    assert uploads == [] and info["chunks"] == 0
+
+
+def test_undecodable_or_disabled_input_is_passed_through(monkeypatch):
+    assert ap.preprocess_audio(b"not audio", "clip.webm")[0] == [("clip.webm", b"not audio")]
+    monkeypatch.setattr(ap, "AUDIO_PREPROCESS_ENABLED", False)
+    audio = _wav([(1.0, True)])
+    uploads, info = ap.preprocess_audio(audio)
+    assert uploads == [("audio.wav", audio)] and not info["preprocessed"]
+
+
+def test_flac_round_trip_is_lossless_at_16_bits():
+    samples = ap.decode_audio(_wav([(0.5, True)]))
+    decoded = ap.decode_audio(ap.encode_flac(samples))
+    assert len(decoded) == len(samples)
+    assert float(abs(decoded - samples).max()) < 1e-4
@@ -0,0 +1,62 @@
+import cache_utils
+from cache_utils import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used_past_max_items():
+    cache = LRUCache(max_items=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")                          # "b" is now the oldest
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_evicts_past_byte_budget_and_skips_oversized_values():
+    cache = LRUCache(max_items=100, max_bytes=10)
+    cache.set("a", b"x" * 6)
+    cache.set("b", b"y" * 6)
+    assert "a" not in cache and cache.total_bytes == 6
+    cache.set("huge", b"z" * 11)
+    assert "huge" not in cache and cache.get("b") == b"y" * 6
+
+
+def test_replacing_a_key_updates_its_size():
+    cache = LRUCache(max_bytes=100)
+    cache.set("a", b"x" * 40)
+    cache.set("a", b"x" * 10)
+    assert cache.total_bytes == 10 and len(cache) == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_utils.time, "monotonic", clock)
+    cache = LRUCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    clock.now += 30
+    cache.set("b", 3)                       # re-setting restarts its TTL
+    clock.now += 31
+    assert cache.get("a") is None
+    assert "a" not in cache and len(cache) == 1
+    assert cache.get("b") == 3
+    clock.now += 61
+    assert cache.purge_expired() == 1 and len(cache) == 0
+
+
+def test_stats_count_hits_and_misses():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import universal_stt
+from universal_stt import stitch_transcripts
+
+
+def test_stitch_drops_words_repeated_at_the_boundary():
+    parts = ["Apply neem oil every week on the", "on the leaves, and water early.", "Water early. Then rest."]
+    assert stitch_transcripts(parts) == "Apply neem oil every week on the leaves, and water early. Then rest."
+
+
+def test_stitch_keeps_parts_that_do_not_overlap():
+    assert stitch_transcripts(["yellow leaves", "on tomato"]) == "yellow leaves on tomato"
+    assert stitch_transcripts(["only part"]) == "only part"
+    assert stitch_transcripts([]) == ""
+
+
+def test_chunks_are_transcribed_concurrently_and_stitched_in_order(monkeypatch):
+    uploads = [("chunk0.flac", b"0"), ("chunk1.flac", b"1"), ("chunk2.flac", b"2")]
+    texts = {b"0": "farmers should sow", b"1": "should sow wheat in", b"2": "in November."}
+    monkeypatch.setattr(universal_stt, "_prepare_uploads", lambda audio: uploads)
+
+    def transcribe(upload, lang):
+        # Later chunks finish first
+        time.sleep(0.05 * (2 - int(upload[1])))
+        return texts[upload[1]]
+
+    monkeypatch.setattr(universal_stt, "_transcribe_upload", transcribe)
+    result = universal_stt.transcribe_audio_groq(b"long recording", "en")
+    assert result == {"original_text": "farmers should sow wheat in November.", "language_used": "en"}
+
+
+def test_silent_recording_skips_whisper(monkeypatch):
+    monkeypatch.setattr(universal_stt, "_prepare_uploads", lambda audio: [])
+    monkeypatch.setattr(universal_stt, "_transcribe_upload", pytest.fail)
+    assert universal_stt.transcribe_audio_groq(b"silence", "hi") == {"original_text": "", "language_used": "hi"}
+
+
+def test_split_cuts_long_audio_in_a_pause_with_overlap():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("av")
+    import audio_preprocess as ap
+    ap._load_codecs()
+
+    rate = ap.TARGET_RATE
+    tone = lambda seconds: 0.3 * np.sin(2 * np.pi * 440 * np.arange(int(seconds * rate)) / rate)
+    samples = np.concatenate([tone(8), np.zeros(rate // 2), tone(6.5)]).astype(np.float32)
+
+    ranges = ap.split_at_silence(samples, rate, max_seconds=10, overlap_seconds=1)
+    assert len(ranges) == 2
+    (first_start, cut), (second_start, end) = ranges
+    assert first_start == 0 and end == len(samples)
+    assert 8 * rate <= cut <= 8.5 * rate
+    assert second_start == cut - rate
+    assert ap.split_at_silence(samples[: 5 * rate], rate, max_seconds=10) == [(0, 5 * rate)]
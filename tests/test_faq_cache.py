@@ -0,0 +1,58 @@
+import faq_cache as faq
+from faq_cache import FAQCache, jaccard, question_terms, weather_bucket
+
+GUNTUR = ("Local weather for Guntur: clear sky, 31°C, humidity 50%, wind 5 km/h. "
+          "Soil moisture hint: moderate. Action: conditions look stable, follow your regular schedule.")
+
+
+def test_reworded_question_gets_the_cached_answer():
+    cache = FAQCache()
+    cache.store("How to control aphids on cotton plants?", None, "Spray neem oil.")
+    assert cache.lookup("how can I control aphids on my cotton plants") == "Spray neem oil."
+    assert cache.lookup("How to control aphids on cotton plants organically?") == "Spray neem oil."
+    assert cache.lookup("When should I sow cotton?") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_answers_are_not_shared_across_weather_or_location():
+    cache = FAQCache()
+    cache.store("Should I irrigate my paddy today?", GUNTUR, "Yes, lightly in Guntur.")
+    assert cache.lookup("Should I irrigate my paddy today?", GUNTUR.replace("31°C", "30°C")) is not None
+    assert cache.lookup("Should I irrigate my paddy today?", GUNTUR.replace("Guntur", "Nagpur")) is None
+    assert cache.lookup("Should I irrigate my paddy today?", None) is None
+    hot = GUNTUR.replace("conditions look stable, follow your regular schedule", "heat stress likely")
+    assert cache.lookup("Should I irrigate my paddy today?", hot) is None
+
+
+def test_weather_bucket():
+    assert weather_bucket(None) == "none"
+    assert weather_bucket(GUNTUR) == weather_bucket(GUNTUR.replace("humidity 50%", "humidity 52%"))
+    assert weather_bucket(GUNTUR) != weather_bucket(GUNTUR.replace("Guntur", "Nagpur"))
+    assert weather_bucket("free text") == weather_bucket("  FREE   text. ")
+
+
+def test_follow_ups_bypass_the_cache_and_are_not_stored():
+    cache = FAQCache()
+    cache.store("How to control aphids on cotton?", None, "Spray neem oil.")
+    assert cache.lookup("What about for chilli?", has_history=True) is None
+    assert cache.stats()["bypassed"] == 1
+    cache.store("Which fertilizer suits groundnut?", None, "Gypsum.", has_history=True)
+    assert cache.lookup("Which fertilizer suits groundnut?") is None
+
+
+def test_entries_expire_and_oldest_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(faq.time, "monotonic", lambda: now[0])
+    cache = FAQCache(max_items=2, ttl=60)
+    cache.store("aphids on cotton leaves", None, "one")
+    cache.store("urea dose for paddy", None, "two")
+    cache.store("spacing for chilli seedlings", None, "three")
+    assert cache.lookup("aphids on cotton leaves") is None
+    assert cache.stats()["evictions"] == 1
+    now[0] += 61
+    assert cache.lookup("urea dose for paddy") is None
+
+
+def test_question_terms_and_jaccard():
+    assert question_terms("How do I control Aphids?") == question_terms("how to control aphid")
+    assert jaccard(frozenset("ab"), frozenset("bc")) == 1 / 3
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+import weather_service as ws
+from cache_utils import LRUCache
+from resilience import UpstreamUnavailable
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fresh caches and fake OpenWeather fetchers that record (kind, cell) calls."""
+    calls = []
+    monkeypatch.setattr(ws, "OPENWEATHER_API_KEY", "test-key")
+    monkeypatch.setattr(ws, "weather_cache", LRUCache(max_items=100))
+    monkeypatch.setattr(ws, "forecast_cache", LRUCache(max_items=100))
+
+    def current(key, params):
+        calls.append(("current", key))
+        summary = {"context": f"Weather for {key}", "details": {"temp": 30}}
+        ws.weather_cache.set(key, summary)
+        return summary
+
+    def forecast(key, params):
+        calls.append(("forecast", key))
+        ws.forecast_cache.set(key, [{"date": "2026-10-18"}])
+        return ws.forecast_cache.get(key)
+
+    monkeypatch.setattr(ws, "_fetch_and_store", current)
+    monkeypatch.setattr(ws, "_fetch_forecast_and_store", forecast)
+    return calls
+
+
+@pytest.fixture
+def prefetcher(upstream):
+    """A prefetcher whose scheduler is driven by hand."""
+    prefetcher = ws.FarmPrefetcher(rate=100, workers=2, max_farms=3)
+    prefetcher._ensure_started = lambda: None
+    return prefetcher
+
+
+def _refresh_due(prefetcher):
+    key, kind, params = prefetcher._next_due()
+    prefetcher._slots.acquire()
+    prefetcher._refresh(key, kind, params)
+    return key, kind
+
+
+def test_neighbouring_farms_share_one_cell(prefetcher):
+    prefetcher.register("a", lat="17.3850", lon="78.4867")
+    prefetcher.register("b", lat="17.3860", lon="78.4870")
+    prefetcher.register("c", city="Pune")
+    assert prefetcher.stats() == {"farms": 3, "cells": 2}
+    assert len(prefetcher._queue) == 4                      # current + forecast per cell
+    with pytest.raises(ws.WeatherServiceError):
+        prefetcher.register("d", city="Nagpur")
+    prefetcher.register("c", city="Nagpur")                 # moving a farm is not a new one
+    assert prefetcher.stats() == {"farms": 3, "cells": 2}
+
+
+def test_refresh_reschedules_before_the_cache_expires(prefetcher, upstream):
+    prefetcher.register("a", city="Pune")
+    before = time.monotonic()
+    assert [_refresh_due(prefetcher) for _ in range(2)] == [(("city", "pune"), "current"),
+                                                          (("city", "pune"), "forecast")]
+    due = prefetcher._cells[("city", "pune")]["due"]
+    assert due["current"] - before == pytest.approx(ws.WEATHER_CACHE_TTL * ws._REFRESH_AT, abs=1)
+    assert due["forecast"] - before == pytest.approx(ws.WEATHER_FORECAST_TTL * ws._REFRESH_AT, abs=1)
+    assert upstream == [("current", ("city", "pune")), ("forecast", ("city", "pune"))]
+
+
+def test_failed_refresh_waits_out_the_breaker(prefetcher, monkeypatch):
+    def unavailable(key, params):
+        raise UpstreamUnavailable("circuit open", retry_after=300)
+
+    monkeypatch.setattr(ws, "_fetch_and_store", unavailable)
+    prefetcher.register("a", city="Pune")
+    before = time.monotonic()
+    _refresh_due(prefetcher)
+    assert prefetcher._cells[("city", "pune")]["due"]["current"] - before == pytest.approx(300, abs=1)
+    assert "current" not in prefetcher._cells[("city", "pune")]["updated"]
+
+
+def test_unregistered_cells_are_skipped(prefetcher, upstream):
+    prefetcher.register("a", city="Pune")
+    prefetcher.register("b", city="Nagpur")
+    assert prefetcher.unregister("a") and not prefetcher.unregister("a")
+    assert {_refresh_due(prefetcher)[0] for _ in range(2)} == {("city", "nagpur")}
+    assert {entry[2] for entry in prefetcher._queue} == {("city", "nagpur")}    # only its next refreshes
+
+
+def test_bulk_read_reports_pending_then_ready(prefetcher):
+    prefetcher.register("a", city="Pune")
+    result = prefetcher.bulk_summaries(["a", "zzz"])
+    assert result == {"a": {"status": "pending"}, "zzz": {"status": "unknown"}}
+
+    _refresh_due(prefetcher)
+    _refresh_due(prefetcher)
+    ready = prefetcher.bulk_summaries(["a"])["a"]
+    assert ready["status"] == "ready" and ready["context"] == "Weather for ('city', 'pune')"
+    assert ready["forecast"] == [{"date": "2026-10-18"}] and ready["age_s"] >= 0
+
+
+def test_bulk_read_moves_a_cold_cell_to_the_front(prefetcher, upstream):
+    prefetcher.register("a", city="Pune")
+    for _ in range(2):
+        _refresh_due(prefetcher)
+    prefetcher.register("b", city="Nagpur")
+    ws.weather_cache.pop(("city", "pune"))                 # evicted before its refresh came due
+
+    assert prefetcher.bulk_summaries(["a"])["a"] == {"status": "pending"}
+    refreshed = [_refresh_due(prefetcher) for _ in range(3)]
+    assert (("city", "pune"), "current") in refreshed
+
+
+def test_scheduler_thread_warms_registered_farms(upstream):
+    prefetcher = ws.FarmPrefetcher(rate=100, workers=2)
+    for n in range(5):
+        prefetcher.register(f"farm-{n}", city=f"Town {n}")
+    deadline = time.monotonic() + 5
+    while len(upstream) < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(upstream) == sorted((kind, ("city", f"town {n}"))
+                                      for n in range(5) for kind in ("current", "forecast"))
+    assert all(result["status"] == "ready"
+               for result in prefetcher.bulk_summaries([f"farm-{n}" for n in range(5)]).values())
+    assert any(thread.name == "weather-prefetch-scheduler" for thread in threading.enumerate())
@@ -0,0 +1,59 @@
+from email.utils import formatdate
+
+import pytest
+
+from http_cache import audio_url, body_etag, byte_range, conditional_status, is_audio_key, weather_headers, weather_max_age
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-5000", (900, 999)),         # end past the body is clamped
+    ("bytes=-100", (900, 999)),             # suffix range
+    ("bytes=-5000", (0, 999)),
+    ("bytes=1000-", "unsatisfiable"),
+    ("bytes=500-400", "unsatisfiable"),
+    ("bytes=-0", "unsatisfiable"),
+    ("bytes=0-10,20-30", None),             # multi-range: whole body
+    ("items=0-10", None),
+    ("bytes=-", None),
+])
+def test_byte_range(header, expected):
+    assert byte_range(header, 1000) == expected
+
+
+def test_conditional_status_matches_etags():
+    assert conditional_status({"if-none-match": '"abc"'}, "abc") == 304
+    assert conditional_status({"if-none-match": 'W/"abc", "def"'}, "abc") == 304
+    assert conditional_status({"if-none-match": "*"}, "abc") == 304
+    assert conditional_status({"if-none-match": '"old"'}, "abc") is None
+    assert conditional_status({}, "abc") is None
+
+
+def test_conditional_status_uses_if_modified_since_only_without_etag():
+    fetched = 1_700_000_000
+    assert conditional_status({"if-modified-since": formatdate(fetched, usegmt=True)}, "abc", fetched) == 304
+    assert conditional_status({"if-modified-since": formatdate(fetched - 60, usegmt=True)}, "abc", fetched) is None
+    assert conditional_status({"if-modified-since": "not a date"}, "abc", fetched) is None
+    # If-None-Match wins when both are sent
+    assert conditional_status({"if-none-match": '"old"', "if-modified-since": formatdate(fetched, usegmt=True)},
+                              "abc", fetched) is None
+
+
+def test_weather_headers_follow_the_cache_ttl():
+    summary = {"fetched_at": 1_700_000_000}
+    headers = weather_headers(summary, ttl=600, etag="abc")
+    assert headers["ETag"] == '"abc"'
+    assert headers["Last-Modified"] == formatdate(1_700_000_000, usegmt=True)
+    assert weather_max_age(summary, ttl=600) == 0          # long expired
+    assert "Last-Modified" not in weather_headers({}, ttl=600, etag="abc")
+    assert weather_max_age({}, ttl=600) == 600
+
+
+def test_audio_keys_and_etags():
+    key = "a" * 64
+    assert is_audio_key(key) and audio_url(key) == f"/api/audio/{key}.mp3"
+    assert not is_audio_key("../etc/passwd") and not is_audio_key("A" * 64)
+    assert body_etag(b"x") == body_etag(b"x") != body_etag(b"y")
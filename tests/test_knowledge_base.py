@@ -0,0 +1,63 @@
+import knowledge_base as kb
+from knowledge_base import KnowledgeBase
+
+ENTRIES = [
+    {"crop": "cotton", "title": "Aphids on cotton", "keywords": ["aphid", "sticky leaves", "honeydew"],
+     "answer": "Spray neem oil on the underside of the leaves. Release ladybird beetles."},
+    {"crop": "cotton", "title": "Whitefly on cotton", "keywords": ["whitefly", "sooty mould"],
+     "answer": "Hang yellow sticky traps. Remove weeds that host whitefly."},
+    {"crop": "rice", "title": "Rice blast", "keywords": ["blast", "spindle spots", "neck rot"],
+     "answer": "Avoid excess nitrogen. Spray a Pseudomonas solution at tillering."},
+    {"crop": "wheat", "title": "Aphids on wheat", "keywords": ["aphid", "honeydew"],
+     "answer": "Aphids on wheat rarely need control. Encourage natural enemies."},
+    {"crop": "general", "title": "Making jeevamrut", "keywords": ["jeevamrut", "compost", "cow dung"],
+     "answer": "Mix cow dung, urine, jaggery and gram flour in water and ferment for a week."},
+]
+
+
+def test_search_ranks_the_matching_entry_first():
+    base = KnowledgeBase(ENTRIES)
+    (score, best), *rest = base.search("sticky honeydew on cotton", k=3)
+    assert best["title"] == "Aphids on cotton"
+    assert all(score >= other for other, _ in rest)
+    assert base.search("tractor loan interest") == []
+
+
+def test_specific_question_is_answered_directly():
+    base = KnowledgeBase(ENTRIES)
+    answer, notes = base.lookup("How do I control aphids on cotton?")
+    assert answer == ENTRIES[0]["answer"] and notes is None
+    assert base.stats()["direct_hits"] == 1
+
+
+def test_crop_aliases_count_as_naming_the_crop():
+    answer, _ = KnowledgeBase(ENTRIES).lookup("blast spindle spots on paddy")
+    assert answer == ENTRIES[2]["answer"]
+
+
+def test_question_without_its_crop_gets_reference_notes_only():
+    answer, notes = KnowledgeBase(ENTRIES).lookup("How do I control aphids and honeydew?")
+    assert answer is None
+    assert "- Aphids on" in notes
+
+
+def test_follow_ups_are_never_answered_directly():
+    answer, notes = KnowledgeBase(ENTRIES).lookup("and aphids on cotton?", has_history=True)
+    assert answer is None and notes
+
+
+def test_unrelated_question_is_a_miss():
+    base = KnowledgeBase(ENTRIES)
+    assert base.lookup("What is the price of a tractor?") == (None, None)
+    assert base.stats()["misses"] == 1
+    assert base.best_answer("What is the price of a tractor?") is None
+
+
+def test_missing_data_file_gives_an_empty_base(tmp_path):
+    base = KnowledgeBase.load(str(tmp_path / "missing.json"))
+    assert base.entries == [] and base.lookup("aphids on cotton") == (None, None)
+
+
+def test_shipped_data_answers_a_common_question():
+    answer, _ = KnowledgeBase.load(kb.KB_PATH).lookup("How to control aphids on cotton?")
+    assert answer
@@ -0,0 +1,71 @@
+import pytest
+
+from mp3_utils import _frame_length, audio_frames, join_mp3
+from tts_engine import split_segments
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz: 144 * 128000 / 44100 = 417 bytes (+1 with padding)
+MPEG1_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+MPEG1_PADDED = bytes([0xFF, 0xFB, 0x92, 0x00])
+# MPEG-2 Layer III, 64 kbit/s, 22.05 kHz (what gTTS produces): 72 * 64000 / 22050 = 208 bytes
+MPEG2_HEADER = bytes([0xFF, 0xF3, 0x80, 0x00])
+
+
+def _frame(header: bytes, fill: bytes = b"\x00", tag: bytes = b"") -> bytes:
+    length = _frame_length(header)
+    body = header + b"\x00" * 32 + tag
+    return body + fill * (length - len(body))
+
+
+def _id3v2(payload: bytes = b"\x00" * 20) -> bytes:
+    size = len(payload)
+    return b"ID3\x03\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + payload
+
+
+@pytest.mark.parametrize("header, length", [
+    (MPEG1_HEADER, 417),
+    (MPEG1_PADDED, 418),
+    (MPEG2_HEADER, 208),
+])
+def test_frame_length(header, length):
+    assert _frame_length(header) == length
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"ID3\x03",
+    bytes([0x00, 0xFB, 0x90, 0x00]),        # no frame sync
+    bytes([0xFF, 0xFD, 0x90, 0x00]),        # layer II
+    bytes([0xFF, 0xFB, 0xF0, 0x00]),        # bitrate index 15 ("bad")
+    bytes([0xFF, 0xFB, 0x9C, 0x00]),        # reserved sample rate
+    bytes([0xFF, 0xEB, 0x90, 0x00]),        # reserved MPEG version
+])
+def test_frame_length_rejects_non_frames(data):
+    assert _frame_length(data) == 0
+
+
+def test_audio_frames_strips_tags_and_xing_header():
+    frames = _frame(MPEG2_HEADER, b"\x01") + _frame(MPEG2_HEADER, b"\x02")
+    clip = _id3v2() + _frame(MPEG2_HEADER, tag=b"Xing") + frames + b"TAG" + b"\x00" * 125
+    assert audio_frames(clip) == frames
+
+
+def test_join_mp3_concatenates_frames_only():
+    first = _frame(MPEG2_HEADER, b"\x01")
+    second = _frame(MPEG2_HEADER, b"\x02")
+    clips = [_id3v2() + _frame(MPEG2_HEADER, tag=b"Info") + first,
+             _id3v2() + _frame(MPEG2_HEADER, tag=b"Info") + second]
+    joined = join_mp3(clips)
+    assert joined == first + second
+    assert b"ID3" not in joined and b"Info" not in joined
+
+
+def test_join_mp3_keeps_a_single_clip_and_non_mp3_data_as_is():
+    clip = _id3v2() + _frame(MPEG1_HEADER)
+    assert join_mp3([clip]) == clip
+    assert join_mp3([b"abc", b"def"]) == b"abcdef"
+
+
+def test_split_segments_packs_whole_sentences():
+    text = "One two. Three four five. Six.\nSeven eight"
+    assert split_segments(text, limit=20) == ["One two.", "Three four five.", "Six. Seven eight"]
+    assert split_segments("A very long sentence indeed.", limit=5) == ["A very long sentence indeed."]
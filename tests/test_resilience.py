@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, Upstream, UpstreamTimeout, is_upstream_failure
+
+
+def test_slow_upstream_does_not_starve_another():
+    gemini = Upstream("gemini", timeout=5, workers=2)
+    openweather = Upstream("openweather", timeout=0.5, workers=2)
+    release = threading.Event()
+    hung = [threading.Thread(target=gemini.call, args=(release.wait,)) for _ in range(4)]
+    for thread in hung:
+        thread.start()
+    try:
+        for _ in range(3):
+            assert openweather.call(lambda: "ok") == "ok"
+        assert openweather.breaker.state == "closed"
+    finally:
+        release.set()
+        for thread in hung:
+            thread.join()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_then_probes_once(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        assert not breaker.record_failure()
+    assert breaker.allow() and breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_after() == 30
+
+    clock.now += 30
+    assert breaker.allow()                  # the single half-open probe
+    assert breaker.state == "half_open" and not breaker.allow()
+    assert breaker.record_failure()         # a failed probe opens it again at once
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_released_probe_lets_another_request_probe(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def _fail(exc):
+    raise exc
+
+
+def test_only_upstream_faults_open_the_circuit():
+    service = Upstream("test", timeout=1, workers=2)
+    service.breaker.failure_threshold = 2
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            service.call(_fail, ValueError("unknown city"))
+    assert service.breaker.state == "closed"
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            service.call(_fail, ConnectionError("refused"))
+    with pytest.raises(CircuitOpenError):
+        service.call(lambda: "ok")
+
+
+def test_call_times_out_at_the_deadline():
+    service = Upstream("test", timeout=0.05, workers=2)
+    with pytest.raises(UpstreamTimeout):
+        service.call(time.sleep, 0.5)
+    assert service.breaker.failures == 1
+
+
+def test_slow_first_attempt_is_hedged():
+    service = Upstream("test", timeout=2, hedge_initial_delay=0.05, workers=2)
+    attempts = []
+
+    def fetch():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    assert service.call(fetch) == "hedge"
+    assert len(attempts) == 2
+
+
+def test_fast_attempt_is_not_hedged():
+    service = Upstream("test", timeout=2, hedge_initial_delay=0.5, workers=2)
+    attempts = []
+    assert service.call(lambda: attempts.append(1) or "ok") == "ok"
+    assert len(attempts) == 1
+
+
+def test_async_call_hedges_and_times_out():
+    service = Upstream("test", timeout=0.3, hedge_initial_delay=0.05, workers=2)
+    attempts = []
+
+    async def fetch(delay_first):
+        attempts.append(1)
+        await asyncio.sleep(delay_first if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    assert asyncio.run(service.call_async(fetch, 1.0)) == 2
+    with pytest.raises(UpstreamTimeout):
+        asyncio.run(Upstream("test", timeout=0.05).call_async(asyncio.sleep, 1))
+
+
+class _HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.response = type("Response", (), {"status_code": status})()
+
+
+class APIConnectionError(Exception):
+    """Stands in for the Groq SDK's connection error (matched by class name)."""
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (UpstreamTimeout("slow"), True),
+    (_HTTPError(503), True),
+    (_HTTPError(429), True),
+    (_HTTPError(400), False),
+    (_HTTPError(404), False),
+    (APIConnectionError(), True),
+    (ValueError("bad input"), False),
+])
+def test_is_upstream_failure(exc, expected):
+    assert is_upstream_failure(exc) is expected
+
+
+def test_is_upstream_failure_follows_the_cause():
+    try:
+        try:
+            raise ConnectionError("reset")
+        except ConnectionError as cause:
+            raise RuntimeError("gTTS failed") from cause
+    except RuntimeError as wrapped:
+        assert is_upstream_failure(wrapped)
+    assert not is_upstream_failure(RuntimeError("gTTS failed"))
@@ -0,0 +1,72 @@
+import session_store
+from session_store import SessionStore
+
+
+def _exchange(store, session, n, answer_words=10):
+    store.append_turn(session, f"Question {n} about wheat rust?", f"Answer {n}. " + "spray " * answer_words)
+
+
+def test_anonymous_requests_have_no_history():
+    store = SessionStore()
+    store.append_turn(None, "hi", "hello")
+    assert store.get_history(None) == [] and store.get_history("unknown") == []
+
+
+def test_old_exchanges_fold_into_a_summary_after_max_turns():
+    store = SessionStore(max_turns=2, token_budget=10**6)
+    for n in range(4):
+        _exchange(store, "s", n)
+
+    history = store.get_history("s")
+    summary, ack, *turns = history
+    assert [turn["role"] for turn in history] == ["user", "model"] * 3
+    assert summary["parts"][0].startswith(session_store._SUMMARY_INTRO)
+    assert "Farmer asked: Question 0" in summary["parts"][0] and "Question 1" in summary["parts"][0]
+    assert ack["parts"] == [session_store._SUMMARY_ACK]
+    assert [turn["parts"][0] for turn in turns[::2]] == ["Question 2 about wheat rust?", "Question 3 about wheat rust?"]
+
+
+def test_history_stays_within_the_token_budget(monkeypatch):
+    monkeypatch.setattr(session_store, "_chars_per_token", 4.0)
+    monkeypatch.setattr(session_store, "CHAT_SUMMARY_CHARS", 400)
+    store = SessionStore(max_turns=100, token_budget=300)
+    for n in range(30):
+        _exchange(store, "s", n, answer_words=30)
+        chars = session_store.history_chars(store.get_history("s"))
+        assert session_store.estimate_tokens(chars) <= 300
+    assert len(store.get_history("s")) < 2 * 30
+
+
+def test_newest_exchange_is_kept_verbatim_even_over_budget():
+    store = SessionStore(token_budget=10)
+    _exchange(store, "s", 0, answer_words=200)
+    _exchange(store, "s", 1, answer_words=200)
+    history = store.get_history("s")
+    assert history[-2]["parts"] == ["Question 1 about wheat rust?"]
+    assert "Question 0" in history[0]["parts"][0]
+
+
+def test_summary_drops_its_oldest_lines(monkeypatch):
+    monkeypatch.setattr(session_store, "CHAT_SUMMARY_CHARS", 200)
+    store = SessionStore(max_turns=1, token_budget=10**6)
+    for n in range(10):
+        _exchange(store, "s", n)
+    summary = store.get_history("s")[0]["parts"][0].removeprefix(session_store._SUMMARY_INTRO)
+    assert len(summary) <= 200
+    assert "Question 8" in summary and "Question 0 " not in summary
+
+
+def test_token_estimate_follows_measured_usage(monkeypatch):
+    monkeypatch.setattr(session_store, "_chars_per_token", 4.0)
+    for _ in range(100):
+        session_store.record_prompt_tokens(3000, 1000)
+    assert session_store.estimate_tokens(3000) in (1000, 1001, 1002)
+    session_store.record_prompt_tokens(0, 10)
+    assert abs(session_store._chars_per_token - 3.0) < 0.01
+
+
+def test_reset_forgets_the_session():
+    store = SessionStore()
+    _exchange(store, "s", 0)
+    store.reset("s")
+    assert store.get_history("s") == []
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SINGLEFLIGHT_CALLS, AsyncSingleFlight, SingleFlight
+
+
+def _run_concurrently(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _wait_for_followers(group: str, count: int):
+    """Block until count callers are waiting on the group's leader."""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if sum(value for _, labels, value in SINGLEFLIGHT_CALLS.samples()
+               if labels == {"group": group, "role": "follower"}) >= count:
+            return
+        time.sleep(0.001)
+    raise AssertionError(f"{count} followers never joined {group}")
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight("test-share")
+    release = threading.Event()
+    calls, results = [], []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "sunny"
+
+    threads = _run_concurrently(5, lambda: results.append(flights.do("cell", fetch)))
+    _wait_for_followers("test-share", 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["sunny"] * 5
+    assert flights.in_flight() == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight("test-error")
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream said no")
+
+    def call():
+        try:
+            flights.do("cell", fail)
+        except ValueError as exc:
+            errors.append(str(exc))
+
+    threads = _run_concurrently(3, call)
+    _wait_for_followers("test-error", 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ["upstream said no"] * 3
+
+
+def test_a_finished_call_is_not_reused():
+    flights = SingleFlight("test")
+    values = iter([1, 2])
+    assert flights.do("k", lambda: next(values)) == 1
+    assert flights.do("k", lambda: next(values)) == 2
+
+
+def test_async_callers_share_one_call_and_its_error():
+    flights = AsyncSingleFlight("test")
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "bad":
+            raise ValueError(value)
+        return value
+
+    async def main():
+        shared = await asyncio.gather(*(flights.do("a", fetch, "ok") for _ in range(4)))
+        failed = await asyncio.gather(*(flights.do("b", fetch, "bad") for _ in range(2)), return_exceptions=True)
+        return shared, failed
+
+    shared, failed = asyncio.run(main())
+    assert shared == ["ok"] * 4
+    assert all(isinstance(error, ValueError) for error in failed)
+    assert calls == ["ok", "bad"]
+    assert flights.in_flight() == 0
+
+
+def test_async_cancelled_caller_does_not_cancel_the_shared_call():
+    flights = AsyncSingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do("k", fetch))
+        second = asyncio.ensure_future(flights.do("k", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
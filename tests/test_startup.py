@@ -0,0 +1,30 @@
+"""
+Startup budget: importing either server must stay fast and must not load any
+upstream SDK (they load on first use, see backend/providers.py).
+Measured with the same probe as scripts/check_startup.py.
+"""
+import importlib.util
+import os
+
+import pytest
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "check_startup.py")
+_spec = importlib.util.spec_from_file_location("check_startup", _SCRIPT)
+check_startup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(check_startup)
+
+
+@pytest.mark.parametrize("module", ["backend_api", "backend_asgi"])
+def test_server_import_within_budget(module):
+    runs = [check_startup.measure(module) for _ in range(check_startup.STARTUP_RUNS)]
+    best_ms = min(ms for ms, _ in runs)
+    assert best_ms <= check_startup.STARTUP_BUDGET_MS, (
+        f"import {module} took {best_ms:.0f} ms, budget is {check_startup.STARTUP_BUDGET_MS:.0f} ms"
+    )
+
+
+@pytest.mark.parametrize("module", ["backend_api", "backend_asgi"])
+def test_server_import_defers_upstream_sdks(module):
+    # measure() reports which of check_startup.HEAVY_MODULES the import pulled in
+    _, loaded = check_startup.measure(module)
+    assert not loaded, f"{module} eagerly imports {sorted(loaded)}"
@@ -0,0 +1,87 @@
+import pytest
+
+import tts_engine
+from cache_utils import LRUCache
+from resilience import UpstreamUnavailable
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Records every batch sent upstream; 'translates' by upper-casing."""
+    sent = []
+
+    def translate_batch(sentences, target):
+        sent.append(list(sentences))
+        return [f"{target}:{s.upper()}" for s in sentences]
+
+    monkeypatch.setattr(tts_engine, "translation_cache", LRUCache(max_items=100))
+    monkeypatch.setattr(tts_engine, "_translate_batch", translate_batch)
+    return sent
+
+
+def test_unseen_sentences_go_upstream_in_one_batch(batches):
+    text, lang = tts_engine.translate_text("Water early. Use mulch.\nCheck leaves. Water early.", "hi")
+    assert lang == "hi"
+    assert text == "hi:WATER EARLY. hi:USE MULCH.\nhi:CHECK LEAVES. hi:WATER EARLY."
+    assert batches == [["Water early.", "Use mulch.", "Check leaves."]]
+
+
+def test_sentences_are_memoized_per_language(batches):
+    tts_engine.translate_text("Water early. Use mulch.", "hi")
+    tts_engine.translate_text("Use mulch. Spray neem", "hi")
+    tts_engine.translate_text("Use mulch.", "te")
+    assert batches == [["Water early.", "Use mulch."], ["Spray neem"], ["Use mulch."]]
+    tts_engine.translate_text("Water early. Use mulch.", "HI")
+    assert len(batches) == 3
+
+
+def test_english_and_unknown_targets_are_not_translated(batches):
+    assert tts_engine.translate_text("Water early.", "en") == ("Water early.", "en")
+    assert tts_engine.translate_text("Water early.", "xx") == ("Water early.", "en")
+    assert batches == []
+
+
+def test_failure_falls_back_to_english(monkeypatch):
+    def unavailable(sentences, target):
+        raise UpstreamUnavailable("translate is down")
+
+    monkeypatch.setattr(tts_engine, "translation_cache", LRUCache(max_items=100))
+    monkeypatch.setattr(tts_engine, "_translate_batch", unavailable)
+    assert tts_engine.translate_text("Water early.", "hi") == ("Water early.", "en")
+
+
+def test_batch_is_split_back_into_sentences(monkeypatch):
+    calls = []
+
+    def translate_one(text, target):
+        calls.append(text)
+        return text.upper()
+
+    monkeypatch.setattr(tts_engine, "_translate_one", translate_one)
+    assert tts_engine._translate_batch(["a.", "b.", "c."], "hi") == ["A.", "B.", "C."]
+    assert calls == ["a.\nb.\nc."]
+
+
+def test_batch_falls_back_to_one_by_one_when_lines_merge(monkeypatch):
+    calls = []
+
+    def translate_one(text, target):
+        calls.append(text)
+        return text.replace("\n", " ").upper()
+
+    monkeypatch.setattr(tts_engine, "_translate_one", translate_one)
+    assert tts_engine._translate_batch(["a.", "b."], "hi") == ["A.", "B."]
+    assert calls == ["a.\nb.", "a.", "b."]
+
+
+def test_long_input_is_split_under_the_request_limit(monkeypatch):
+    calls = []
+
+    def translate_one(text, target):
+        calls.append(text)
+        return text
+
+    monkeypatch.setattr(tts_engine, "_translate_one", translate_one)
+    sentences = [f"{n} " + "x" * 998 + "." for n in range(10)]
+    assert tts_engine._translate_batch(sentences, "hi") == sentences
+    assert len(calls) == 3 and all(len(call) <= tts_engine._MAX_BATCH_CHARS for call in calls)
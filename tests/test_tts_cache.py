@@ -0,0 +1,51 @@
+import os
+
+from tts_cache import AudioCache, cache_key, key_from_path
+
+
+def test_cache_key_is_content_addressed():
+    assert cache_key("Hello ", "hi") == cache_key("Hello", "hi")
+    assert cache_key("Hello", "hi") != cache_key("Hello", "te")
+    assert cache_key("Hello", "hi") != cache_key("Hello", "hi", slow=True)
+    assert len(cache_key("Hello", "hi")) == 64
+
+
+def test_disk_directory_is_created_on_first_use(tmp_path):
+    cache_dir = str(tmp_path / "tts")
+    cache = AudioCache(cache_dir=cache_dir)
+    assert not os.path.exists(cache_dir)
+    assert cache.get("missing") is None
+    assert os.path.isdir(cache_dir)
+
+
+def test_clips_fall_back_to_disk_after_memory_eviction(tmp_path):
+    cache = AudioCache(cache_dir=str(tmp_path), memory_bytes=10, disk_bytes=1000)
+    cache.put("a", b"a" * 8)
+    cache.put("b", b"b" * 8)                # pushes "a" out of memory
+    assert cache.get("a") == b"a" * 8
+    assert cache.stats()["disk_hits"] == 1
+    assert key_from_path(cache.path_for("a")) == "a"
+
+
+def test_disk_tier_evicts_least_recently_used_files(tmp_path):
+    cache = AudioCache(cache_dir=str(tmp_path), memory_bytes=0, disk_bytes=25)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    cache.get("a")                          # "b" becomes the oldest
+    cache.put("c", b"c" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "c.mp3"]
+    assert cache.get("b") is None
+    assert cache.stats()["disk_bytes"] == 20
+
+
+def test_disk_index_survives_a_restart(tmp_path):
+    AudioCache(cache_dir=str(tmp_path)).put("a", b"clip")
+    restarted = AudioCache(cache_dir=str(tmp_path))
+    assert restarted.get("a") == b"clip"
+
+
+def test_remembers_sources_of_clips(tmp_path):
+    cache = AudioCache(cache_dir=str(tmp_path))
+    cache.remember_source("k", "Namaste", "hi")
+    assert cache.source_of("k") == ("Namaste", "hi")
+    assert cache.source_of("unknown") is None